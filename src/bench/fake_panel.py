@@ -0,0 +1,419 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+
+from aiohttp import web
+
+REALITY_STREAM_SETTINGS = {
+    "network": "tcp",
+    "security": "reality",
+    "externalProxy": [],
+    "realitySettings": {
+        "show": False,
+        "xver": 0,
+        "dest": "google.com:443",
+        "serverNames": ["www.google.com"],
+        "privateKey": "GAiJD7L8ADep2NVcQPiuZc9l_ZxXTSCXmpVzPM6CdH8",
+        "minClient": "",
+        "maxClient": "",
+        "maxTimediff": 0,
+        "shortIds": ["33cf5dbed8e1", "60571c"],
+        "settings": {
+            "publicKey": "9WIrle9cM-dmkxvaYJEeytOnkHJCYoHojVQi-zg3_DI",
+            "fingerprint": "firefox",
+            "serverName": "",
+            "spiderX": "/",
+        },
+    },
+    "tcpSettings": {"acceptProxyProtocol": False, "header": {"type": "none"}},
+}
+SNIFFING = {
+    "enabled": True,
+    "destOverride": ["http", "tls", "quic", "fakedns"],
+    "metadataOnly": False,
+    "routeOnly": False,
+}
+
+
+class FakeXuiPanel:
+    """
+    An in-memory stand-in for the 3x-ui HTTP API used by `py3xui.AsyncApi`.
+
+    Covers login, inbound list/get/add/update/delete and client
+    add/update/delete/get_by_email with the same JSON shapes as the panel.
+    Every request can be delayed (`latency_sec` plus `jitter_sec`) and
+    failed with a 500 (`error_rate`), `down = True` answers 503 to
+    everything. Requests are counted per endpoint in `calls`.
+    """
+
+    COOKIE_NAME = "3x-ui"
+
+    def __init__(
+        self,
+        username: str = "admin",
+        password: str = "admin",
+        latency_sec: float = 0.0,
+        jitter_sec: float = 0.0,
+        error_rate: float = 0.0,
+    ):
+        """
+        Initialize the FakeXuiPanel.
+
+        Args:
+            username (str): The panel username (default: 'admin').
+            password (str): The panel password (default: 'admin').
+            latency_sec (float): Delay of every request (default: 0).
+            jitter_sec (float): Max random extra delay (default: 0).
+            error_rate (float): Share of requests failed with a 500
+                (default: 0).
+        """
+        self.username = username
+        self.password = password
+        self.latency_sec = latency_sec
+        self.jitter_sec = jitter_sec
+        self.error_rate = error_rate
+        self.down = False
+
+        self.inbounds: dict[int, dict] = {}
+        self.emails: dict[str, int] = {}
+        self.calls = Counter()
+        self._sessions: set[str] = set()
+        self._next_inbound_id = 1
+        self._next_traffic_id = 1
+        self._list_body: bytes = None
+        self._runner: web.AppRunner = None
+
+        self.app = web.Application(middlewares=[self._middleware])
+        self.app.add_routes(
+            [
+                web.post("/login", self._login),
+                web.get("/panel/api/inbounds/list", self._inbound_list),
+                web.get("/panel/api/inbounds/get/{id}", self._inbound_get),
+                web.post("/panel/api/inbounds/add", self._inbound_add),
+                web.post(
+                    "/panel/api/inbounds/update/{id}", self._inbound_update
+                ),
+                web.post("/panel/api/inbounds/del/{id}", self._inbound_del),
+                web.post("/panel/api/inbounds/addClient", self._client_add),
+                web.post(
+                    "/panel/api/inbounds/updateClient/{uuid}",
+                    self._client_update,
+                ),
+                web.post(
+                    "/panel/api/inbounds/{id}/delClient/{uuid}",
+                    self._client_del,
+                ),
+                web.get(
+                    "/panel/api/inbounds/getClientTraffics/{email}",
+                    self._client_traffic,
+                ),
+            ]
+        )
+
+    # Server:
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Start serving the panel API.
+
+        Args:
+            host (str): The host to bind (default: '127.0.0.1').
+            port (int): The port to bind, 0 for any free one (default: 0).
+
+        Returns:
+            str: The panel URL to use as `XUI_HOST`.
+        """
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @property
+    def requests(self) -> int:
+        return sum(self.calls.values())
+
+    # State:
+    def _make_traffic(self, inbound_id: int, client: dict) -> dict:
+        traffic = {
+            "id": self._next_traffic_id,
+            "inboundId": inbound_id,
+            "enable": client.get("enable", True),
+            "email": client["email"],
+            "up": 0,
+            "down": 0,
+            "expiryTime": client.get("expiryTime", 0),
+            "total": client.get("totalGB", 0),
+            "reset": client.get("reset", 0),
+        }
+        self._next_traffic_id += 1
+        return traffic
+
+    def _set_clients(self, inbound: dict, clients: list[dict]):
+        # Like the panel's updateClientTraffics: stats of new clients are
+        # added, the ones of removed clients deleted, the others untouched.
+        stats = {stat["email"]: stat for stat in inbound["clientStats"]}
+        for client in inbound["settings"]["clients"]:
+            self.emails.pop(client["email"], None)
+        inbound["settings"]["clients"] = clients
+        inbound["clientStats"] = []
+        for client in clients:
+            self.emails[client["email"]] = inbound["id"]
+            stat = stats.get(client["email"]) or self._make_traffic(
+                inbound["id"], client
+            )
+            inbound["clientStats"].append(stat)
+        self._list_body = None
+
+    def _put_inbound(self, data: dict, inbound_id: int = None) -> dict:
+        inbound_id = inbound_id or self._next_inbound_id
+        self._next_inbound_id = max(self._next_inbound_id, inbound_id + 1)
+        inbound = {
+            "id": inbound_id,
+            "up": 0,
+            "down": 0,
+            "total": data.get("total", 0),
+            "remark": data.get("remark", ""),
+            "enable": data.get("enable", True),
+            "expiryTime": data.get("expiryTime", 0),
+            "clientStats": [],
+            "listen": data.get("listen", ""),
+            "port": data["port"],
+            "protocol": data.get("protocol", "vless"),
+            "settings": {"clients": [], "decryption": "none", "fallbacks": []},
+            "streamSettings": data.get("streamSettings", ""),
+            "tag": f"inbound-{data['port']}",
+            "sniffing": data.get("sniffing", ""),
+        }
+        old = self.inbounds.get(inbound_id)
+        if old:
+            inbound["up"], inbound["down"] = old["up"], old["down"]
+            inbound["clientStats"] = old["clientStats"]
+            inbound["settings"]["clients"] = old["settings"]["clients"]
+        self.inbounds[inbound_id] = inbound
+
+        settings = data.get("settings") or {}
+        if isinstance(settings, str):
+            settings = json.loads(settings)
+        self._set_clients(inbound, settings.get("clients", []))
+        return inbound
+
+    def seed(
+        self,
+        n_clients: int,
+        clients_per_inbound: int = 2,
+        first_port: int = 4000,
+        expiry_days: int = 30,
+        first_tg_id: int = 100_000_000,
+    ) -> list[str]:
+        """
+        Fill the panel with per-user inbounds the way the bot creates them.
+
+        Args:
+            n_clients (int): The number of clients to create.
+            clients_per_inbound (int): Configs per user (default: 2).
+            first_port (int): The port of the first inbound (default: 4000).
+            expiry_days (int): Client expiry from now (default: 30).
+            first_tg_id (int): The first user id (default: 100000000).
+
+        Returns:
+            list[str]: Emails (config names) of the created clients.
+        """
+        expiry_time = int((time.time() + expiry_days * 86400) * 1000)
+        stream_settings = json.dumps(REALITY_STREAM_SETTINGS)
+        sniffing = json.dumps(SNIFFING)
+        emails = []
+        n_inbounds = -(-n_clients // clients_per_inbound)
+        for n in range(n_inbounds):
+            tg_id = first_tg_id + n
+            clients = []
+            for k in range(clients_per_inbound):
+                if len(emails) == n_clients:
+                    break
+                email = f"vless_{tg_id}_{k + 1}"
+                emails.append(email)
+                clients.append(
+                    {
+                        "id": str(uuid.uuid5(uuid.NAMESPACE_DNS, email)),
+                        "email": email,
+                        "enable": True,
+                        "flow": "xtls-rprx-vision",
+                        "expiryTime": expiry_time,
+                    }
+                )
+            self._put_inbound(
+                {
+                    "remark": str(tg_id),
+                    "port": first_port + n,
+                    "settings": {"clients": clients},
+                    "streamSettings": stream_settings,
+                    "sniffing": sniffing,
+                }
+            )
+        return emails
+
+    def add_traffic(self, email: str, up: int, down: int):
+        inbound = self.inbounds[self.emails[email]]
+        for stat in inbound["clientStats"]:
+            if stat["email"] == email:
+                stat["up"] += up
+                stat["down"] += down
+        inbound["up"] += up
+        inbound["down"] += down
+        self._list_body = None
+
+    # HTTP:
+    @staticmethod
+    def _ok(obj=None, msg: str = "") -> web.Response:
+        return web.json_response({"success": True, "msg": msg, "obj": obj})
+
+    @staticmethod
+    def _fail(msg: str) -> web.Response:
+        return web.json_response({"success": False, "msg": msg, "obj": None})
+
+    @staticmethod
+    def _wire(inbound: dict) -> dict:
+        return {**inbound, "settings": json.dumps(inbound["settings"])}
+
+    def _get_inbound(self, request: web.Request) -> dict:
+        return self.inbounds.get(int(request.match_info["id"]))
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        route = request.match_info.route.resource
+        self.calls[route.canonical if route else request.path] += 1
+
+        delay = self.latency_sec + random.uniform(0, self.jitter_sec)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.down:
+            return web.Response(status=503)
+        if self.error_rate and random.random() < self.error_rate:
+            return web.Response(status=500)
+        if (
+            request.path != "/login"
+            and request.cookies.get(self.COOKIE_NAME) not in self._sessions
+        ):
+            # Newer 3x-ui builds hide the API from anonymous users:
+            return web.Response(status=404)
+        return await handler(request)
+
+    async def _login(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        if (
+            data.get("username") != self.username
+            or data.get("password") != self.password
+        ):
+            return self._fail("Wrong username or password")
+        session = uuid.uuid4().hex
+        self._sessions.add(session)
+        response = self._ok(msg="Login Successfully")
+        response.set_cookie(self.COOKIE_NAME, session)
+        return response
+
+    async def _inbound_list(self, request: web.Request) -> web.Response:
+        if self._list_body is None:
+            self._list_body = json.dumps(
+                {
+                    "success": True,
+                    "msg": "",
+                    "obj": [self._wire(ib) for ib in self.inbounds.values()],
+                }
+            ).encode()
+        return web.Response(
+            body=self._list_body, content_type="application/json"
+        )
+
+    async def _inbound_get(self, request: web.Request) -> web.Response:
+        inbound = self._get_inbound(request)
+        if not inbound:
+            return self._fail("record not found")
+        return self._ok(self._wire(inbound))
+
+    async def _inbound_add(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        if any(ib["port"] == data["port"] for ib in self.inbounds.values()):
+            return self._fail(f"Port already exists: {data['port']}")
+        inbound = self._put_inbound(data)
+        return self._ok(self._wire(inbound), msg="Create Successfully")
+
+    async def _inbound_update(self, request: web.Request) -> web.Response:
+        inbound = self._get_inbound(request)
+        if not inbound:
+            return self._fail("record not found")
+        inbound = self._put_inbound(await request.json(), inbound["id"])
+        return self._ok(self._wire(inbound), msg="Update Successfully")
+
+    async def _inbound_del(self, request: web.Request) -> web.Response:
+        inbound = self._get_inbound(request)
+        if not inbound:
+            return self._fail("record not found")
+        self._set_clients(inbound, [])
+        del self.inbounds[inbound["id"]]
+        return self._ok(inbound["id"], msg="Delete Successfully")
+
+    async def _client_add(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        inbound = self.inbounds.get(int(data["id"]))
+        if not inbound:
+            return self._fail("record not found")
+        clients = json.loads(data["settings"])["clients"]
+        for client in clients:
+            if client["email"] in self.emails:
+                return self._fail(f"Duplicate email: {client['email']}")
+        self._set_clients(inbound, inbound["settings"]["clients"] + clients)
+        return self._ok(msg="Client(s) added Successfully")
+
+    async def _client_update(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        inbound = self.inbounds.get(int(data["id"]))
+        client_uuid = request.match_info["uuid"]
+        new_client = json.loads(data["settings"])["clients"][0]
+        clients = inbound["settings"]["clients"] if inbound else []
+        for idx, client in enumerate(clients):
+            if client["id"] == client_uuid:
+                clients = list(clients)
+                clients[idx] = {**client, **new_client}
+                # Only updateClient updates the stat of the client:
+                for stat in inbound["clientStats"]:
+                    if stat["email"] == client["email"]:
+                        stat["email"] = clients[idx]["email"]
+                        stat["enable"] = clients[idx].get("enable", True)
+                        stat["expiryTime"] = clients[idx].get("expiryTime", 0)
+                        stat["total"] = clients[idx].get("totalGB", 0)
+                        stat["reset"] = clients[idx].get("reset", 0)
+                self._set_clients(inbound, clients)
+                return self._ok(msg="Client updated Successfully")
+        return self._fail("empty client ID")
+
+    async def _client_del(self, request: web.Request) -> web.Response:
+        inbound = self._get_inbound(request)
+        if not inbound:
+            return self._fail("record not found")
+        client_uuid = request.match_info["uuid"]
+        clients = [
+            client
+            for client in inbound["settings"]["clients"]
+            if client["id"] != client_uuid
+        ]
+        if len(clients) == len(inbound["settings"]["clients"]):
+            return self._fail("Client Not Found")
+        self._set_clients(inbound, clients)
+        return self._ok(msg="Client deleted Successfully")
+
+    async def _client_traffic(self, request: web.Request) -> web.Response:
+        email = request.match_info["email"]
+        inbound = self.inbounds.get(self.emails.get(email))
+        if inbound:
+            for stat in inbound["clientStats"]:
+                if stat["email"] == email:
+                    return self._ok(stat)
+        return self._ok(None)
@@ -0,0 +1,263 @@
+"""
+Benchmark of closing payed orders on a database with many orders.
+
+Seeds a scratch schema of the bot database with users, configs and orders
+(one payed order per closed config, all the others closed), then closes
+payed orders with `DbManager.close_payed_order` and with the previous
+lookup that cast the order JSON to text, and prints their latency. The
+scratch schema is dropped at the end unless --keep is given.
+
+Run from `src` with the bot environment (.env) in place, e.g.:
+    python -m bench.orders --orders 1000000 --closes 500
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+TG_ID_BASE = 500000000
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument(
+        "--orders-per-config", type=int, default=10, help="order history"
+    )
+    parser.add_argument("--configs-per-user", type=int, default=2)
+    parser.add_argument(
+        "--closes", type=int, default=500, help="closed orders per lookup"
+    )
+    parser.add_argument("--schema", default="wiregram_bench")
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the scratch schema"
+    )
+    return parser.parse_args()
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def seed(dbs, n_users: int, n_configs: int, per_config: int, n_payed: int):
+    """
+    Config i belongs to user (i - 1) % n_users + 1 and is named
+    vless_<tg_id>_<i>, the newest order of configs 1..n_payed is payed.
+    """
+    schema = dbs.DEFAULT_SCHEMA_NAME
+    with dbs.admin_session_factory() as session:
+        session.execute(text(f"""
+                INSERT INTO {schema}."user" (user_id, user_tg_id, admin_flg)
+                SELECT gen_random_uuid(), {TG_ID_BASE} + k, false
+                FROM generate_series(1, {n_users}) k;
+                """))
+        session.execute(text(f"""
+                WITH conf AS (
+                    SELECT i, gen_random_uuid() AS service_config_id,
+                        u.user_id,
+                        'vless_' || u.user_tg_id || '_' || i AS config_name
+                    FROM generate_series(1, {n_configs}) i
+                    JOIN {schema}."user" u
+                        ON u.user_tg_id = {TG_ID_BASE} + 1
+                            + (i - 1) % {n_users}
+                ), ins_conf AS (
+                    INSERT INTO {schema}.user_service_config (
+                        service_config_id, user_id, config_name,
+                        config_price, max_config_traffic, user_service_id,
+                        valid_to_dttm
+                    )
+                    SELECT service_config_id, user_id, config_name, 150,
+                        100, gen_random_uuid(), now() + interval '30 days'
+                    FROM conf
+                )
+                INSERT INTO {schema}.user_order (
+                    order_id, order_status, user_id, service_config_id,
+                    order_data
+                )
+                SELECT gen_random_uuid(),
+                    CASE WHEN n = {per_config} AND i <= {n_payed}
+                        THEN 'PAYED' ELSE 'CLOSED' END,
+                    user_id, service_config_id,
+                    json_build_object(
+                        'config_name', config_name, 'config_price', 200,
+                        'max_config_traffic', 100, 'expired_delta_days', 30
+                    )
+                FROM conf CROSS JOIN generate_series(1, {per_config}) n;
+                """))
+        session.commit()
+    with dbs.admin_session_factory() as session:
+        session.execute(text(f"""
+                ANALYZE {schema}."user", {schema}.user_service_config,
+                    {schema}.user_order;
+                """))
+        session.commit()
+
+
+async def legacy_close_payed_order(
+    dbs, user_tg_id: int, config_name: str, expired_delta_days: int = 30
+):
+    """The order lookup by its JSON cast to text, then three statements."""
+    schema = dbs.DEFAULT_SCHEMA_NAME
+    async with dbs.async_session_factory() as session:
+        res = await session.execute(
+            text(f"""
+                SELECT o.order_data FROM {schema}.user_order o
+                JOIN {schema}."user" u ON u.user_id = o.user_id
+                    AND u.user_tg_id = :user_tg_id
+                    AND o.order_status = 'PAYED'
+                    AND CAST(o.order_data -> 'config_name' AS VARCHAR)
+                        = :config_name_json
+                """),
+            {
+                "user_tg_id": user_tg_id,
+                "config_name_json": f'"{config_name}"',
+            },
+        )
+        order_data = res.scalars().first()
+        res = await session.execute(
+            text(f"""
+                SELECT usc.user_id, usc.service_config_id
+                FROM {schema}.user_service_config usc
+                JOIN {schema}."user" u ON u.user_id = usc.user_id
+                    AND u.user_tg_id = :user_tg_id
+                    AND usc.config_name = :config_name
+                """),
+            {"user_tg_id": user_tg_id, "config_name": config_name},
+        )
+        user_id, service_config_id = res.first()
+        keys = {"user_id": user_id, "service_config_id": service_config_id}
+        await session.execute(
+            text(f"""
+                UPDATE {schema}.user_order SET order_status = 'CLOSED'
+                WHERE user_id = :user_id
+                    AND service_config_id = :service_config_id
+                    AND order_status = 'PAYED'
+                """),
+            keys,
+        )
+        await session.execute(
+            text(f"""
+                UPDATE {schema}.user_service_config SET
+                    valid_from_dttm = :valid_from_dttm,
+                    valid_to_dttm = :valid_to_dttm,
+                    config_price = :config_price,
+                    max_config_traffic = :max_config_traffic
+                WHERE user_id = :user_id
+                    AND service_config_id = :service_config_id
+                """),
+            {
+                **keys,
+                "valid_from_dttm": datetime.now(),
+                "valid_to_dttm": datetime.now()
+                + timedelta(expired_delta_days),
+                "config_price": order_data["config_price"],
+                "max_config_traffic": order_data["max_config_traffic"],
+            },
+        )
+        await session.commit()
+
+
+async def measure(name: str, close, configs: list[tuple[int, str]]):
+    """Close the payed orders of the configs one by one."""
+    latencies = []
+    errors = 0
+    for user_tg_id, config_name in configs:
+        started = time.perf_counter()
+        try:
+            await close(user_tg_id, config_name)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+    print(
+        f"{name:<24} closes={len(configs):<5} "
+        f"p50={statistics.median(latencies) * 1000:7.2f}ms "
+        f"p95={percentile(latencies, 0.95) * 1000:7.2f}ms "
+        f"max={max(latencies) * 1000:7.2f}ms errors={errors}"
+    )
+
+
+async def main():
+    args = parse_args()
+    # modules.db reads its schema on import, point it to the scratch one:
+    os.environ["DB_DEFAULT_SCHEMA_NAME"] = args.schema
+    from modules.db import DbManager
+    from modules.db.manager import dbs
+    from modules.db.models import Base
+
+    for name in ("modules.db.manager", "sqlalchemy.engine"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    for engine in (dbs.admin_sync_engine, dbs.async_engine):
+        engine.echo = False
+
+    if DbManager.check_existed_db():
+        raise SystemExit(
+            f"schema {args.schema} already exists, drop it or pick --schema"
+        )
+
+    n_configs = args.orders // args.orders_per_config
+    n_users = max(1, n_configs // args.configs_per_user)
+    n_payed = min(2 * args.closes, n_configs)
+    started = time.perf_counter()
+    with dbs.admin_session_factory() as session:
+        session.execute(text(f"CREATE SCHEMA {args.schema}"))
+        session.commit()
+    try:
+        Base.metadata.create_all(dbs.admin_sync_engine)
+        DbManager._db_migrate()
+        with dbs.admin_session_factory() as session:
+            session.execute(text(f"""
+                    GRANT ALL PRIVILEGES ON SCHEMA {args.schema}
+                        TO {dbs.WG_USER};
+                    GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA
+                        {args.schema} TO {dbs.WG_USER};
+                    """))
+            session.commit()
+        seed(dbs, n_users, n_configs, args.orders_per_config, n_payed)
+        print(
+            f"seeded {n_users} users, {n_configs} configs, "
+            f"{n_configs * args.orders_per_config} orders in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+
+        configs = []
+        for i in range(1, n_payed + 1):
+            user_tg_id = TG_ID_BASE + (i - 1) % n_users + 1
+            configs.append((user_tg_id, f"vless_{user_tg_id}_{i}"))
+        half = len(configs) // 2
+
+        async def close(user_tg_id: int, config_name: str):
+            res = await DbManager.close_payed_order(user_tg_id, config_name)
+            if res.name != "SUCCESS":
+                raise RuntimeError(res)
+
+        async def legacy_close(user_tg_id: int, config_name: str):
+            await legacy_close_payed_order(dbs, user_tg_id, config_name)
+
+        await measure("json cast lookup", legacy_close, configs[:half])
+        await measure("close_payed_order", close, configs[half:])
+
+        with dbs.admin_session_factory() as session:
+            q = text(f"""
+                SELECT count(*) FROM {args.schema}.user_order
+                WHERE order_status = 'PAYED'
+                """)
+            print(f"payed orders left: {session.execute(q).scalar()}")
+    finally:
+        if not args.keep:
+            with dbs.admin_session_factory() as session:
+                session.execute(
+                    text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+                )
+                session.commit()
+        await dbs.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
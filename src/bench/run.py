@@ -0,0 +1,246 @@
+"""
+Benchmarks of the X-UI side of the bot flows against the fake 3x-ui panel.
+
+Measures panel requests per user action and the latency of the panel part
+of `new_conf`, `path_conf` and `accept_conf_pay_request` (database and
+Telegram time are not included) plus sequential vs batched expiry updates.
+
+Run from `src` with the bot environment (.env) in place, e.g.:
+    python -m bench.run --clients 1000,10000,100000 --latency-ms 5
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from .fake_panel import FakeXuiPanel
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--clients",
+        default="1000,10000,100000",
+        help="comma separated panel sizes (default: 1000,10000,100000)",
+    )
+    parser.add_argument(
+        "--actions", type=int, default=200, help="actions per flow"
+    )
+    parser.add_argument(
+        "--cold-actions",
+        type=int,
+        default=10,
+        help="actions per flow with the inbound cache dropped before each",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=20, help="parallel users"
+    )
+    parser.add_argument(
+        "--batch", type=int, default=100, help="clients per batched expiry"
+    )
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=2053)
+    return parser.parse_args()
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Bench:
+    def __init__(self, panel: FakeXuiPanel, xui, n_clients: int, args):
+        self.panel = panel
+        self.xui = xui
+        self.node = xui.node_pool.default
+        self.n_clients = n_clients
+        self.args = args
+
+    async def measure(self, flow: str, mode: str, actions: list):
+        """Run the actions and print panel requests and latency of them."""
+        cold = mode == "cold"
+        latencies = []
+        errors = 0
+        semaphore = asyncio.Semaphore(1 if cold else self.args.concurrency)
+
+        async def run(action):
+            nonlocal errors
+            async with semaphore:
+                if cold:
+                    self.node.inbound_cache.invalidate()
+                started = time.perf_counter()
+                try:
+                    await action()
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        if not cold:
+            await self.node.inbound_cache.get(force_refresh=True)
+        calls_before = self.panel.calls.copy()
+        started = time.perf_counter()
+        await asyncio.gather(*[run(action) for action in actions])
+        total = time.perf_counter() - started
+        calls = self.panel.calls - calls_before
+
+        n = len(actions)
+        print(
+            f"{flow:<30} {mode:<4} clients={self.n_clients:<7} "
+            f"actions={n:<4} panel_req/action={sum(calls.values()) / n:<6.2f} "
+            f"p50={statistics.median(latencies) * 1000:8.1f}ms "
+            f"p95={percentile(latencies, 0.95) * 1000:8.1f}ms "
+            f"max={max(latencies) * 1000:8.1f}ms "
+            f"rps={n / total:7.1f} errors={errors}"
+        )
+        print(
+            " " * 36
+            + ", ".join(
+                f"{endpoint.removeprefix('/panel/api/inbounds/')}: {cnt}"
+                for endpoint, cnt in calls.most_common()
+            )
+        )
+
+    async def run(self, emails: list[str]):
+        xui = self.xui
+        client_api = xui.VlessClientApi(node=self.node)
+        provisioner = xui.VlessProvisioner()
+        days = 7
+        tg_ids = sorted({int(email.split("_")[1]) for email in emails})
+        next_tg_id = max(tg_ids) + 1
+
+        for mode, n in (
+            ("warm", self.args.actions),
+            ("cold", self.args.cold_actions),
+        ):
+            # new_conf of a user without configs (new inbound):
+            new_users = range(next_tg_id, next_tg_id + n)
+            next_tg_id += n
+            await self.measure(
+                "new_conf (new user)",
+                mode,
+                [
+                    lambda tg_id=tg_id: provisioner.provision(
+                        str(tg_id), f"vless_{tg_id}_1", days
+                    )
+                    for tg_id in new_users
+                ],
+            )
+
+            # new_conf of a user with configs (client add):
+            await self.measure(
+                "new_conf (existing user)",
+                mode,
+                [
+                    lambda tg_id=tg_id: provisioner.provision(
+                        str(tg_id), f"vless_{tg_id}_{mode}", days
+                    )
+                    for tg_id in tg_ids[:n]
+                ],
+            )
+
+            # path_conf with an outdated cached link:
+            async def path_conf(email: str):
+                await client_api.get_vless_client_link_by_email(email)
+                await client_api.get_client_expired_datetime_by_email(email)
+
+            await self.measure(
+                "path_conf",
+                mode,
+                [lambda email=email: path_conf(email) for email in emails[:n]],
+            )
+
+            # accept_conf_pay_request:
+            new_time = datetime.now() + timedelta(30)
+            await self.measure(
+                "accept_conf_pay_request",
+                mode,
+                [
+                    lambda email=email: client_api.update_client_expired_time(
+                        email, new_time
+                    )
+                    for email in emails[:n]
+                ],
+            )
+
+        # Expiry of a batch of clients, one by one vs batched:
+        batch = emails[: self.args.batch]
+        new_time = datetime.now() + timedelta(60)
+
+        async def one_by_one():
+            for email in batch:
+                await client_api.update_client_expired_time(email, new_time)
+
+        async def batched():
+            await client_api.update_clients_expired_time(
+                {email: new_time for email in batch}
+            )
+
+        await self.measure(
+            f"expiry x{len(batch)} one by one", "warm", [one_by_one]
+        )
+        await self.measure(f"expiry x{len(batch)} batched", "warm", [batched])
+
+
+async def main():
+    args = parse_args()
+    panel_url = f"http://127.0.0.1:{args.port}"
+
+    # modules.xui reads its settings on import, point them to the fake panel:
+    os.environ["XUI_HOST"] = panel_url
+    os.environ["XUI_USER"] = "bench"
+    os.environ["XUI_PASS"] = "bench"
+    os.environ["XUI_NODES"] = "[]"
+    import modules.xui as xui
+
+    # Keep the per-config provisioning lines out of the report:
+    logging.getLogger("modules.xui.provision").setLevel(logging.WARNING)
+
+    for n_clients in [int(n) for n in args.clients.split(",")]:
+        panel = FakeXuiPanel(
+            username="bench",
+            password="bench",
+            latency_sec=args.latency_ms / 1000,
+            jitter_sec=args.jitter_ms / 1000,
+            error_rate=args.error_rate,
+        )
+        emails = panel.seed(n_clients)
+        await panel.start(port=args.port)
+
+        # Ports, nodes and keys are served in memory, no database is needed:
+        node = xui.node_pool.default
+        free_ports = iter(range(4000 + len(panel.inbounds), 65536))
+        reserved = {}
+
+        async def reserve(inbound_remark: str) -> int:
+            if inbound_remark not in reserved:
+                reserved[inbound_remark] = next(free_ports)
+            return reserved[inbound_remark]
+
+        async def get_inbound_node(inbound_name: str):
+            return node
+
+        reality_key = xui.generate_reality_key()
+
+        async def pop_reality_key() -> dict:
+            return reality_key
+
+        node.port_allocator.reserve = reserve
+        xui.reality_key_pool.pop = pop_reality_key
+        xui.node_pool.get_inbound_node = get_inbound_node
+        node.inbound_cache.invalidate()
+        try:
+            await Bench(panel, xui, n_clients, args).run(emails)
+            print(f"session: {node.session.stats()}")
+            print(f"inbound cache: {node.inbound_cache.stats()}\n")
+        finally:
+            await panel.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
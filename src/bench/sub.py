@@ -0,0 +1,120 @@
+"""
+Benchmark of the subscription server polled by VLESS apps.
+
+Every user has its token and a few configs, the database is replaced by an
+in-memory lookup with a fixed latency. Polls are sent with and without
+If-None-Match, the report has polls per second, latency and database
+loads.
+
+Run from `src` with the bot environment (.env) in place, e.g.:
+    python -m bench.sub --users 10000 --polls 50000 --db-latency-ms 5
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import aiohttp
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--configs", type=int, default=2, help="per user")
+    parser.add_argument("--polls", type=int, default=50000)
+    parser.add_argument(
+        "--concurrency", type=int, default=50, help="parallel polls"
+    )
+    parser.add_argument(
+        "--revalidate",
+        type=float,
+        default=0.8,
+        help="share of polls sent with If-None-Match",
+    )
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    parser.add_argument("--cache-ttl-sec", type=float, default=60)
+    parser.add_argument("--port", type=int, default=8081)
+    return parser.parse_args()
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def main():
+    args = parse_args()
+    os.environ["SUB_SECRET"] = "bench"
+    from modules.db import DbManager
+    from modules.subscription import SubscriptionServer, make_sub_token
+
+    valid_to_dttm = datetime.now() + timedelta(days=30)
+
+    async def get_sub_configs(user_tg_id: int) -> list[tuple]:
+        await asyncio.sleep(args.db_latency_ms / 1000)
+        return [
+            (
+                f"vless_{user_tg_id}_{k}",
+                {"config_path": f"vless://{user_tg_id}-{k}@bench:4000"},
+                valid_to_dttm,
+            )
+            for k in range(1, args.configs + 1)
+        ]
+
+    DbManager.get_sub_configs = staticmethod(get_sub_configs)
+    server = SubscriptionServer(
+        secret="bench", port=args.port, cache_ttl_sec=args.cache_ttl_sec
+    )
+    await server.start()
+
+    base_url = f"http://127.0.0.1:{args.port}/sub/"
+    tokens = [
+        make_sub_token(user_tg_id, "bench")
+        for user_tg_id in range(100000000, 100000000 + args.users)
+    ]
+    etags: dict[str, str] = {}
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def poll(session: aiohttp.ClientSession, token: str):
+        async with semaphore:
+            headers = {}
+            if token in etags and random.random() < args.revalidate:
+                headers["If-None-Match"] = etags[token]
+            started = time.perf_counter()
+            async with session.get(base_url + token, headers=headers) as resp:
+                await resp.read()
+                latencies.append(time.perf_counter() - started)
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+                if resp.status == 200:
+                    etags[token] = resp.headers["ETag"]
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *[poll(session, random.choice(tokens)) for _ in range(args.polls)]
+        )
+        elapsed = time.perf_counter() - started
+    await server.stop()
+
+    print(
+        f"{args.polls} polls of {args.users} users in {elapsed:.1f}s: "
+        f"{args.polls / elapsed:.0f} polls/s, "
+        f"{args.polls / elapsed * 60:.0f} polls/min"
+    )
+    print(
+        f"latency p50 {percentile(latencies, 0.5) * 1000:.1f}ms, "
+        f"p95 {percentile(latencies, 0.95) * 1000:.1f}ms, "
+        f"max {max(latencies) * 1000:.1f}ms"
+    )
+    print(f"statuses: {dict(sorted(statuses.items()))}")
+    print(f"server: {server.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
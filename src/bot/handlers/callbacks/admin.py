@@ -12,7 +12,8 @@ from ...keyboards.admin import (
     conf_pay_requests_btn,
 )
 from modules.db import DbManager, ReturnCode
-from modules.xui import VlessClientApi
+from modules.xui import VlessClientApi, XuiUnavailableError
+from .config import refresh_configs_cached_data, XUI_BUSY_MESS
 from modules.db.models import OrderStatus, UserAccCode
 from settings import settings
 from logger import MainLogger, get_error_timestamp
@@ -188,6 +189,11 @@ async def accept_conf_pay_request(
             raise BaseException(
                 f"BAD TRY TO ACСEPT SERVICE ACCESS TO {user_tg_id} ON 3XUI"
             )
+    except XuiUnavailableError as e:
+        logger.warning(e)
+        await call.message.edit_text(
+            XUI_BUSY_MESS, reply_markup=admin_menu_kb(user_tg_id)
+        )
     except Exception as e:
         logger.error(e)
         mess = (
@@ -244,6 +250,27 @@ async def decline_conf_pay_request(
         )
 
 
+async def refresh_conf_links(call: CallbackQuery, user_tg_id: int):
+    try:
+        refreshed_cnt = await refresh_configs_cached_data()
+        await call.message.edit_text(
+            f"🔗 Обновил ссылки для {refreshed_cnt} конфигов",
+            reply_markup=admin_menu_kb(user_tg_id),
+        )
+    except XuiUnavailableError as e:
+        logger.warning(e)
+        await call.message.edit_text(
+            XUI_BUSY_MESS, reply_markup=admin_menu_kb(user_tg_id)
+        )
+    except Exception as e:
+        mess = "❌ Ошибка обновления ссылок конфигов"
+        logger.error(e)
+        await call.message.edit_text(
+            mess + f"{get_error_timestamp(logger)}",
+            reply_markup=admin_menu_kb(user_tg_id),
+        )
+
+
 async def admin_cb_cmd(call: CallbackQuery):
     try:
         call_data = call.data.split(":")
@@ -264,6 +291,9 @@ async def admin_cb_cmd(call: CallbackQuery):
                 case "admin_all_conf_pay_btn":
                     await all_conf_pay_requests(call, user_tg_id)
 
+                case "admin_refresh_links_btn":
+                    await refresh_conf_links(call, user_tg_id)
+
                 case "admin_menu_back_btn":
                     await call.message.edit_text(
                         "Админ, вот меню для тебя 📋",
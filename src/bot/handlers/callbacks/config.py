@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
-from aiogram.types import CallbackQuery
+from aiogram.types import CallbackQuery, BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram import html, Bot
@@ -8,13 +9,22 @@ from ...keyboards.menu import menu_kb
 from ...keyboards.service import (
     actions_conf_kb,
     service_back_btn,
+    service_path_kb,
     service_del_view,
     new_order_view,
     new_conf_view,
 )
 from ...keyboards.admin import conf_pay_request_kb
-from modules.xui import VlessClientApi, VlessInboundApi
+from modules.xui import (
+    VlessClientApi,
+    VlessProvisioner,
+    XuiUnavailableError,
+    make_config_cached_data,
+    node_pool,
+)
 from modules.db import DbManager, ReturnCode
+from modules.subscription import subscription_server
+from modules.qr import qr_cache
 from modules.db.models import OrderStatus, get_order_nm_str
 from settings import settings
 from logger import MainLogger, get_error_timestamp
@@ -25,15 +35,21 @@ bot = Bot(
 )
 logger = MainLogger(__name__).get()
 
+XUI_BUSY_MESS = (
+    "⏳ Сервис сейчас перегружен, попробуй, пожалуйста, через пару минут"
+)
+
 
 async def choose_conf(call: CallbackQuery, user_tg_id: int, config_name: str):
     try:
-        user_new_order = await dbm.get_order(
-            user_tg_id, config_name, OrderStatus.NEW.value
-        )
-        user_payed_order = await dbm.get_order(
-            user_tg_id, config_name, OrderStatus.PAYED.value
-        )
+        # Both orders are read from one snapshot:
+        async with dbm.unit_of_work(snapshot=True):
+            user_new_order = await dbm.get_order(
+                user_tg_id, config_name, OrderStatus.NEW.value
+            )
+            user_payed_order = await dbm.get_order(
+                user_tg_id, config_name, OrderStatus.PAYED.value
+            )
         if user_new_order:
             order_short_nm = html.code(get_order_nm_str(user_new_order))
             order_cost = user_new_order.order_data.get("config_price")
@@ -58,8 +74,13 @@ async def choose_conf(call: CallbackQuery, user_tg_id: int, config_name: str):
                 reply_markup=actions_conf_kb(user_tg_id, config_name),
             )
         else:
+            up_bytes, down_bytes = await dbm.get_config_traffic(
+                user_tg_id, config_name, datetime.now() - timedelta(30)
+            )
             await call.message.edit_text(
-                f"✨ Вот что можно сделать с конфигом {config_name}",
+                f"✨ Вот что можно сделать с конфигом {config_name}\n"
+                f"📊 Трафик за 30 дней: "
+                f"{(up_bytes + down_bytes) / 1024**3:.2f} ГБ",
                 reply_markup=actions_conf_kb(
                     user_tg_id, config_name, is_renew_req=True
                 ),
@@ -75,11 +96,14 @@ async def choose_conf(call: CallbackQuery, user_tg_id: int, config_name: str):
 
 async def renew_conf(call: CallbackQuery, user_tg_id: int, config_name: str):
     try:
-        resp = await dbm.add_order(user_tg_id, config_name)
+        # The order is committed before the user is answered:
+        async with dbm.unit_of_work():
+            resp = await dbm.add_order(user_tg_id, config_name)
+            if resp == ReturnCode.SUCCESS:
+                user_new_order = await dbm.get_order(
+                    user_tg_id, config_name, OrderStatus.NEW.value
+                )
         if resp == ReturnCode.SUCCESS:
-            user_new_order = await dbm.get_order(
-                user_tg_id, config_name, OrderStatus.NEW.value
-            )
             order_cost = user_new_order.order_data.get("config_price")
             order_short_nm = html.code(get_order_nm_str(user_new_order))
             await call.message.edit_text(
@@ -157,44 +181,42 @@ async def new_conf(call: CallbackQuery, user_tg_id: int):
         if n > max_config_n:
             max_config_n = n
     config_name = f"{conf_tag}_{user_tg_id}_{max_config_n + 1}"
+    if not node_pool.is_available:
+        await call.message.edit_text(
+            XUI_BUSY_MESS, reply_markup=menu_kb(user_tg_id)
+        )
+        return
     await call.message.edit_text("🛠️ Создаю...")
     try:
-        free_inbound_port = await VlessInboundApi().get_inbounds_free_port()
-        inbound_id = await VlessInboundApi().make_vless_inbound(
-            str(user_tg_id), free_inbound_port
+        provisioned = await VlessProvisioner().provision(
+            str(user_tg_id), config_name, expired_delta_days
         )
-        client_email = await VlessClientApi().make_vless_client(
-            inbound_id, config_name
+        resp = await dbm.add_service_config(
+            user_tg_id,
+            provisioned.client_uuid,
+            config_name,
+            expired_delta_days=expired_delta_days,
+            cached_data=make_config_cached_data(
+                provisioned.link, provisioned.expired_dttm
+            ),
+            node_name=provisioned.node_name,
         )
-        if client_email:
-            user_service_id = await VlessClientApi().get_client_uuid_by_email(
-                config_name
+        if resp == ReturnCode.SUCCESS:
+            await call.message.edit_text(
+                f"🎉 Сформировал для тебя конфиг {config_name} "
+                f"и предоставил {expired_delta_days} 🆓 тестовых дней",
+                reply_markup=new_conf_view(user_tg_id, config_name),
             )
-            upd_resp = await VlessClientApi().update_client_expired_time(
-                config_name,
-                datetime.now() + timedelta(expired_delta_days),
+        else:
+            raise BaseException(
+                f"BAD TRY TO MAKE NEW CONF {config_name} "
+                f"FOR USER {user_tg_id}"
             )
-            if upd_resp:
-                resp = await dbm.add_service_config(
-                    user_tg_id,
-                    user_service_id,
-                    config_name,
-                    expired_delta_days=expired_delta_days,
-                )
-                if resp == ReturnCode.SUCCESS:
-                    await update_user_config_cached_data(
-                        user_tg_id, config_name
-                    )
-                    await call.message.edit_text(
-                        f"🎉 Сформировал для тебя конфиг {config_name} "
-                        f"и предоставил {expired_delta_days} 🆓 тестовых дней",
-                        reply_markup=new_conf_view(user_tg_id, config_name),
-                    )
-                else:
-                    raise BaseException(
-                        f"BAD TRY TO MAKE NEW CONF {config_name} "
-                        f"FOR USER {user_tg_id}"
-                    )
+    except XuiUnavailableError as e:
+        logger.warning(e)
+        await call.message.edit_text(
+            XUI_BUSY_MESS, reply_markup=menu_kb(user_tg_id)
+        )
     except Exception as e:
         logger.error(e)
         mess = f"❌ Ошибка добавления конфига {config_name} для {user_tg_id}"
@@ -206,6 +228,9 @@ async def new_conf(call: CallbackQuery, user_tg_id: int):
 
 async def delete_conf(call: CallbackQuery, user_tg_id: int, config_name: str):
     try:
+        node = await node_pool.locate(config_name)
+        if not node.is_available:
+            raise XuiUnavailableError(f"X-UI NODE {node.name} IS UNAVAILABLE")
         resp = await dbm.delete_service_config(user_tg_id, config_name)
         if resp == ReturnCode.SUCCESS:
             await VlessClientApi().delete_client(config_name)
@@ -218,6 +243,12 @@ async def delete_conf(call: CallbackQuery, user_tg_id: int, config_name: str):
                 f"BAD TRY TO DELETE CONFIG {config_name} "
                 f"FOR USER {user_tg_id}"
             )
+    except XuiUnavailableError as e:
+        logger.warning(e)
+        await call.message.edit_text(
+            XUI_BUSY_MESS,
+            reply_markup=service_back_btn(user_tg_id, config_name),
+        )
     except Exception as e:
         logger.error(e)
         mess = f"❌ Не смог удалить твой конфиг {config_name} "
@@ -237,20 +268,28 @@ async def update_user_config_cached_data(user_tg_id: int, config_name: str):
         )
     )
     if config_path and conf_expired_dttm:
-        cached_data = {
-            "config_path": config_path,
-            "config_path_add_dttm": datetime.now().strftime(
-                "%Y-%m-%d %H:%M:%S"
-            ),
-            "conf_expired_dttm": conf_expired_dttm.strftime(
-                "%Y-%m-%d %H:%M:%S"
-            ),
-        }
+        cached_data = make_config_cached_data(config_path, conf_expired_dttm)
         await dbm.update_service_config(
             user_tg_id, config_name, cached_data=cached_data
         )
 
 
+async def refresh_configs_cached_data() -> int:
+    clients = await VlessClientApi().get_vless_client_links_and_expiry(
+        force_refresh=True
+    )
+    cached_data_by_config = {}
+    for config_name, (config_path, conf_expired_dttm) in clients.items():
+        if config_path and conf_expired_dttm:
+            cached_data_by_config[config_name] = make_config_cached_data(
+                config_path, conf_expired_dttm
+            )
+    resp = await dbm.update_service_configs_cached_data(cached_data_by_config)
+    if resp != ReturnCode.SUCCESS:
+        raise Exception(f"BAD TRY TO REFRESH CONFIGS CACHED DATA: {resp}")
+    return len(cached_data_by_config)
+
+
 async def get_vless_conf_path(user_tg_id: int, config_name: str):
     config_path = await VlessClientApi().get_vless_client_link_by_email(
         config_name
@@ -259,39 +298,30 @@ async def get_vless_conf_path(user_tg_id: int, config_name: str):
     return config_path
 
 
-async def path_conf(call: CallbackQuery, user_tg_id: int, config_name: str):
-    try:
-        config_path = ""
-        user_service_config = await dbm.get_service_config(
-            user_tg_id, config_name
+async def get_user_conf_path(user_tg_id: int, config_name: str) -> str:
+    """The link of the config, cached for 3 days in the database."""
+    user_service_config = await dbm.get_service_config(
+        user_tg_id, config_name
+    )
+    if not user_service_config:
+        return None
+    cached_data = user_service_config.cached_data or {}
+    cached_config_path = cached_data.get("config_path", "")
+    cached_config_path_add_dttm = cached_data.get("config_path_add_dttm", "")
+
+    if cached_config_path_add_dttm and cached_config_path:
+        cached_config_path_add_dttm = datetime.strptime(
+            cached_config_path_add_dttm, "%Y-%m-%d %H:%M:%S"
         )
-        if user_service_config:
-            cached_config_path = user_service_config.cached_data.get(
-                "config_path", ""
-            )
-            cached_config_path_add_dttm = user_service_config.cached_data.get(
-                "config_path_add_dttm", ""
-            )
+        if cached_config_path_add_dttm + timedelta(3) > datetime.now():
+            return cached_config_path
+    return await get_vless_conf_path(user_tg_id, config_name)
 
-            if cached_config_path_add_dttm:
-                cached_config_path_add_dttm = datetime.strptime(
-                    cached_config_path_add_dttm, "%Y-%m-%d %H:%M:%S"
-                )
-                if cached_config_path_add_dttm + timedelta(3) > datetime.now():
-                    if cached_config_path:
-                        config_path = cached_config_path
-                    else:
-                        config_path = await get_vless_conf_path(
-                            user_tg_id, config_name
-                        )
-                else:
-                    config_path = await get_vless_conf_path(
-                        user_tg_id, config_name
-                    )
-            else:
-                config_path = await get_vless_conf_path(
-                    user_tg_id, config_name
-                )
+
+async def path_conf(call: CallbackQuery, user_tg_id: int, config_name: str):
+    try:
+        config_path = await get_user_conf_path(user_tg_id, config_name)
+        if config_path is not None:
             android_link = settings.VLESS_APP_ANDROID_LINK
             apple_link = settings.VLESS_APP_APPLE_LINK
             pc_link = settings.VLESS_APP_PC_LINK
@@ -304,12 +334,28 @@ async def path_conf(call: CallbackQuery, user_tg_id: int, config_name: str):
                 f"💻 - для PC: <a href='{pc_link}'>ссылка</a>\n"
                 f"🔗 - все варианты: <a href='{all_link}'>ссылка</a>"
             )
+            mess += f"\n\n{html.pre(config_path)}"
+            if settings.SUB_ENABLED and settings.SUB_URL:
+                sub_url = subscription_server.make_url(
+                    settings.SUB_URL, user_tg_id
+                )
+                mess += (
+                    "\n\n📡 Или добавь в приложение подписку на все свои "
+                    "конфиги, она обновляется сама:\n"
+                    f"{html.pre(sub_url)}"
+                )
             await call.message.edit_text(
-                mess + f"\n\n{html.pre(config_path)}",
+                mess,
                 parse_mode="HTML",
-                reply_markup=service_back_btn(user_tg_id, config_name),
+                reply_markup=service_path_kb(user_tg_id, config_name),
                 disable_web_page_preview=True,
             )
+    except XuiUnavailableError as e:
+        logger.warning(e)
+        await call.message.edit_text(
+            XUI_BUSY_MESS,
+            reply_markup=service_back_btn(user_tg_id, config_name),
+        )
     except Exception as e:
         logger.error(e)
         mess = f"❌ Не смог выдать тебе ссылку {user_tg_id} на {config_name}"
@@ -319,6 +365,48 @@ async def path_conf(call: CallbackQuery, user_tg_id: int, config_name: str):
         )
 
 
+async def qr_conf(call: CallbackQuery, user_tg_id: int, config_name: str):
+    try:
+        config_path = await get_user_conf_path(user_tg_id, config_name)
+        if config_path:
+            caption = f"📷 QR-код конфига {config_name}"
+            reply_markup = service_back_btn(user_tg_id, config_name)
+            file_id = await qr_cache.get_file_id(config_path)
+            if file_id:
+                try:
+                    await call.message.answer_photo(
+                        file_id, caption=caption, reply_markup=reply_markup
+                    )
+                    return
+                except TelegramBadRequest as e:
+                    # The file is gone on the Telegram side:
+                    logger.warning(
+                        f"QR FILE ID OF {config_name} REJECTED: {e}"
+                    )
+                    await qr_cache.forget_file_id(config_path)
+
+            png = await qr_cache.get_png(config_path)
+            message = await call.message.answer_photo(
+                BufferedInputFile(png, filename=f"{config_name}.png"),
+                caption=caption,
+                reply_markup=reply_markup,
+            )
+            await qr_cache.set_file_id(config_path, message.photo[-1].file_id)
+    except XuiUnavailableError as e:
+        logger.warning(e)
+        await call.message.edit_text(
+            XUI_BUSY_MESS,
+            reply_markup=service_back_btn(user_tg_id, config_name),
+        )
+    except Exception as e:
+        logger.error(e)
+        mess = f"❌ Не смог сделать QR-код {user_tg_id} для {config_name}"
+        await call.message.edit_text(
+            mess + f"{get_error_timestamp(logger)}",
+            reply_markup=service_back_btn(user_tg_id, config_name),
+        )
+
+
 async def serv_cb_cmd(call: CallbackQuery):
     try:
         call_tag = call.data.split(":")[0]
@@ -344,6 +432,9 @@ async def serv_cb_cmd(call: CallbackQuery):
             case "serv_get_path_btn":
                 await path_conf(call, user_tg_id, config_name)
 
+            case "serv_get_qr_btn":
+                await qr_conf(call, user_tg_id, config_name)
+
     except Exception as e:
         logger.error(f"{e}")
     finally:
@@ -21,13 +21,19 @@ logger = MainLogger(__name__).get()
 
 async def user_account(call: CallbackQuery, user_tg_id: int):
     try:
-        db_user = await dbm.get_user(user_tg_id)
+        # One snapshot for the reads, released before the answer:
+        async with dbm.unit_of_work(snapshot=True):
+            db_user = await dbm.get_user(user_tg_id)
+            bot_access = await dbm.get_access(
+                user_tg_id, UserAccCode.BOT.value
+            )
+            user_orders = await dbm.get_oders_hist(user_tg_id)
+            user_configs = await dbm.get_service_configs(user_tg_id)
         profile_str = (
             f"\n👤 {html.bold("Профиль:")}"
             f"\n\t- Имя: {db_user.user_name}"
             f"\n\t- TG ID: {html.code(str(db_user.user_tg_id))}\n"
         )
-        bot_access = await dbm.get_access(user_tg_id, UserAccCode.BOT.value)
         access_valid_to = bot_access.valid_to_dttm.strftime(
             "%Y-%m-%d %H:%M:%S"
         )
@@ -36,7 +42,6 @@ async def user_account(call: CallbackQuery, user_tg_id: int):
             "\n\t- Статус: Активен ✅"
             f"\n\t- Действует до: {access_valid_to}\n"
         )
-        user_orders = await dbm.get_oders_hist(user_tg_id)
         order_mess = ""
         if user_orders:
             order_mess += f"\n📦 {html.bold("История заказов:")}"
@@ -67,7 +72,6 @@ async def user_account(call: CallbackQuery, user_tg_id: int):
             f"\n\t- Чат: {settings.TG_HELP_CHAT_LINK}\n"
         )
 
-        user_configs = await dbm.get_service_configs(user_tg_id)
         conf_mess = ""
         if user_configs:
             conf_mess += f"\n🛠️ {html.bold("Конфигурации:")}"
@@ -1,13 +1,10 @@
 from aiogram.types import Message
 
 from ...keyboards.admin import admin_menu_kb
-from modules.db import DbManager
+from modules.db.models import UserRecord
 
-dbm = DbManager()
 
-
-async def admin_cmd(message: Message) -> None:
-    user = await dbm.get_user(message.from_user.id)
+async def admin_cmd(message: Message, user: UserRecord) -> None:
     if user:
         if user.admin_flg:
             await message.answer(
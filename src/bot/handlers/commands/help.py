@@ -1,13 +1,10 @@
 from aiogram.types import Message
 
-from modules.db import DbManager
+from modules.db.models import UserRecord
 
-dbm = DbManager()
 
-
-async def help_cmd(message: Message) -> None:
-    resp = await dbm.get_user(message.from_user.id)
-    if resp:
+async def help_cmd(message: Message, user: UserRecord) -> None:
+    if user:
         mess = (
             "✅ Чтобы получить доступ к боту, нажми команду /join.\n"
             "📋 Все доступные действия можно найти в меню, используя команду "
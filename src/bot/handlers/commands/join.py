@@ -6,7 +6,7 @@ from datetime import datetime
 
 from ...keyboards.admin import access_request_kb
 from modules.db import DbManager, ReturnCode
-from modules.db.models import UserAccCode
+from modules.db.models import UserAccCode, UserRecord, AccessRecord
 from settings import settings
 
 dbm = DbManager()
@@ -15,14 +15,11 @@ bot = Bot(
 )
 
 
-async def join_cmd(message: Message) -> None:
-    user = await dbm.get_user(message.from_user.id)
-
+async def join_cmd(
+    message: Message, user: UserRecord, user_access: AccessRecord
+) -> None:
     admins_id = list(set([settings.TG_ADMIN_ID] + (await dbm.get_admins())))
     if user:
-        user_access = await dbm.get_access(
-            user.user_tg_id, UserAccCode.BOT.value
-        )
         if user_access:
             user_access_valid_to_str = user_access.valid_to_dttm.strftime(
                 "%Y-%m-%d %H:%M:%S"
@@ -1,20 +1,15 @@
 from aiogram.types import Message
-from datetime import datetime
 from aiogram import html
-from modules.db import DbManager
+from modules.db.models import UserRecord, AccessRecord
 from ...keyboards.menu import menu_kb
 
-dbm = DbManager()
 
-
-async def menu_cmd(message: Message) -> None:
-    user = await dbm.get_user(message.from_user.id)
+async def menu_cmd(
+    message: Message, user: UserRecord, user_access: AccessRecord
+) -> None:
     if user:
-        user_access = await dbm.get_access(user.user_tg_id, "BOT")
         if user_access:
-            if (user_access.valid_from_dttm < datetime.now()) and (
-                datetime.now() < user_access.valid_to_dttm
-            ):
+            if user_access.is_active():
                 await message.answer(
                     html.bold("📋 Меню")
                     + "\n\n"
@@ -0,0 +1,83 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+
+from modules.db import DbManager
+from modules.db.models import UserAccCode
+from settings import settings
+from logger import MainLogger
+
+logger = MainLogger(__name__).get()
+
+dbm = DbManager()
+
+# Callbacks of users with the bot access only:
+ACCESS_CALLBACK_PREFIXES = ("menu", "serv")
+ADMIN_CALLBACK_PREFIX = "admin"
+
+
+class AccessMiddleware(BaseMiddleware):
+    """
+    Resolves the sender and the BOT access once per update.
+
+    The handlers get them as `db_user` (UserRecord, None for unknown
+    users) and `bot_access` (AccessRecord, None without an access), both
+    from the DbManager caches. Messages always pass, commands answer
+    unknown users themselves. Buttons of the menu and the services need
+    an active access, admin buttons need an admin sender: the buttons sent
+    to admins carry the id of the user they are about.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        db_user = None
+        bot_access = None
+        if from_user:
+            db_user = await dbm.get_user(from_user.id)
+            if db_user:
+                bot_access = await dbm.get_access_record(
+                    from_user.id, UserAccCode.BOT.value
+                )
+        data["db_user"] = db_user
+        data["bot_access"] = bot_access
+
+        if isinstance(event, CallbackQuery) and event.data:
+            if not self.is_allowed(
+                event.from_user.id, event.data, db_user, bot_access
+            ):
+                logger.warning(
+                    f"CALLBACK {event.data.split(':')[0]} DENIED FOR USER "
+                    f"{event.from_user.id}"
+                )
+                await event.answer(
+                    (
+                        "🔒 Это действие доступно только администраторам"
+                        if event.data.startswith(ADMIN_CALLBACK_PREFIX)
+                        else "🔒 У тебя нет доступа к боту. Нажми /join, "
+                        "чтобы его получить 🔑"
+                    ),
+                    show_alert=True,
+                )
+                return None
+        return await handler(event, data)
+
+    @staticmethod
+    def is_allowed(
+        user_tg_id: int, call_data: str, db_user, bot_access
+    ) -> bool:
+        is_admin = user_tg_id == settings.TG_ADMIN_ID or (
+            db_user is not None and db_user.admin_flg
+        )
+        if call_data.startswith(ADMIN_CALLBACK_PREFIX):
+            return is_admin
+        if call_data.startswith(ACCESS_CALLBACK_PREFIXES):
+            return is_admin or (
+                bot_access is not None and bot_access.is_active()
+            )
+        return True
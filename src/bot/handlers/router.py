@@ -3,6 +3,7 @@ from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, CallbackQuery
 
 from bot.handlers.decorators import new_message, new_сall
+from bot.handlers.middlewares import AccessMiddleware
 from bot.handlers.commands.admin import admin_cmd
 from bot.handlers.commands.help import help_cmd
 from bot.handlers.commands.join import join_cmd
@@ -12,32 +13,39 @@ from bot.handlers.commands.start import start_cmd
 from bot.handlers.callbacks.admin import admin_cb_cmd
 from bot.handlers.callbacks.menu import menu_cb_cmd
 from bot.handlers.callbacks.config import serv_cb_cmd
+from modules.db.models import UserRecord, AccessRecord
 
 router = Router()
+router.message.outer_middleware(AccessMiddleware())
+router.callback_query.outer_middleware(AccessMiddleware())
 
 
 @router.message(Command("admin"))
 @new_message
-async def admin_handler(message: Message):
-    await admin_cmd(message)
+async def admin_handler(message: Message, db_user: UserRecord):
+    await admin_cmd(message, db_user)
 
 
 @router.message(Command("help"))
 @new_message
-async def help_handler(message: Message):
-    await help_cmd(message)
+async def help_handler(message: Message, db_user: UserRecord):
+    await help_cmd(message, db_user)
 
 
 @router.message(Command("join"))
 @new_message
-async def join_handler(message: Message):
-    await join_cmd(message)
+async def join_handler(
+    message: Message, db_user: UserRecord, bot_access: AccessRecord
+):
+    await join_cmd(message, db_user, bot_access)
 
 
 @router.message(Command("menu"))
 @new_message
-async def menu_handler(message: Message):
-    await menu_cmd(message)
+async def menu_handler(
+    message: Message, db_user: UserRecord, bot_access: AccessRecord
+):
+    await menu_cmd(message, db_user, bot_access)
 
 
 @router.message(CommandStart())
@@ -18,6 +18,12 @@ def admin_menu_kb(user_tg_id: int):
                 callback_data=f"admin_all_conf_pay_btn:{user_tg_id}",
             )
         ],
+        [
+            InlineKeyboardButton(
+                text="🔗 Обновить ссылки конфигов",
+                callback_data=f"admin_refresh_links_btn:{user_tg_id}",
+            )
+        ],
     ]
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
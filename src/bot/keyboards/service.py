@@ -109,6 +109,24 @@ def service_back_btn(user_tg_id: int, config_name: str):
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
 
+def service_path_kb(user_tg_id: int, config_name: str):
+    kb = [
+        [
+            InlineKeyboardButton(
+                text="📷 QR-код",
+                callback_data=f"serv_get_qr_btn:{user_tg_id}:{config_name}",
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=f"serv_chosse_btn:{user_tg_id}:{config_name}",
+            )
+        ],
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
+
 def actions_conf_kb(
     user_tg_id: int,
     config_name: str,
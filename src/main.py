@@ -1,5 +1,13 @@
 import asyncio
 from modules.db import DbManager
+from modules.xui import (
+    node_pool,
+    traffic_collector,
+    expiry_enforcer,
+    reality_key_pool,
+)
+from modules.subscription import subscription_server
+from modules.qr import qr_cache
 from bot.main import main as bot_main
 from settings import settings
 from logger import logger
@@ -12,7 +20,22 @@ async def main() -> None:
 
     if DbManager().check_db_available():
         DbManager().create_db(reinit=False)
+        await node_pool.reconcile_ports()
+        traffic_task = asyncio.create_task(traffic_collector.run())
+        expiry_task = asyncio.create_task(expiry_enforcer.run())
+        reality_task = asyncio.create_task(reality_key_pool.run())
+        if settings.DB_ADMIN_LISTEN:
+            admin_task = asyncio.create_task(DbManager.listen_admin_roster())
+        if settings.SUB_ENABLED:
+            await subscription_server.start()
         await bot_main()
+        await subscription_server.stop()
+        qr_cache.shutdown()
+        traffic_task.cancel()
+        expiry_task.cancel()
+        reality_task.cancel()
+        if settings.DB_ADMIN_LISTEN:
+            admin_task.cancel()
 
 
 asyncio.run(main())
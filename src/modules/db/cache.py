@@ -0,0 +1,78 @@
+import time
+from collections import OrderedDict
+
+
+class TtlLruCache:
+    """
+    A bounded LRU of values with a time to live, for rows read on every
+    update and changed rarely. Values must be immutable, the same object is
+    handed out to every caller.
+    """
+
+    # Bumped by the invalidations of every cache, see uow.fresh_snapshot():
+    epoch = 0
+
+    def __init__(self, max_size: int = 10000, ttl_sec: float = 300):
+        """
+        Initialize the TtlLruCache.
+
+        Args:
+            max_size (int): Max cached values (default: 10000).
+            ttl_sec (float): Value time to live in seconds (default: 300).
+        """
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self._items: OrderedDict = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """
+        Get a cached value.
+
+        Args:
+            key: The key of the value.
+            default: Returned on a miss, to cache None values too
+                (default: None).
+
+        Returns:
+            The value, default if it is not cached or expired.
+        """
+        item = self._items.get(key)
+        if item is None or time.monotonic() - item[1] >= self.ttl_sec:
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key, value):
+        self._items[key] = (value, time.monotonic())
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key):
+        TtlLruCache.epoch += 1
+        self.invalidations += 1
+        self._items.pop(key, None)
+
+    def clear(self):
+        TtlLruCache.epoch += 1
+        self.invalidations += 1
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "cached": len(self._items),
+        }
@@ -1,5 +1,7 @@
 import uuid
+import asyncio
 from enum import Enum
+from functools import partial
 from datetime import datetime, timedelta
 from sqlalchemy import (
     select,
@@ -8,19 +10,41 @@ from sqlalchemy import (
     and_,
     or_,
     text,
-    cast,
     desc,
-    String,
+    bindparam,
+    func,
+    tuple_,
+    literal,
+    cast,
+    Float,
 )
+import asyncpg
 from sqlalchemy.orm import aliased
+from sqlalchemy.types import Uuid
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert
 
 from logger import MainLogger
 from .settings import DBSettings
+from .cache import TtlLruCache
+from .uow import unit_of_work, use_session, commit, on_unit_end
+from .uow import fresh_snapshot
 from .models import Base, BaseStruct
 from .models import UserStruct, UserAccReqStruct, UserAccStruct
+from .models import UserRecord, AccessRecord
 from .models import UserServConfStruct
 from .models import OrderStruct
+from .models import VlessPortStruct
+from .models import (
+    ConfigTrafficStruct,
+    ConfigTrafficHourlyStruct,
+    ConfigTrafficDailyStruct,
+    ConfigTrafficCounterStruct,
+)
+from .models import JobWatermarkStruct, ConfigExpiryActionStruct
+from .models import RealityKeyStruct
+from .models import SchemaMigrationStruct
+from .migrations import MIGRATIONS
 
 logger = MainLogger(__name__).get()
 dbs = DBSettings()
@@ -37,6 +61,73 @@ def now_dttm():
     return datetime.now()
 
 
+# NOTIFY channel of admin changes, the key of the roster in its cache:
+ADMIN_ROSTER_CHANNEL = f"{dbs.DEFAULT_SCHEMA_NAME}_admin_roster"
+ADMIN_ROSTER_KEY = "admins"
+# The advisory lock of the schema migrations:
+MIGRATION_LOCK_ID = 7289
+# A miss of the caches holding None values:
+NOT_CACHED = object()
+
+
+def make_user_id(user_tg_id: int) -> uuid.UUID:
+    return uuid.uuid5(uuid.NAMESPACE_DNS, str(user_tg_id))
+
+
+def sel_user_id(user_tg_id: int):
+    # The user_id as a scalar subquery, the lookup stays in the statement:
+    return (
+        select(UserStruct.user_id)
+        .where(UserStruct.user_tg_id == user_tg_id)
+        .scalar_subquery()
+    )
+
+
+def _close_payed_order_stmt():
+    """
+    Closes the payed order of a config and renews the config from it:
+    the order is found by its service_config_id (ix_user_order_config_status)
+    and the config gets the price and traffic of the order. Built once, the
+    values are bound on execute.
+    """
+    o = OrderStruct.__table__
+    u = UserStruct.__table__
+    usc = UserServConfStruct.__table__
+    upd_order = (
+        update(o)
+        .values(order_status="CLOSED")
+        .where(
+            and_(
+                o.c.service_config_id == usc.c.service_config_id,
+                o.c.user_id == usc.c.user_id,
+                o.c.order_status == "PAYED",
+                usc.c.config_name == bindparam("b_config_name"),
+                u.c.user_id == usc.c.user_id,
+                u.c.user_tg_id == bindparam("b_user_tg_id"),
+            )
+        )
+        .returning(o.c.service_config_id, o.c.order_data)
+        .cte("upd_order")
+    )
+    order_data = upd_order.c.order_data
+    return (
+        update(usc)
+        .values(
+            valid_from_dttm=bindparam("b_valid_from_dttm"),
+            valid_to_dttm=bindparam("b_valid_to_dttm"),
+            config_price=cast(order_data["config_price"].as_string(), Float),
+            max_config_traffic=cast(
+                order_data["max_config_traffic"].as_string(), Float
+            ),
+        )
+        .where(usc.c.service_config_id == upd_order.c.service_config_id)
+        .returning(usc.c.service_config_id)
+    )
+
+
+Q_CLOSE_PAYED_ORDER = _close_payed_order_stmt()
+
+
 class ReturnCode(Enum):
     SUCCESS = 0
     UNIQUE_VIOLATION = -1
@@ -115,8 +206,46 @@ class DbManager:
             GOOD: rows_deleted > 0 => ReturnCode.SUCCESS
             BAD:  rows_deleted = 0 => ReturnCode.NOT_FOUND
             BAD:                      ReturnCode.DATABASE_ERROR
+
+    CACHES:
+        user_cache: user_tg_id => UserRecord, invalidated by the methods
+            changing the user row, expired after USER_CACHE_TTL_SEC for
+            changes made by other processes
+        admin_roster: tg ids of the admins, cleared by the methods changing
+            admin_flg and by listen_admin_roster() on NOTIFY of other
+            processes, expired after ADMIN_CACHE_TTL_SEC as a safety net
+        access_cache: (user_tg_id, access_name) => AccessRecord or None,
+            invalidated by the access methods, expired after
+            ACCESS_CACHE_TTL_SEC
+
+    UNIT OF WORK:
+        Inside DbManager.unit_of_work() the user, access, config and order
+        methods share one session and connection, writes are committed
+        when the block ends. Keep 3x-ui and Telegram calls out of the block:
+        the connection and the row locks are held until it ends. Out of it
+        every method runs in a session of its own, as do the port, key and
+        job methods always: their rows are taken by parallel updates and
+        jobs.
     """
 
+    user_cache = TtlLruCache(dbs.USER_CACHE_SIZE, dbs.USER_CACHE_TTL_SEC)
+    access_cache = TtlLruCache(dbs.USER_CACHE_SIZE, dbs.ACCESS_CACHE_TTL_SEC)
+    admin_roster = TtlLruCache(1, dbs.ADMIN_CACHE_TTL_SEC)
+
+    @staticmethod
+    def unit_of_work(snapshot: bool = False):
+        """
+        Args:
+            snapshot (bool): The reads share one snapshot (REPEATABLE READ)
+                instead of seeing the rows committed meanwhile
+                (default: False).
+        """
+        return unit_of_work(
+            dbs.uow_snapshot_session_factory
+            if snapshot
+            else dbs.uow_session_factory
+        )
+
     # Database init:
     @staticmethod
     def check_db_available():
@@ -331,6 +460,7 @@ class DbManager:
             self._db_init()
             Base.metadata.drop_all(dbs.admin_sync_engine)
             Base.metadata.create_all(dbs.admin_sync_engine)
+            self._db_migrate()
             if dbs.WRITE_LOGS_FLG:
                 self._create_log_triggers(model_log_list)
             self._db_add_wg_user()
@@ -343,16 +473,57 @@ class DbManager:
                 logger.warning(
                     f"SCHEMA {dbs.DEFAULT_SCHEMA_NAME} ALREADY EXIST! SKIP DB INIT..."
                 )
+                # New tables only, existing ones are migrated:
+                Base.metadata.create_all(dbs.admin_sync_engine)
+                self._db_migrate()
             else:
                 init()
 
         logger.info(f"^--------END_DB_INIT--------^")
 
+    #
+    @staticmethod
+    def _db_migrate():
+        """
+        Applies the migrations the schema has not seen, in order, in one
+        transaction: a failed migration leaves the schema as it was.
+        """
+        try:
+            with dbs.admin_session_factory() as session:
+                # One replica migrates at a time, the others wait:
+                session.execute(
+                    select(func.pg_advisory_xact_lock(MIGRATION_LOCK_ID))
+                )
+                q = select(SchemaMigrationStruct.version)
+                applied = set(session.scalars(q).all())
+                for migration in MIGRATIONS:
+                    if migration.version in applied:
+                        continue
+                    logger.info(
+                        f"APPLYING MIGRATION {migration.version}: "
+                        f"{migration.description.upper()}..."
+                    )
+                    session.execute(text(migration.sql))
+                    session.add(
+                        SchemaMigrationStruct(
+                            version=migration.version,
+                            description=migration.description,
+                        )
+                    )
+                session.commit()
+                logger.info(f"SCHEMA VERSION: {MIGRATIONS[-1].version}")
+        except Exception as e:
+            logger.error(f"DB ERROR: {e}")
+
     # Admins methods:
     @staticmethod
     async def get_admins() -> list[int]:
+        admins = DbManager.admin_roster.get(ADMIN_ROSTER_KEY)
+        if admins is not None:
+            return list(admins)
         try:
-            async with dbs.async_session_factory() as session:
+            async with use_session(dbs.async_session_factory) as session:
+                cacheable = fresh_snapshot()
                 q = (
                     select(UserStruct.user_tg_id)
                     .select_from(UserStruct)
@@ -360,22 +531,70 @@ class DbManager:
                 )
                 res = await session.scalars(q)
                 res_all = res.all()
+                if cacheable:
+                    DbManager.admin_roster.put(
+                        ADMIN_ROSTER_KEY, tuple(res_all)
+                    )
                 return res_all
         except Exception as e:
             raise e
 
+    #
+    @staticmethod
+    async def _notify_admin_roster(session):
+        # Delivered to the listeners of other replicas on commit:
+        await session.execute(select(func.pg_notify(ADMIN_ROSTER_CHANNEL, "")))
+
+    #
+    @staticmethod
+    async def listen_admin_roster(reconnect_sec: float = 5):
+        """
+        Clears the cached admin roster on NOTIFY of admin changes made by
+        other processes, forever. Reconnects after reconnect_sec.
+        """
+        dsn = dbs.async_engine.url.set(drivername="postgresql")
+        while True:
+            try:
+                conn = await asyncpg.connect(
+                    dsn.render_as_string(hide_password=False)
+                )
+                try:
+                    await conn.add_listener(
+                        ADMIN_ROSTER_CHANNEL,
+                        lambda *_: DbManager.admin_roster.clear(),
+                    )
+                    # The roster could change while not listening:
+                    DbManager.admin_roster.clear()
+                    logger.info("LISTENING TO ADMIN ROSTER CHANGES")
+                    while not conn.is_closed():
+                        await asyncio.sleep(reconnect_sec)
+                finally:
+                    await conn.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"BAD TRY TO LISTEN TO ADMIN ROSTER: {e}")
+            await asyncio.sleep(reconnect_sec)
+
     #
     @staticmethod
     async def upgrade_user(user_tg_id: int) -> ReturnCode:
         try:
-            async with dbs.async_session_factory() as session:
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
                 q = (
                     update(UserStruct)
                     .values(admin_flg=True)
                     .where(UserStruct.user_tg_id == user_tg_id)
                 )
                 res = await session.execute(q)
-                await session.commit()
+                await DbManager._notify_admin_roster(session)
+                await commit(session)
+                on_unit_end(
+                    partial(DbManager.user_cache.invalidate, user_tg_id)
+                )
+                on_unit_end(DbManager.admin_roster.clear)
                 return DBErrorHandler.upd_row_cnt_handler(res.rowcount)
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
@@ -384,14 +603,21 @@ class DbManager:
     @staticmethod
     async def downgrade_user(user_tg_id: int) -> ReturnCode:
         try:
-            async with dbs.async_session_factory() as session:
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
                 q = (
                     update(UserStruct)
                     .values(admin_flg=False)
                     .where(UserStruct.user_tg_id == user_tg_id)
                 )
                 res = await session.execute(q)
-                await session.commit()
+                await DbManager._notify_admin_roster(session)
+                await commit(session)
+                on_unit_end(
+                    partial(DbManager.user_cache.invalidate, user_tg_id)
+                )
+                on_unit_end(DbManager.admin_roster.clear)
                 return DBErrorHandler.upd_row_cnt_handler(res.rowcount)
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
@@ -400,28 +626,53 @@ class DbManager:
     @staticmethod
     async def add_user(user: UserStruct) -> ReturnCode:
         try:
-            async with dbs.async_session_factory() as session:
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
                 new_user = user
-                new_user.user_id = uuid.uuid5(
-                    uuid.NAMESPACE_DNS, str(user.user_tg_id)
-                )
+                new_user.user_id = make_user_id(user.user_tg_id)
+                # The attributes are expired by the commit:
+                user_tg_id = new_user.user_tg_id
+                is_admin = bool(new_user.admin_flg)
                 session.add(new_user)
-                await session.commit()
+                if is_admin:
+                    await DbManager._notify_admin_roster(session)
+                await commit(session)
+                on_unit_end(
+                    partial(DbManager.user_cache.invalidate, user_tg_id)
+                )
+                if is_admin:
+                    on_unit_end(DbManager.admin_roster.clear)
                 return DBErrorHandler.ins_row_cnt_handler(1)
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
 
     #
     @staticmethod
-    async def get_user(user_tg_id: int) -> UserStruct:
+    async def get_user(user_tg_id: int) -> UserRecord:
+        user = DbManager.user_cache.get(user_tg_id)
+        if user is not None:
+            return user
         try:
-            async with dbs.async_session_factory() as session:
-                q = select(UserStruct).where(
-                    UserStruct.user_tg_id == user_tg_id
-                )
-                res = await session.scalars(q)
+            async with use_session(dbs.async_session_factory) as session:
+                cacheable = fresh_snapshot()
+                q = select(
+                    UserStruct.user_id,
+                    UserStruct.user_tg_id,
+                    UserStruct.user_name,
+                    UserStruct.user_tag,
+                    UserStruct.admin_flg,
+                    UserStruct.lang_code,
+                ).where(UserStruct.user_tg_id == user_tg_id)
+                res = await session.execute(q)
                 res_fst = res.first()
-                return res_fst
+                if res_fst is None:
+                    # Unknown users are not cached, /start adds them:
+                    return None
+                user = UserRecord(*res_fst)
+                if cacheable:
+                    DbManager.user_cache.put(user_tg_id, user)
+                return user
         except Exception as e:
             raise e
 
@@ -431,22 +682,25 @@ class DbManager:
         user_tg_id: int, access_name: str
     ) -> ReturnCode:
         try:
-            async with dbs.async_session_factory() as session:
-                q = select(UserStruct.user_id).where(
-                    UserStruct.user_tg_id == user_tg_id
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
+                request_id = uuid.uuid5(
+                    uuid.NAMESPACE_DNS,
+                    access_name + str(make_user_id(user_tg_id)),
                 )
-                res = await session.scalars(q)
-                user_id = res.first()
-                access_request = UserAccReqStruct(
-                    request_id=uuid.uuid5(
-                        uuid.NAMESPACE_DNS, access_name + str(user_id)
-                    ),
-                    access_name=access_name,
-                    user_id=user_id,
+                # INSERT ... SELECT, the user is looked up by the insert:
+                q_ins_req = insert(UserAccReqStruct).from_select(
+                    ["request_id", "access_name", "user_id"],
+                    select(
+                        literal(request_id, Uuid),
+                        literal(access_name),
+                        UserStruct.user_id,
+                    ).where(UserStruct.user_tg_id == user_tg_id),
                 )
-                session.add(access_request)
-                await session.commit()
-                return DBErrorHandler.ins_row_cnt_handler(1)
+                res = await session.execute(q_ins_req)
+                await commit(session)
+                return DBErrorHandler.ins_row_cnt_handler(res.rowcount)
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
 
@@ -456,7 +710,7 @@ class DbManager:
         user_tg_id: int, access_name: str
     ) -> UserAccReqStruct:
         try:
-            async with dbs.async_session_factory() as session:
+            async with use_session(dbs.async_session_factory) as session:
                 u = aliased(UserStruct)
                 ura = aliased(UserAccReqStruct)
                 q = select(ura).join(
@@ -485,7 +739,7 @@ class DbManager:
         ]
         """
         try:
-            async with dbs.async_session_factory() as session:
+            async with use_session(dbs.async_session_factory) as session:
                 q = (
                     select(
                         UserStruct.user_tg_id,
@@ -512,36 +766,53 @@ class DbManager:
         user_tg_id: int, access_name: str, access_delta_days: int = 30
     ) -> ReturnCode:
         try:
-            async with dbs.async_session_factory() as session:
-                q = select(UserStruct.user_id).where(
-                    UserStruct.user_tg_id == user_tg_id
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
+                access_id = uuid.uuid5(
+                    uuid.NAMESPACE_DNS,
+                    access_name + str(make_user_id(user_tg_id)),
                 )
-                res = await session.scalars(q)
-                user_id = res.first()
-
-                q_del_req_acc = delete(UserAccReqStruct).where(
-                    and_(
-                        UserAccReqStruct.access_name == access_name,
-                        UserAccReqStruct.user_id == user_id,
+                # The request is deleted and the access is inserted by one
+                # statement, no access without a request:
+                del_req_acc = (
+                    delete(UserAccReqStruct)
+                    .where(
+                        and_(
+                            UserAccReqStruct.access_name == access_name,
+                            UserAccReqStruct.user_id
+                            == sel_user_id(user_tg_id),
+                        )
                     )
+                    .returning(UserAccReqStruct.user_id)
+                    .cte("del_req_acc")
                 )
-                res_1 = await session.execute(q_del_req_acc)
-                if res_1.rowcount > 0:
-                    access = UserAccStruct(
-                        access_id=uuid.uuid5(
-                            uuid.NAMESPACE_DNS, access_name + str(user_id)
-                        ),
-                        access_name=access_name,
-                        user_id=user_id,
-                        valid_from_dttm=now_dttm(),
-                        valid_to_dttm=now_dttm()
-                        + timedelta(access_delta_days),
+                q_ins_acc = insert(UserAccStruct).from_select(
+                    [
+                        "access_id",
+                        "access_name",
+                        "user_id",
+                        "valid_from_dttm",
+                        "valid_to_dttm",
+                    ],
+                    select(
+                        literal(access_id, Uuid),
+                        literal(access_name),
+                        del_req_acc.c.user_id,
+                        literal(now_dttm()),
+                        literal(now_dttm() + timedelta(access_delta_days)),
+                    ),
+                )
+                res = await session.execute(q_ins_acc)
+                await commit(session)
+                on_unit_end(
+                    partial(
+                        DbManager.access_cache.invalidate,
+                        (user_tg_id, access_name),
                     )
-                    session.add(access)
-                    await session.commit()
-                    return DBErrorHandler.ins_row_cnt_handler(1)
-                else:
-                    return ReturnCode.NOT_FOUND
+                )
+                # No deleted request, nothing inserted:
+                return DBErrorHandler.upd_row_cnt_handler(res.rowcount)
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
 
@@ -549,7 +820,7 @@ class DbManager:
     @staticmethod
     async def get_access(user_tg_id: int, access_name: str) -> UserAccStruct:
         try:
-            async with dbs.async_session_factory() as session:
+            async with use_session(dbs.async_session_factory) as session:
                 u = aliased(UserStruct)
                 ua = aliased(UserAccStruct)
                 q = select(ua).join(
@@ -566,51 +837,97 @@ class DbManager:
         except Exception as e:
             raise e
 
+    #
+    @staticmethod
+    async def get_access_record(
+        user_tg_id: int, access_name: str
+    ) -> AccessRecord:
+        """
+        Returns the validity of the access, None if there is no access.
+        Served from access_cache, checked on every update.
+        """
+        key = (user_tg_id, access_name)
+        access = DbManager.access_cache.get(key, NOT_CACHED)
+        if access is not NOT_CACHED:
+            return access
+        try:
+            async with use_session(dbs.async_session_factory) as session:
+                cacheable = fresh_snapshot()
+                q = (
+                    select(
+                        UserAccStruct.access_name,
+                        UserAccStruct.valid_from_dttm,
+                        UserAccStruct.valid_to_dttm,
+                    )
+                    .join(
+                        UserStruct,
+                        UserStruct.user_id == UserAccStruct.user_id,
+                    )
+                    .where(
+                        and_(
+                            UserStruct.user_tg_id == user_tg_id,
+                            UserAccStruct.access_name == access_name,
+                        )
+                    )
+                )
+                res = await session.execute(q)
+                res_fst = res.first()
+                access = AccessRecord(*res_fst) if res_fst else None
+                if cacheable:
+                    DbManager.access_cache.put(key, access)
+                return access
+        except Exception as e:
+            raise e
+
     #
     @staticmethod
     async def update_access(
         user_tg_id: int, access_name: str, access_delta_days: int = None
     ) -> ReturnCode:
         try:
-            async with dbs.async_session_factory() as session:
-                q_sel_user = select(UserStruct.user_id).where(
-                    UserStruct.user_tg_id == user_tg_id
-                )
-                res = await session.scalars(q_sel_user)
-                user_id = res.first()
-
-                q_del_req_acc = delete(UserAccReqStruct).where(
-                    and_(
-                        UserAccReqStruct.access_name == access_name,
-                        UserAccReqStruct.user_id == user_id,
-                    )
-                )
-                res_1 = await session.execute(q_del_req_acc)
-
-                if res_1.rowcount > 0:
-                    q_upd_acc = (
-                        update(UserAccStruct)
-                        .values(
-                            valid_from_dttm=now_dttm(),
-                            valid_to_dttm=now_dttm()
-                            + timedelta(
-                                30
-                                if access_delta_days == None
-                                else access_delta_days
-                            ),
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
+                del_req_acc = (
+                    delete(UserAccReqStruct)
+                    .where(
+                        and_(
+                            UserAccReqStruct.access_name == access_name,
+                            UserAccReqStruct.user_id
+                            == sel_user_id(user_tg_id),
                         )
-                        .where(
-                            and_(
-                                UserAccStruct.access_name == access_name,
-                                UserAccStruct.user_id == user_id,
-                            )
+                    )
+                    .returning(UserAccReqStruct.user_id)
+                    .cte("del_req_acc")
+                )
+                # UPDATE ... FROM the deleted request:
+                q_upd_acc = (
+                    update(UserAccStruct)
+                    .values(
+                        valid_from_dttm=now_dttm(),
+                        valid_to_dttm=now_dttm()
+                        + timedelta(
+                            30
+                            if access_delta_days == None
+                            else access_delta_days
+                        ),
+                    )
+                    .where(
+                        and_(
+                            UserAccStruct.access_name == access_name,
+                            UserAccStruct.user_id == del_req_acc.c.user_id,
                         )
                     )
-                    res_2 = await session.execute(q_upd_acc)
-                    await session.commit()
-                    return DBErrorHandler.upd_row_cnt_handler(res_2.rowcount)
-                else:
-                    return ReturnCode.NOT_FOUND
+                )
+                res = await session.execute(q_upd_acc)
+                await commit(session)
+                on_unit_end(
+                    partial(
+                        DbManager.access_cache.invalidate,
+                        (user_tg_id, access_name),
+                    )
+                )
+                return DBErrorHandler.upd_row_cnt_handler(res.rowcount)
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
 
@@ -618,13 +935,9 @@ class DbManager:
     @staticmethod
     async def block_access(user_tg_id: int, access_name: str) -> ReturnCode:
         try:
-            async with dbs.async_session_factory() as session:
-                q_sel_user = select(UserStruct.user_id).where(
-                    UserStruct.user_tg_id == user_tg_id
-                )
-                res = await session.scalars(q_sel_user)
-                user_id = res.first()
-
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
                 q_upd_acc = (
                     update(UserAccStruct)
                     .values(
@@ -634,12 +947,18 @@ class DbManager:
                     .where(
                         and_(
                             UserAccStruct.access_name == access_name,
-                            UserAccStruct.user_id == user_id,
+                            UserAccStruct.user_id == sel_user_id(user_tg_id),
                         )
                     )
                 )
                 res_2 = await session.execute(q_upd_acc)
-                await session.commit()
+                await commit(session)
+                on_unit_end(
+                    partial(
+                        DbManager.access_cache.invalidate,
+                        (user_tg_id, access_name),
+                    )
+                )
                 return DBErrorHandler.upd_row_cnt_handler(res_2.rowcount)
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
@@ -648,21 +967,23 @@ class DbManager:
     @staticmethod
     async def delete_access(user_tg_id: int, access_name: str) -> ReturnCode:
         try:
-            async with dbs.async_session_factory() as session:
-                q_sel_user = select(UserStruct.user_id).where(
-                    UserStruct.user_tg_id == user_tg_id
-                )
-                res = await session.scalars(q_sel_user)
-                user_id = res.first()
-
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
                 q_upd_acc = delete(UserAccStruct).where(
                     and_(
                         UserAccStruct.access_name == access_name,
-                        UserAccStruct.user_id == user_id,
+                        UserAccStruct.user_id == sel_user_id(user_tg_id),
                     )
                 )
                 res_2 = await session.execute(q_upd_acc)
-                await session.commit()
+                await commit(session)
+                on_unit_end(
+                    partial(
+                        DbManager.access_cache.invalidate,
+                        (user_tg_id, access_name),
+                    )
+                )
                 return DBErrorHandler.del_row_cnt_handler(res_2.rowcount)
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
@@ -676,38 +997,56 @@ class DbManager:
         config_price: float = 100,
         max_config_traffic: float = 100,
         expired_delta_days: int = 30,
+        cached_data: dict = None,
+        node_name: str = None,
     ) -> ReturnCode:
         try:
-            async with dbs.async_session_factory() as session:
-                q_sel_usr = select(UserStruct.user_id).where(
-                    UserStruct.user_tg_id == user_tg_id
-                )
-                res = await session.scalars(q_sel_usr)
-                user_id = res.first()
-
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
                 # Init dates:
                 valid_from_dttm = now_dttm()
                 valid_to_dttm = now_dttm() + timedelta(expired_delta_days)
 
                 # Init hash-keys:
                 service_config_id = uuid.uuid5(
-                    uuid.NAMESPACE_DNS, str(user_id) + str(config_name)
+                    uuid.NAMESPACE_DNS,
+                    str(make_user_id(user_tg_id)) + str(config_name),
                 )
 
-                # Make new service config:
-                user_service_config = UserServConfStruct(
-                    service_config_id=service_config_id,
-                    user_id=user_id,
-                    config_name=config_name,
-                    config_price=config_price,
-                    max_config_traffic=max_config_traffic,
-                    user_service_id=user_service_id,
-                    valid_from_dttm=valid_from_dttm,
-                    valid_to_dttm=valid_to_dttm,
+                # Make new service config, INSERT ... SELECT of the user:
+                usc = UserServConfStruct
+                q_ins_serv_conf = insert(usc).from_select(
+                    [
+                        "service_config_id",
+                        "user_id",
+                        "config_name",
+                        "config_price",
+                        "max_config_traffic",
+                        "user_service_id",
+                        "node_name",
+                        "cached_data",
+                        "valid_from_dttm",
+                        "valid_to_dttm",
+                    ],
+                    select(
+                        literal(service_config_id, Uuid),
+                        UserStruct.user_id,
+                        literal(config_name),
+                        literal(config_price, usc.config_price.type),
+                        literal(
+                            max_config_traffic, usc.max_config_traffic.type
+                        ),
+                        literal(user_service_id, Uuid),
+                        literal(node_name, usc.node_name.type),
+                        literal(cached_data, usc.cached_data.type),
+                        literal(valid_from_dttm),
+                        literal(valid_to_dttm),
+                    ).where(UserStruct.user_tg_id == user_tg_id),
                 )
-                session.add(user_service_config)
-                await session.commit()
-                return DBErrorHandler.ins_row_cnt_handler(1)
+                res = await session.execute(q_ins_serv_conf)
+                await commit(session)
+                return DBErrorHandler.ins_row_cnt_handler(res.rowcount)
 
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
@@ -718,7 +1057,7 @@ class DbManager:
         user_tg_id: int, config_name: str
     ) -> UserServConfStruct:
         try:
-            async with dbs.async_session_factory() as session:
+            async with use_session(dbs.async_session_factory) as session:
                 u = aliased(UserStruct)
                 ua = aliased(UserServConfStruct)
                 q = select(ua).join(
@@ -741,23 +1080,32 @@ class DbManager:
         user_tg_id: int, config_name: str
     ) -> UserServConfStruct:
         try:
-            async with dbs.async_session_factory() as session:
-                u = aliased(UserStruct)
-                ua = aliased(UserServConfStruct)
-                q = select(ua).join(
-                    u,
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
+                usc = UserServConfStruct
+                sel_usc_id = select(usc.service_config_id).where(
                     and_(
-                        u.user_id == ua.user_id,
-                        u.user_tg_id == user_tg_id,
-                        ua.config_name == config_name,
-                    ),
+                        usc.user_id == sel_user_id(user_tg_id),
+                        usc.config_name == config_name,
+                    )
                 )
-                res = await session.scalars(q)
-                user_service_config = res.first()
-
-                await session.delete(user_service_config)
-                await session.commit()
-                return DBErrorHandler.del_row_cnt_handler(1)
+                # The orders are deleted by the same statement (the ORM
+                # cascade of session.delete):
+                del_orders = (
+                    delete(OrderStruct)
+                    .where(OrderStruct.service_config_id.in_(sel_usc_id))
+                    .returning(OrderStruct.order_id)
+                    .cte("del_orders")
+                )
+                q_del_serv_conf = (
+                    delete(usc)
+                    .where(usc.service_config_id.in_(sel_usc_id))
+                    .add_cte(del_orders)
+                )
+                res = await session.execute(q_del_serv_conf)
+                await commit(session)
+                return DBErrorHandler.del_row_cnt_handler(res.rowcount)
         except Exception as e:
             raise e
 
@@ -765,7 +1113,7 @@ class DbManager:
     @staticmethod
     async def get_service_configs(user_tg_id: int) -> list[UserServConfStruct]:
         try:
-            async with dbs.async_session_factory() as session:
+            async with use_session(dbs.async_session_factory) as session:
                 u = aliased(UserStruct)
                 ua = aliased(UserServConfStruct)
                 q = (
@@ -796,13 +1144,9 @@ class DbManager:
         expired_delta_days: int = None,
     ) -> UserServConfStruct:
         try:
-            async with dbs.async_session_factory() as session:
-                q_sel_usr = select(UserStruct.user_id).where(
-                    UserStruct.user_tg_id == user_tg_id
-                )
-                res = await session.scalars(q_sel_usr)
-                user_id = res.first()
-
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
                 update_values = {}
                 if config_price is not None:
                     update_values["config_price"] = config_price
@@ -822,162 +1166,293 @@ class DbManager:
                     .values(**update_values)
                     .where(
                         and_(
-                            UserServConfStruct.user_id == user_id,
+                            UserServConfStruct.user_id
+                            == sel_user_id(user_tg_id),
                             UserServConfStruct.config_name == config_name,
                         )
                     )
                 )
                 res_2 = await session.execute(q_upd_serv_conf)
-                await session.commit()
+                await commit(session)
                 return DBErrorHandler.upd_row_cnt_handler(res_2.rowcount)
         except Exception as e:
             raise e
 
-    # Order methods:
+    #
     @staticmethod
-    async def add_order(
-        user_tg_id: int,
-        config_name: str,
-        order_status: str = "NEW",
-        expired_delta_days: int = 30,
+    async def update_service_configs_cached_data(
+        cached_data_by_config: dict[str, dict],
     ) -> ReturnCode:
+        """
+        cached_data_by_config: {config_name: cached_data} of many configs
+        """
         try:
+            if not cached_data_by_config:
+                return ReturnCode.SUCCESS
             async with dbs.async_session_factory() as session:
-                q_sel_usr = select(UserStruct.user_id).where(
-                    UserStruct.user_tg_id == user_tg_id
-                )
-                res = await session.scalars(q_sel_usr)
-                user_id = res.first()
-
-                q_sel_serv_conf = select(UserServConfStruct).where(
-                    and_(
-                        UserServConfStruct.config_name == config_name,
-                        UserServConfStruct.user_id == user_id,
+                serv_conf = UserServConfStruct.__table__
+                q_upd_serv_conf = (
+                    update(serv_conf)
+                    .values(cached_data=bindparam("b_cached_data"))
+                    .where(
+                        serv_conf.c.config_name == bindparam("b_config_name")
                     )
                 )
-                res = await session.scalars(q_sel_serv_conf)
-                user_serv_conf = res.first()
-
-                q_sel_n_ords = select(OrderStruct.order_id).where(
-                    and_(
-                        OrderStruct.service_config_id
-                        == user_serv_conf.service_config_id,
-                        OrderStruct.user_id == user_id,
-                        or_(
-                            OrderStruct.order_status == "NEW",
-                            OrderStruct.order_status == "PAYED",
-                        ),
-                    )
+                # One executemany round-trip for all configs:
+                await session.execute(
+                    q_upd_serv_conf,
+                    [
+                        {"b_config_name": name, "b_cached_data": data}
+                        for name, data in cached_data_by_config.items()
+                    ],
                 )
-                res = await session.scalars(q_sel_n_ords)
-                n_order_id = res.first()
-
-                if n_order_id:
-                    logger.error(
-                        'order_status IN "NEW" OR "PAYED" STATUS WAS FOUND. CLOSE THEM FIRST'
-                    )
-                    return ReturnCode.UNIQUE_VIOLATION
-                else:
-                    order_id = uuid.uuid5(
-                        uuid.NAMESPACE_DNS,
-                        str(user_id)
-                        + str(user_serv_conf.service_config_id)
-                        + str(now_dttm()),
-                    )
-
-                    if user_serv_conf.service_config_id:
-                        order = OrderStruct(
-                            order_id=order_id,
-                            order_status=order_status,
-                            user_id=user_id,
-                            service_config_id=user_serv_conf.service_config_id,
-                            order_data={
-                                "config_name": user_serv_conf.config_name,
-                                "config_price": user_serv_conf.config_price,
-                                "max_config_traffic": user_serv_conf.max_config_traffic,
-                                "expired_delta_days": expired_delta_days,
-                            },
-                        )
-                        session.add(order)
-                        await session.commit()
-                        return DBErrorHandler.ins_row_cnt_handler(1)
-                    else:
-                        return ReturnCode.NOT_FOUND
+                await session.commit()
+                return ReturnCode.SUCCESS
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
 
     #
     @staticmethod
-    async def get_order(
-        user_tg_id: int, config_name: str, order_status: str = "NEW"
-    ) -> OrderStruct:
+    async def stream_service_configs(batch_size: int = 1000):
+        """
+        Yields rows (config_name, user_tg_id, user_service_id, node_name,
+        valid_to_dttm) of all configs ordered bytewise by config_name,
+        fetched from a server-side cursor batch_size rows at a time.
+        """
         try:
             async with dbs.async_session_factory() as session:
-                u = aliased(UserStruct)
-                ua = aliased(UserServConfStruct)
-                q = select(ua).join(
-                    u,
-                    and_(
-                        u.user_id == ua.user_id,
-                        u.user_tg_id == user_tg_id,
-                        ua.config_name == config_name,
-                    ),
-                )
-                res = await session.scalars(q)
-                user_service_config = res.first()
-
-                if user_service_config:
-                    q_sel_ord = select(OrderStruct).where(
-                        and_(
-                            OrderStruct.user_id == user_service_config.user_id,
-                            OrderStruct.service_config_id
-                            == user_service_config.service_config_id,
-                            OrderStruct.order_status == order_status,
-                        )
+                q = (
+                    select(
+                        UserServConfStruct.config_name,
+                        UserStruct.user_tg_id,
+                        UserServConfStruct.user_service_id,
+                        UserServConfStruct.node_name,
+                        UserServConfStruct.valid_to_dttm,
                     )
-                    res = await session.scalars(q_sel_ord)
-                    order = res.first()
-                    return order
-                else:
-                    return None
+                    .join(
+                        UserStruct,
+                        UserStruct.user_id == UserServConfStruct.user_id,
+                    )
+                    # Same order as python str comparison:
+                    .order_by(UserServConfStruct.config_name.collate("C"))
+                    .execution_options(yield_per=batch_size)
+                )
+                res = await session.stream(q)
+                async for row in res:
+                    yield row
         except Exception as e:
             raise e
 
     #
     @staticmethod
-    async def get_orders(user_tg_id: int) -> list[OrderStruct]:
+    async def get_service_config_node_names(
+        config_names: list[str],
+    ) -> dict[str, str]:
+        """
+        Returns {config_name: node_name} of the existing configs.
+        """
         try:
             async with dbs.async_session_factory() as session:
-                q_sel_usr = select(UserStruct.user_id).where(
-                    UserStruct.user_tg_id == user_tg_id
-                )
-                res = await session.scalars(q_sel_usr)
-                user_id = res.first()
-
-                q_sel_ord = select(OrderStruct).where(
-                    OrderStruct.user_id == user_id
-                )
-                res = await session.scalars(q_sel_ord)
-                orders = res.all()
-                return orders
+                q = select(
+                    UserServConfStruct.config_name,
+                    UserServConfStruct.node_name,
+                ).where(UserServConfStruct.config_name.in_(config_names))
+                res = await session.execute(q)
+                return dict(res.all())
         except Exception as e:
             raise e
 
+    #
     @staticmethod
-    async def get_oders_hist(
-        user_tg_id: int, limit: int = 2
-    ) -> list[OrderStruct]:
+    async def get_sub_configs(user_tg_id: int) -> list[tuple]:
+        """
+        Returns rows (config_name, cached_data, valid_to_dttm) of the
+        active configs of the user ordered by config_name.
+        """
         try:
             async with dbs.async_session_factory() as session:
-                q_sel_usr = select(UserStruct.user_id).where(
-                    UserStruct.user_tg_id == user_tg_id
+                q = (
+                    select(
+                        UserServConfStruct.config_name,
+                        UserServConfStruct.cached_data,
+                        UserServConfStruct.valid_to_dttm,
+                    )
+                    .join(
+                        UserStruct,
+                        UserStruct.user_id == UserServConfStruct.user_id,
+                    )
+                    .where(
+                        and_(
+                            UserStruct.user_tg_id == user_tg_id,
+                            UserServConfStruct.valid_to_dttm > now_dttm(),
+                        )
+                    )
+                    .order_by(UserServConfStruct.config_name)
+                )
+                res = await session.execute(q)
+                return res.all()
+        except Exception as e:
+            raise e
+
+    # Order methods:
+    @staticmethod
+    async def add_order(
+        user_tg_id: int,
+        config_name: str,
+        order_status: str = "NEW",
+        expired_delta_days: int = 30,
+    ) -> ReturnCode:
+        try:
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
+                user_id = make_user_id(user_tg_id)
+                service_config_id = uuid.uuid5(
+                    uuid.NAMESPACE_DNS, str(user_id) + str(config_name)
+                )
+                order_id = uuid.uuid5(
+                    uuid.NAMESPACE_DNS,
+                    str(user_id) + str(service_config_id) + str(now_dttm()),
+                )
+
+                o = aliased(OrderStruct)
+                u = aliased(UserStruct)
+                usc = aliased(UserServConfStruct)
+                # The config with a flag of its open order:
+                serv_conf = (
+                    select(
+                        usc.service_config_id,
+                        usc.user_id,
+                        usc.config_name,
+                        usc.config_price,
+                        usc.max_config_traffic,
+                        select(o.order_id)
+                        .where(
+                            and_(
+                                o.service_config_id == usc.service_config_id,
+                                o.user_id == usc.user_id,
+                                o.order_status.in_(["NEW", "PAYED"]),
+                            )
+                        )
+                        .exists()
+                        .label("has_open_order"),
+                    )
+                    .join(
+                        u,
+                        and_(
+                            u.user_id == usc.user_id,
+                            u.user_tg_id == user_tg_id,
+                            usc.config_name == config_name,
+                        ),
+                    )
+                    .cte("serv_conf")
+                )
+                ins_order = (
+                    insert(OrderStruct)
+                    .from_select(
+                        [
+                            "order_id",
+                            "order_status",
+                            "user_id",
+                            "service_config_id",
+                            "order_data",
+                        ],
+                        select(
+                            literal(order_id, Uuid),
+                            literal(order_status),
+                            serv_conf.c.user_id,
+                            serv_conf.c.service_config_id,
+                            func.json_build_object(
+                                "config_name",
+                                serv_conf.c.config_name,
+                                "config_price",
+                                serv_conf.c.config_price,
+                                "max_config_traffic",
+                                serv_conf.c.max_config_traffic,
+                                "expired_delta_days",
+                                expired_delta_days,
+                            ),
+                        ).where(serv_conf.c.has_open_order == False),
+                    )
+                    .returning(OrderStruct.order_id)
+                    .cte("ins_order")
+                )
+                # One statement: the lookup, the check and the insert:
+                q = select(serv_conf.c.has_open_order).add_cte(ins_order)
+                res = await session.scalars(q)
+                has_open_order = res.first()
+                await commit(session)
+
+                if has_open_order is None:
+                    return ReturnCode.NOT_FOUND
+                elif has_open_order:
+                    logger.error(
+                        'order_status IN "NEW" OR "PAYED" STATUS WAS FOUND. CLOSE THEM FIRST'
+                    )
+                    return ReturnCode.UNIQUE_VIOLATION
+                else:
+                    return DBErrorHandler.ins_row_cnt_handler(1)
+        except Exception as e:
+            return DBErrorHandler.handle_exception(e)
+
+    #
+    @staticmethod
+    async def get_order(
+        user_tg_id: int, config_name: str, order_status: str = "NEW"
+    ) -> OrderStruct:
+        try:
+            async with use_session(dbs.async_session_factory) as session:
+                u = aliased(UserStruct)
+                ua = aliased(UserServConfStruct)
+                q = (
+                    select(OrderStruct)
+                    .join(
+                        ua,
+                        and_(
+                            ua.service_config_id
+                            == OrderStruct.service_config_id,
+                            ua.user_id == OrderStruct.user_id,
+                            ua.config_name == config_name,
+                        ),
+                    )
+                    .join(
+                        u,
+                        and_(
+                            u.user_id == ua.user_id,
+                            u.user_tg_id == user_tg_id,
+                        ),
+                    )
+                    .where(OrderStruct.order_status == order_status)
                 )
-                res = await session.scalars(q_sel_usr)
-                user_id = res.first()
+                res = await session.scalars(q)
+                order = res.first()
+                return order
+        except Exception as e:
+            raise e
 
+    #
+    @staticmethod
+    async def get_orders(user_tg_id: int) -> list[OrderStruct]:
+        try:
+            async with use_session(dbs.async_session_factory) as session:
+                q_sel_ord = select(OrderStruct).where(
+                    OrderStruct.user_id == sel_user_id(user_tg_id)
+                )
+                res = await session.scalars(q_sel_ord)
+                orders = res.all()
+                return orders
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    async def get_oders_hist(
+        user_tg_id: int, limit: int = 2
+    ) -> list[OrderStruct]:
+        try:
+            async with use_session(dbs.async_session_factory) as session:
                 q_sel_ord = (
                     select(OrderStruct)
-                    .where(OrderStruct.user_id == user_id)
+                    .where(OrderStruct.user_id == sel_user_id(user_tg_id))
                     .order_by(desc(OrderStruct.sys_updated_dttm))
                     .limit(limit)
                 )
@@ -999,7 +1474,7 @@ class DbManager:
         ]
         """
         try:
-            async with dbs.async_session_factory() as session:
+            async with use_session(dbs.async_session_factory) as session:
                 o = aliased(OrderStruct)
                 u = aliased(UserStruct)
                 q_sel_ord = (
@@ -1034,34 +1509,29 @@ class DbManager:
         new_order_status: str,
     ) -> ReturnCode:
         try:
-            async with dbs.async_session_factory() as session:
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
                 u = aliased(UserStruct)
                 ua = aliased(UserServConfStruct)
-                q = select(ua).join(
-                    u,
-                    and_(
-                        u.user_id == ua.user_id,
-                        u.user_tg_id == user_tg_id,
-                        ua.config_name == config_name,
-                    ),
-                )
-                res = await session.scalars(q)
-                user_service_config = res.first()
-
+                # UPDATE ... FROM the config and the user:
                 q_upd_order = (
                     update(OrderStruct)
                     .values(order_status=new_order_status)
                     .where(
                         and_(
-                            OrderStruct.user_id == user_service_config.user_id,
+                            OrderStruct.user_id == ua.user_id,
                             OrderStruct.service_config_id
-                            == user_service_config.service_config_id,
+                            == ua.service_config_id,
                             OrderStruct.order_status == old_order_status,
+                            ua.config_name == config_name,
+                            u.user_id == ua.user_id,
+                            u.user_tg_id == user_tg_id,
                         )
                     )
                 )
                 res_2 = await session.execute(q_upd_order)
-                await session.commit()
+                await commit(session)
                 return DBErrorHandler.upd_row_cnt_handler(res_2.rowcount)
 
         except Exception as e:
@@ -1074,120 +1544,677 @@ class DbManager:
         """
         1. update order status
         2. update service config
-        ?3. try to update service
+        in one UPDATE ... RETURNING statement (Q_CLOSE_PAYED_ORDER)
         """
         try:
-            async with dbs.async_session_factory() as session:
-                o = aliased(OrderStruct)
-                u = aliased(UserStruct)
-                usc = aliased(UserServConfStruct)
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
+                res = await session.execute(
+                    Q_CLOSE_PAYED_ORDER,
+                    {
+                        "b_user_tg_id": user_tg_id,
+                        "b_config_name": config_name,
+                        "b_valid_from_dttm": now_dttm(),
+                        "b_valid_to_dttm": now_dttm()
+                        + timedelta(expired_delta_days),
+                    },
+                )
+                closed_ids = res.scalars().all()
+                await commit(session)
+                return DBErrorHandler.upd_row_cnt_handler(len(closed_ids))
 
-                sel_order = select(o).join(
-                    u,
+        except Exception as e:
+            return DBErrorHandler.handle_exception(e)
+
+    #
+    @staticmethod
+    async def delete_order(
+        user_tg_id: int, config_name: str, order_status: str
+    ) -> ReturnCode:
+        try:
+            async with use_session(
+                dbs.async_session_factory, write=True
+            ) as session:
+                u = aliased(UserStruct)
+                ua = aliased(UserServConfStruct)
+                # DELETE ... USING the config and the user:
+                q_upd_order = delete(OrderStruct).where(
                     and_(
-                        u.user_id == o.user_id,
+                        OrderStruct.user_id == ua.user_id,
+                        OrderStruct.service_config_id == ua.service_config_id,
+                        OrderStruct.order_status == order_status,
+                        ua.config_name == config_name,
+                        u.user_id == ua.user_id,
                         u.user_tg_id == user_tg_id,
-                        o.order_status == "PAYED",
-                        cast(o.order_data["config_name"], String)
-                        == f'"{config_name}"',
-                    ),
+                    )
                 )
-                order_res = await session.scalars(sel_order)
-                order = order_res.first()
+                res_2 = await session.execute(q_upd_order)
+                await commit(session)
+                return DBErrorHandler.del_row_cnt_handler(res_2.rowcount)
 
-                order_config_price = order.order_data["config_price"]
-                order_max_config_traffic = order.order_data[
-                    "max_config_traffic"
-                ]
+        except Exception as e:
+            return DBErrorHandler.handle_exception(e)
 
-                sel_usr_conf = select(usc).join(
-                    u,
-                    and_(
-                        u.user_id == usc.user_id,
-                        u.user_tg_id == user_tg_id,
-                        usc.config_name == config_name,
-                    ),
+    # Vless port methods:
+    @staticmethod
+    async def init_vless_ports(first_port: int, last_port: int) -> ReturnCode:
+        try:
+            async with dbs.async_session_factory() as session:
+                q = (
+                    insert(VlessPortStruct)
+                    .values(
+                        [
+                            {"port": port}
+                            for port in range(first_port, last_port + 1)
+                        ]
+                    )
+                    .on_conflict_do_nothing(index_elements=["port"])
                 )
-                usr_conf_res = await session.scalars(sel_usr_conf)
-                user_service_config = usr_conf_res.first()
+                res = await session.execute(q)
+                await session.commit()
+                logger.debug(f"VLESS PORTS ADDED: {res.rowcount}")
+                return ReturnCode.SUCCESS
+        except Exception as e:
+            return DBErrorHandler.handle_exception(e)
 
-                q_upd_order = (
-                    update(o)
-                    .values(order_status="CLOSED")
+    #
+    @staticmethod
+    async def reserve_vless_port(
+        inbound_remark: str, first_port: int, last_port: int
+    ) -> int:
+        """
+        Reserve the lowest free port of the range for the inbound.
+        Returns the already reserved port if the inbound has one,
+        None if the range is exhausted.
+        """
+        try:
+            async with dbs.async_session_factory() as session:
+                q_sel_port = select(VlessPortStruct.port).where(
+                    VlessPortStruct.inbound_remark == inbound_remark
+                )
+                res = await session.scalars(q_sel_port)
+                port = res.first()
+                if port:
+                    return port
+
+                # Concurrent reservations skip each other's locked rows:
+                q_free_port = (
+                    select(VlessPortStruct.port)
                     .where(
                         and_(
-                            o.user_id == user_service_config.user_id,
-                            o.service_config_id
-                            == user_service_config.service_config_id,
-                            o.order_status == "PAYED",
+                            VlessPortStruct.inbound_remark.is_(None),
+                            VlessPortStruct.port.between(
+                                first_port, last_port
+                            ),
                         )
                     )
+                    .order_by(VlessPortStruct.port)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                    .scalar_subquery()
                 )
-
-                q_upd_serv_conf = (
-                    update(usc)
+                q_upd_port = (
+                    update(VlessPortStruct)
                     .values(
-                        valid_from_dttm=now_dttm(),
-                        valid_to_dttm=now_dttm()
-                        + timedelta(expired_delta_days),
-                        config_price=order_config_price,
-                        max_config_traffic=order_max_config_traffic,
+                        inbound_remark=inbound_remark,
+                        reserved_dttm=now_dttm(),
+                    )
+                    .where(VlessPortStruct.port == q_free_port)
+                    .returning(VlessPortStruct.port)
+                )
+                res = await session.scalars(q_upd_port)
+                port = res.first()
+                await session.commit()
+                return port
+        except IntegrityError:
+            # The same inbound reserved a port in a parallel transaction:
+            async with dbs.async_session_factory() as session:
+                res = await session.scalars(q_sel_port)
+                return res.first()
+        except Exception as e:
+            raise e
+
+    #
+    @staticmethod
+    async def get_reserved_vless_port(inbound_remark: str) -> int:
+        try:
+            async with dbs.async_session_factory() as session:
+                q = select(VlessPortStruct.port).where(
+                    VlessPortStruct.inbound_remark == inbound_remark
+                )
+                res = await session.scalars(q)
+                return res.first()
+        except Exception as e:
+            raise e
+
+    #
+    @staticmethod
+    async def count_free_vless_ports(first_port: int, last_port: int) -> int:
+        try:
+            async with dbs.async_session_factory() as session:
+                q = select(func.count()).where(
+                    and_(
+                        VlessPortStruct.inbound_remark.is_(None),
+                        VlessPortStruct.port.between(first_port, last_port),
                     )
+                )
+                res = await session.scalars(q)
+                return res.first()
+        except Exception as e:
+            raise e
+
+    #
+    @staticmethod
+    async def release_vless_port(inbound_remark: str) -> ReturnCode:
+        try:
+            async with dbs.async_session_factory() as session:
+                q = (
+                    update(VlessPortStruct)
+                    .values(inbound_remark=None, reserved_dttm=None)
+                    .where(VlessPortStruct.inbound_remark == inbound_remark)
+                )
+                res = await session.execute(q)
+                await session.commit()
+                return DBErrorHandler.upd_row_cnt_handler(res.rowcount)
+        except Exception as e:
+            return DBErrorHandler.handle_exception(e)
+
+    #
+    @staticmethod
+    async def sync_vless_ports(
+        used_ports: dict[int, str], first_port: int, last_port: int
+    ) -> ReturnCode:
+        """
+        used_ports: {port: inbound_remark} of the inbounds existed on panel
+        """
+        try:
+            async with dbs.async_session_factory() as session:
+                q_release = (
+                    update(VlessPortStruct)
+                    .values(inbound_remark=None, reserved_dttm=None)
                     .where(
                         and_(
-                            usc.user_id == user_service_config.user_id,
-                            usc.service_config_id
-                            == user_service_config.service_config_id,
+                            VlessPortStruct.inbound_remark.is_not(None),
+                            VlessPortStruct.port.between(
+                                first_port, last_port
+                            ),
+                            VlessPortStruct.port.not_in(list(used_ports)),
                         )
                     )
                 )
-                upd_order_resp = await session.execute(q_upd_order)
-                upd_serv_conf_resp = await session.execute(q_upd_serv_conf)
+                await session.execute(q_release)
+
+                used_ports = {
+                    port: remark
+                    for port, remark in used_ports.items()
+                    if first_port <= port <= last_port
+                }
+                if used_ports:
+                    # Free remarks first to keep inbound_remark unique:
+                    await session.execute(
+                        update(VlessPortStruct)
+                        .values(inbound_remark=None, reserved_dttm=None)
+                        .where(
+                            VlessPortStruct.inbound_remark.in_(
+                                list(used_ports.values())
+                            )
+                        )
+                    )
+                    q_ins = insert(VlessPortStruct).values(
+                        [
+                            {
+                                "port": port,
+                                "inbound_remark": remark,
+                                "reserved_dttm": now_dttm(),
+                            }
+                            for port, remark in used_ports.items()
+                        ]
+                    )
+                    q_ins = q_ins.on_conflict_do_update(
+                        index_elements=["port"],
+                        set_={
+                            "inbound_remark": q_ins.excluded.inbound_remark,
+                            "reserved_dttm": q_ins.excluded.reserved_dttm,
+                        },
+                    )
+                    await session.execute(q_ins)
+                await session.commit()
+                return ReturnCode.SUCCESS
+        except Exception as e:
+            return DBErrorHandler.handle_exception(e)
 
-                if (
-                    upd_order_resp.rowcount > 0
-                    and upd_serv_conf_resp.rowcount > 0
-                ):
-                    await session.commit()
-                    return ReturnCode.SUCCESS
-                else:
-                    await session.rollback()
-                    return ReturnCode.NOT_FOUND
+    # Reality key methods:
+    @staticmethod
+    async def add_reality_keys(keys: list[dict]) -> ReturnCode:
+        """
+        keys: rows (private_key, public_key, short_ids) of new keys.
+        """
+        try:
+            async with dbs.async_session_factory() as session:
+                if keys:
+                    await session.execute(insert(RealityKeyStruct), keys)
+                await session.commit()
+                return ReturnCode.SUCCESS
+        except Exception as e:
+            return DBErrorHandler.handle_exception(e)
 
+    #
+    @staticmethod
+    async def pop_reality_key() -> dict:
+        """
+        Takes a key out of the pool, returns
+        {private_key, public_key, short_ids}, None if the pool is empty.
+        """
+        try:
+            async with dbs.async_session_factory() as session:
+                # Concurrent pops skip each other's locked rows:
+                q_key = (
+                    select(RealityKeyStruct.key_id)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                    .scalar_subquery()
+                )
+                q = (
+                    delete(RealityKeyStruct)
+                    .where(RealityKeyStruct.key_id == q_key)
+                    .returning(
+                        RealityKeyStruct.private_key,
+                        RealityKeyStruct.public_key,
+                        RealityKeyStruct.short_ids,
+                    )
+                )
+                res = await session.execute(q)
+                row = res.first()
+                await session.commit()
+                return row._asdict() if row else None
+        except Exception as e:
+            raise e
+
+    #
+    @staticmethod
+    async def count_reality_keys() -> int:
+        try:
+            async with dbs.async_session_factory() as session:
+                q = select(func.count()).select_from(RealityKeyStruct)
+                res = await session.scalars(q)
+                return res.one()
+        except Exception as e:
+            raise e
+
+    # Traffic methods:
+
+    #
+    @staticmethod
+    async def create_config_traffic_partitions(
+        months: list[datetime],
+    ) -> ReturnCode:
+        """
+        months: any datetime of every month that needs a raw traffic partition
+        """
+        try:
+            # Partitions can be created by the owner of the parent table only:
+            async with dbs.admin_async_session_factory() as session:
+                parent = ConfigTrafficStruct.__tablename__
+                for month in months:
+                    start = month.replace(
+                        day=1, hour=0, minute=0, second=0, microsecond=0
+                    )
+                    end = (start + timedelta(days=32)).replace(day=1)
+                    await session.execute(
+                        text(
+                            f"CREATE TABLE IF NOT EXISTS "
+                            f"{dbs.DEFAULT_SCHEMA_NAME}.{parent}_{start:%Y_%m} "
+                            f"PARTITION OF {dbs.DEFAULT_SCHEMA_NAME}.{parent} "
+                            f"FOR VALUES FROM ('{start:%Y-%m-%d}') "
+                            f"TO ('{end:%Y-%m-%d}')"
+                        )
+                    )
+                await session.commit()
+                return ReturnCode.SUCCESS
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
 
     #
     @staticmethod
-    async def delete_order(
-        user_tg_id: int, config_name: str, order_status: str
+    async def drop_config_traffic_partitions(
+        older_than: datetime,
+    ) -> ReturnCode:
+        """
+        Drops raw traffic partitions (and hourly rollups) that ended
+        before older_than, daily rollups are kept.
+        """
+        try:
+            async with dbs.admin_async_session_factory() as session:
+                parent = ConfigTrafficStruct.__tablename__
+                q_parts = text(
+                    "SELECT c.relname FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid "
+                    "JOIN pg_class p ON p.oid = i.inhparent "
+                    "JOIN pg_namespace n ON n.oid = p.relnamespace "
+                    "WHERE p.relname = :parent AND n.nspname = :schema"
+                )
+                res = await session.execute(
+                    q_parts,
+                    {"parent": parent, "schema": dbs.DEFAULT_SCHEMA_NAME},
+                )
+                for partition in res.scalars().all():
+                    start = datetime.strptime(
+                        partition.removeprefix(f"{parent}_"), "%Y_%m"
+                    )
+                    end = (start + timedelta(days=32)).replace(day=1)
+                    if end <= older_than:
+                        await session.execute(
+                            text(
+                                f"DROP TABLE IF EXISTS "
+                                f"{dbs.DEFAULT_SCHEMA_NAME}.{partition}"
+                            )
+                        )
+                await session.execute(
+                    delete(ConfigTrafficHourlyStruct).where(
+                        ConfigTrafficHourlyStruct.period_start_dttm
+                        < older_than
+                    )
+                )
+                await session.commit()
+                return ReturnCode.SUCCESS
+        except Exception as e:
+            return DBErrorHandler.handle_exception(e)
+
+    #
+    @staticmethod
+    async def add_config_traffic(
+        counters: dict[str, tuple[int, int]], collected_dttm: datetime
     ) -> ReturnCode:
+        """
+        counters: {config_name: (up_total, down_total)} cumulative panel
+        counters of all clients, the deltas since the previous poll are
+        stored as raw rows and added to the hourly and daily rollups.
+        """
         try:
             async with dbs.async_session_factory() as session:
-                u = aliased(UserStruct)
-                ua = aliased(UserServConfStruct)
-                q = select(ua).join(
-                    u,
-                    and_(
-                        u.user_id == ua.user_id,
-                        u.user_tg_id == user_tg_id,
-                        ua.config_name == config_name,
-                    ),
+                q_sel = select(
+                    UserServConfStruct.config_name,
+                    UserServConfStruct.service_config_id,
+                    ConfigTrafficCounterStruct.up_total,
+                    ConfigTrafficCounterStruct.down_total,
+                ).outerjoin(
+                    ConfigTrafficCounterStruct,
+                    ConfigTrafficCounterStruct.service_config_id
+                    == UserServConfStruct.service_config_id,
+                )
+                res = await session.execute(q_sel)
+
+                counter_rows, delta_rows = [], []
+                for config_name, config_id, last_up, last_down in res.all():
+                    if config_name not in counters:
+                        continue
+                    up, down = counters[config_name]
+                    if (up, down) == (last_up, last_down):
+                        continue
+                    if last_up is None:
+                        up_delta, down_delta = up, down
+                    else:
+                        # Panel counters go down only after a reset:
+                        up_delta = up - last_up if up >= last_up else up
+                        down_delta = (
+                            down - last_down if down >= last_down else down
+                        )
+                    counter_rows.append(
+                        {
+                            "service_config_id": config_id,
+                            "up_total": up,
+                            "down_total": down,
+                            "collected_dttm": collected_dttm,
+                        }
+                    )
+                    if up_delta or down_delta:
+                        delta_rows.append(
+                            {
+                                "service_config_id": config_id,
+                                "up_bytes": up_delta,
+                                "down_bytes": down_delta,
+                            }
+                        )
+
+                if counter_rows:
+                    q_counter = insert(ConfigTrafficCounterStruct)
+                    q_counter = q_counter.on_conflict_do_update(
+                        index_elements=["service_config_id"],
+                        set_={
+                            "up_total": q_counter.excluded.up_total,
+                            "down_total": q_counter.excluded.down_total,
+                            "collected_dttm": q_counter.excluded.collected_dttm,
+                            "sys_updated_dttm": func.current_timestamp(),
+                        },
+                    )
+                    await session.execute(q_counter, counter_rows)
+
+                if delta_rows:
+                    await session.execute(
+                        insert(ConfigTrafficStruct),
+                        [
+                            {**row, "collected_dttm": collected_dttm}
+                            for row in delta_rows
+                        ],
+                    )
+                    hour = collected_dttm.replace(
+                        minute=0, second=0, microsecond=0
+                    )
+                    day = hour.replace(hour=0)
+                    for rollup, period_start in (
+                        (ConfigTrafficHourlyStruct, hour),
+                        (ConfigTrafficDailyStruct, day),
+                    ):
+                        q_rollup = insert(rollup)
+                        q_rollup = q_rollup.on_conflict_do_update(
+                            index_elements=[
+                                "service_config_id",
+                                "period_start_dttm",
+                            ],
+                            set_={
+                                "up_bytes": rollup.up_bytes
+                                + q_rollup.excluded.up_bytes,
+                                "down_bytes": rollup.down_bytes
+                                + q_rollup.excluded.down_bytes,
+                                "sys_updated_dttm": func.current_timestamp(),
+                            },
+                        )
+                        await session.execute(
+                            q_rollup,
+                            [
+                                {**row, "period_start_dttm": period_start}
+                                for row in delta_rows
+                            ],
+                        )
+                await session.commit()
+                return ReturnCode.SUCCESS
+        except Exception as e:
+            return DBErrorHandler.handle_exception(e)
+
+    #
+    @staticmethod
+    async def get_config_traffic(
+        user_tg_id: int, config_name: str, from_dttm: datetime
+    ) -> tuple[int, int]:
+        """
+        Returns (up_bytes, down_bytes) of the config since from_dttm
+        (rounded down to the day) from the daily rollup.
+        """
+        try:
+            async with use_session(dbs.async_session_factory) as session:
+                q = (
+                    select(
+                        func.coalesce(
+                            func.sum(ConfigTrafficDailyStruct.up_bytes), 0
+                        ),
+                        func.coalesce(
+                            func.sum(ConfigTrafficDailyStruct.down_bytes), 0
+                        ),
+                    )
+                    .join(
+                        UserServConfStruct,
+                        UserServConfStruct.service_config_id
+                        == ConfigTrafficDailyStruct.service_config_id,
+                    )
+                    .join(
+                        UserStruct,
+                        UserStruct.user_id == UserServConfStruct.user_id,
+                    )
+                    .where(
+                        and_(
+                            UserStruct.user_tg_id == user_tg_id,
+                            UserServConfStruct.config_name == config_name,
+                            ConfigTrafficDailyStruct.period_start_dttm
+                            >= from_dttm.replace(
+                                hour=0, minute=0, second=0, microsecond=0
+                            ),
+                        )
+                    )
+                )
+                res = await session.execute(q)
+                up_bytes, down_bytes = res.one()
+                return int(up_bytes), int(down_bytes)
+        except Exception as e:
+            raise e
+
+    # Expiry methods:
+    @staticmethod
+    async def get_job_watermark(job_name: str) -> datetime:
+        """
+        Returns the watermark of the job, None if the job never finished.
+        """
+        try:
+            async with dbs.async_session_factory() as session:
+                q = select(JobWatermarkStruct.watermark_dttm).where(
+                    JobWatermarkStruct.job_name == job_name
                 )
                 res = await session.scalars(q)
-                user_service_config = res.first()
+                return res.first()
+        except Exception as e:
+            raise e
 
-                q_upd_order = delete(OrderStruct).where(
-                    and_(
-                        OrderStruct.user_id == user_service_config.user_id,
-                        OrderStruct.service_config_id
-                        == user_service_config.service_config_id,
-                        OrderStruct.order_status == order_status,
+    #
+    @staticmethod
+    async def set_job_watermark(
+        job_name: str, watermark_dttm: datetime
+    ) -> ReturnCode:
+        try:
+            async with dbs.async_session_factory() as session:
+                q = insert(JobWatermarkStruct).values(
+                    job_name=job_name, watermark_dttm=watermark_dttm
+                )
+                q = q.on_conflict_do_update(
+                    index_elements=["job_name"],
+                    set_={
+                        "watermark_dttm": q.excluded.watermark_dttm,
+                        "sys_updated_dttm": func.current_timestamp(),
+                    },
+                )
+                await session.execute(q)
+                await session.commit()
+                return ReturnCode.SUCCESS
+        except Exception as e:
+            return DBErrorHandler.handle_exception(e)
+
+    #
+    @staticmethod
+    async def get_expired_service_configs(
+        from_dttm: datetime,
+        to_dttm: datetime,
+        after: tuple = None,
+        limit: int = 500,
+    ) -> list[tuple]:
+        """
+        Returns rows (valid_to_dttm, service_config_id, config_name,
+        node_name) of the configs with from_dttm < valid_to_dttm <= to_dttm
+        (from_dttm None for no lower bound) in expiry order.
+
+        after: (valid_to_dttm, service_config_id) of the last row of the
+        previous page, the page starts right after it.
+        """
+        try:
+            async with dbs.async_session_factory() as session:
+                usc = UserServConfStruct
+                conditions = [usc.valid_to_dttm <= to_dttm]
+                if from_dttm is not None:
+                    conditions.append(usc.valid_to_dttm > from_dttm)
+                if after is not None:
+                    conditions.append(
+                        tuple_(usc.valid_to_dttm, usc.service_config_id)
+                        > tuple_(*after)
+                    )
+                q = (
+                    select(
+                        usc.valid_to_dttm,
+                        usc.service_config_id,
+                        usc.config_name,
+                        usc.node_name,
                     )
+                    .where(and_(*conditions))
+                    .order_by(usc.valid_to_dttm, usc.service_config_id)
+                    .limit(limit)
                 )
-                res_2 = await session.execute(q_upd_order)
+                res = await session.execute(q)
+                return res.all()
+        except Exception as e:
+            raise e
+
+    #
+    @staticmethod
+    async def prune_service_configs(
+        service_config_ids: list, valid_to_dttm: datetime
+    ) -> list:
+        """
+        Deletes the configs (with their orders) that are still expired
+        at valid_to_dttm, returns the ids of the deleted ones.
+        """
+        try:
+            async with dbs.async_session_factory() as session:
+                usc = UserServConfStruct
+                q_sel = (
+                    select(usc.service_config_id)
+                    .where(
+                        and_(
+                            usc.service_config_id.in_(service_config_ids),
+                            usc.valid_to_dttm <= valid_to_dttm,
+                        )
+                    )
+                    .with_for_update()
+                )
+                res = await session.scalars(q_sel)
+                pruned_ids = res.all()
+                if pruned_ids:
+                    await session.execute(
+                        delete(OrderStruct).where(
+                            OrderStruct.service_config_id.in_(pruned_ids)
+                        )
+                    )
+                    await session.execute(
+                        delete(usc).where(
+                            usc.service_config_id.in_(pruned_ids)
+                        )
+                    )
                 await session.commit()
-                return DBErrorHandler.del_row_cnt_handler(res_2.rowcount)
+                return pruned_ids
+        except Exception as e:
+            raise e
 
+    #
+    @staticmethod
+    async def add_config_expiry_actions(actions: list[dict]) -> ReturnCode:
+        """
+        actions: rows of ConfigExpiryActionStruct, a repeated action of
+        the same expiry is skipped.
+        """
+        try:
+            async with dbs.async_session_factory() as session:
+                if actions:
+                    q = insert(
+                        ConfigExpiryActionStruct
+                    ).on_conflict_do_nothing()
+                    await session.execute(q, actions)
+                await session.commit()
+                return ReturnCode.SUCCESS
         except Exception as e:
             return DBErrorHandler.handle_exception(e)
@@ -0,0 +1,58 @@
+from typing import NamedTuple
+
+from .settings import DBSettings
+
+dbs = DBSettings()
+schema = dbs.DEFAULT_SCHEMA_NAME
+
+
+class Migration(NamedTuple):
+    """
+    A schema change of an existing database.
+
+    Migrations are applied once, in version order, and must be idempotent:
+    a fresh database gets the same objects from the models by create_all,
+    then runs all migrations too.
+    """
+
+    version: int
+    description: str
+    sql: str
+
+
+MIGRATIONS = [
+    Migration(
+        1,
+        "Config node and expiry index",
+        f"""
+            ALTER TABLE {schema}.user_service_config
+            ADD COLUMN IF NOT EXISTS node_name VARCHAR;
+
+            CREATE INDEX IF NOT EXISTS ix_user_service_config_valid_to
+            ON {schema}.user_service_config
+            (valid_to_dttm, service_config_id);
+        """,
+    ),
+    Migration(
+        2,
+        "Indexes of the order and config lookups",
+        f"""
+            CREATE INDEX IF NOT EXISTS ix_user_order_config_status
+            ON {schema}.user_order
+            (service_config_id, user_id, order_status);
+
+            CREATE INDEX IF NOT EXISTS ix_user_order_user_updated
+            ON {schema}.user_order
+            (user_id, sys_updated_dttm);
+
+            CREATE INDEX IF NOT EXISTS ix_user_order_payed
+            ON {schema}.user_order
+            (user_id)
+            WHERE order_status = 'PAYED';
+
+            CREATE INDEX IF NOT EXISTS ix_user_service_config_name
+            ON {schema}.user_service_config
+            (config_name, user_id);
+        """,
+    ),
+]
@@ -1,4 +1,20 @@
 from .base import Base, BaseStruct
 from .user import UserStruct, UserAccReqStruct, UserAccStruct, UserAccCode
+from .user import UserRecord, AccessRecord
 from .service import UserServConfStruct
 from .order import OrderStruct, OrderStatus, get_order_nm_str
+from .port import VlessPortStruct
+from .traffic import (
+    ConfigTrafficStruct,
+    ConfigTrafficHourlyStruct,
+    ConfigTrafficDailyStruct,
+    ConfigTrafficCounterStruct,
+)
+from .job import JobWatermarkStruct
+from .expiry import (
+    ConfigExpiryActionStruct,
+    ConfigExpiryAction,
+    ConfigExpiryResult,
+)
+from .reality import RealityKeyStruct
+from .migration import SchemaMigrationStruct
@@ -0,0 +1,38 @@
+from enum import Enum
+from sqlalchemy.types import Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+from uuid import UUID
+from datetime import datetime
+
+from .base import BaseStruct
+
+
+class ConfigExpiryAction(Enum):
+    DISABLE = "DISABLE"  # the panel client is disabled
+    PRUNE = "PRUNE"  # the panel client and the config are deleted
+
+
+class ConfigExpiryResult(Enum):
+    DONE = "DONE"
+    NOT_FOUND = "NOT_FOUND"  # no client on the panel
+    RENEWED = "RENEWED"  # the panel client expires later, left as is
+
+
+class ConfigExpiryActionStruct(BaseStruct):
+    """
+    What the expiry job did to an expired config.
+
+    No foreign key: the rows outlive the pruned configs.
+    """
+
+    # Prefs
+    __tablename__ = "config_expiry_action"
+    __table_args__ = BaseStruct.default_table_args
+
+    # Fields
+    service_config_id: Mapped[UUID] = mapped_column(Uuid, primary_key=True)
+    valid_to_dttm: Mapped[datetime] = mapped_column(primary_key=True)
+    action: Mapped[str] = mapped_column(primary_key=True)
+    config_name: Mapped[str] = mapped_column(nullable=False)
+    node_name: Mapped[str] = mapped_column(nullable=True)
+    result: Mapped[str] = mapped_column(nullable=False)
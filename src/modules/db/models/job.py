@@ -0,0 +1,16 @@
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+
+from .base import BaseStruct
+
+
+class JobWatermarkStruct(BaseStruct):
+    """The point up to which a background job has processed its rows."""
+
+    # Prefs
+    __tablename__ = "job_watermark"
+    __table_args__ = BaseStruct.default_table_args
+
+    # Fields
+    job_name: Mapped[str] = mapped_column(primary_key=True)
+    watermark_dttm: Mapped[datetime] = mapped_column(nullable=False)
@@ -0,0 +1,15 @@
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import BaseStruct
+
+
+class SchemaMigrationStruct(BaseStruct):
+    """A schema migration applied to the database."""
+
+    # Prefs
+    __tablename__ = "schema_migration"
+    __table_args__ = BaseStruct.default_table_args
+
+    # Fields
+    version: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    description: Mapped[str] = mapped_column(nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index, text
 from sqlalchemy.types import Uuid, JSON
 from sqlalchemy.orm import Mapped, mapped_column
 from uuid import UUID
@@ -19,7 +19,24 @@ class OrderStatus(Enum):
 class OrderStruct(BaseStruct):
     # Prefs
     __tablename__ = "user_order"
-    __table_args__ = BaseStruct.default_table_args
+    __table_args__ = (
+        # Orders of a config by status:
+        Index(
+            "ix_user_order_config_status",
+            "service_config_id",
+            "user_id",
+            "order_status",
+        ),
+        # Order history of a user:
+        Index("ix_user_order_user_updated", "user_id", "sys_updated_dttm"),
+        # Payed orders waiting for an admin:
+        Index(
+            "ix_user_order_payed",
+            "user_id",
+            postgresql_where=text("order_status = 'PAYED'"),
+        ),
+        BaseStruct.default_table_args,
+    )
 
     # Fields
     order_id: Mapped[UUID] = mapped_column(Uuid, primary_key=True)
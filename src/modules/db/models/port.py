@@ -0,0 +1,23 @@
+from sqlalchemy import Index, text
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+
+from .base import BaseStruct
+
+
+class VlessPortStruct(BaseStruct):
+    # Prefs
+    __tablename__ = "vless_port"
+    __table_args__ = (
+        Index(
+            "ix_vless_port_free",
+            "port",
+            postgresql_where=text("inbound_remark IS NULL"),
+        ),
+        BaseStruct.default_table_args,
+    )
+
+    # Fields
+    port: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    inbound_remark: Mapped[str] = mapped_column(nullable=True, unique=True)
+    reserved_dttm: Mapped[datetime] = mapped_column(nullable=True)
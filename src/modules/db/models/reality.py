@@ -0,0 +1,19 @@
+from sqlalchemy.types import Uuid, JSON
+from sqlalchemy.orm import Mapped, mapped_column
+from uuid import UUID, uuid4
+
+from .base import BaseStruct
+
+
+class RealityKeyStruct(BaseStruct):
+    """A pre-generated Reality keypair with shortIds, used once."""
+
+    # Prefs
+    __tablename__ = "reality_key"
+    __table_args__ = BaseStruct.default_table_args
+
+    # Fields
+    key_id: Mapped[UUID] = mapped_column(Uuid, primary_key=True, default=uuid4)
+    private_key: Mapped[str] = mapped_column(nullable=False)
+    public_key: Mapped[str] = mapped_column(nullable=False)
+    short_ids: Mapped[list] = mapped_column(JSON, nullable=False)
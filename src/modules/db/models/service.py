@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, func
+from sqlalchemy import ForeignKey, Index, func
 from sqlalchemy.types import Uuid, JSON
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from uuid import UUID
@@ -13,7 +13,17 @@ dbs = DBSettings()
 class UserServConfStruct(BaseStruct):
     # Prefs
     __tablename__ = "user_service_config"
-    __table_args__ = BaseStruct.default_table_args
+    __table_args__ = (
+        # Range scans of configs by expiry:
+        Index(
+            "ix_user_service_config_valid_to",
+            "valid_to_dttm",
+            "service_config_id",
+        ),
+        # Configs by name, of a user or of any user:
+        Index("ix_user_service_config_name", "config_name", "user_id"),
+        BaseStruct.default_table_args,
+    )
 
     # Fields
     service_config_id: Mapped[UUID] = mapped_column(Uuid, primary_key=True)
@@ -24,6 +34,8 @@ class UserServConfStruct(BaseStruct):
     config_price: Mapped[float] = mapped_column(nullable=False)
     max_config_traffic: Mapped[float] = mapped_column(nullable=False)
     user_service_id: Mapped[UUID] = mapped_column(Uuid)
+    # The 3x-ui node of the config, None for the default one:
+    node_name: Mapped[str] = mapped_column(nullable=True)
     cached_data: Mapped[dict] = mapped_column(JSON, nullable=True)
     valid_from_dttm: Mapped[datetime] = mapped_column(
         nullable=False, server_default=func.current_timestamp()
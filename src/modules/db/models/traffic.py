@@ -0,0 +1,67 @@
+from sqlalchemy.types import Uuid, BigInteger
+from sqlalchemy.orm import Mapped, mapped_column
+from uuid import UUID
+from datetime import datetime
+
+from .base import Base, BaseStruct
+from ..settings import DBSettings
+
+dbs = DBSettings()
+
+
+class ConfigTrafficStruct(Base):
+    """
+    Raw traffic deltas of configs, one row per config and poll.
+
+    Kept narrow (no sys columns) and range-partitioned by month on
+    `collected_dttm`, old partitions are dropped as a whole.
+    """
+
+    # Prefs
+    __tablename__ = "config_traffic"
+    __table_args__ = {
+        "schema": dbs.DEFAULT_SCHEMA_NAME,
+        "postgresql_partition_by": "RANGE (collected_dttm)",
+    }
+
+    # Fields
+    service_config_id: Mapped[UUID] = mapped_column(Uuid, primary_key=True)
+    collected_dttm: Mapped[datetime] = mapped_column(primary_key=True)
+    up_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    down_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class ConfigTrafficRollupStruct(BaseStruct):
+    __abstract__ = True
+
+    # Fields
+    service_config_id: Mapped[UUID] = mapped_column(Uuid, primary_key=True)
+    period_start_dttm: Mapped[datetime] = mapped_column(primary_key=True)
+    up_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    down_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class ConfigTrafficHourlyStruct(ConfigTrafficRollupStruct):
+    # Prefs
+    __tablename__ = "config_traffic_hourly"
+    __table_args__ = BaseStruct.default_table_args
+
+
+class ConfigTrafficDailyStruct(ConfigTrafficRollupStruct):
+    # Prefs
+    __tablename__ = "config_traffic_daily"
+    __table_args__ = BaseStruct.default_table_args
+
+
+class ConfigTrafficCounterStruct(BaseStruct):
+    """Last cumulative panel counters of a config, the base of deltas."""
+
+    # Prefs
+    __tablename__ = "config_traffic_counter"
+    __table_args__ = BaseStruct.default_table_args
+
+    # Fields
+    service_config_id: Mapped[UUID] = mapped_column(Uuid, primary_key=True)
+    up_total: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    down_total: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    collected_dttm: Mapped[datetime] = mapped_column(nullable=False)
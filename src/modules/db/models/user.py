@@ -4,6 +4,7 @@ from sqlalchemy.orm import Mapped, mapped_column
 from uuid import UUID
 from datetime import datetime
 from enum import Enum
+from typing import NamedTuple
 
 from .base import BaseStruct
 from ..settings import DBSettings
@@ -33,6 +34,29 @@ class UserStruct(BaseStruct):
     )
 
 
+class UserRecord(NamedTuple):
+    """An immutable copy of a user row, safe to share from a cache."""
+
+    user_id: UUID
+    user_tg_id: int
+    user_name: str
+    user_tag: str
+    admin_flg: bool
+    lang_code: str
+
+
+class AccessRecord(NamedTuple):
+    """An immutable copy of the validity of a user access."""
+
+    access_name: str
+    valid_from_dttm: datetime
+    valid_to_dttm: datetime
+
+    def is_active(self, dttm: datetime = None) -> bool:
+        dttm = dttm or datetime.now()
+        return self.valid_from_dttm < dttm < self.valid_to_dttm
+
+
 class UserAccReqStruct(BaseStruct):
     # Prefs
     __tablename__ = "user_access_request"
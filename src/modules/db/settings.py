@@ -13,6 +13,11 @@ class DBSettings:
     WG_USER: str = settings.DB_WG_USER
     WG_PASS: str = settings.DB_WG_PASS
 
+    USER_CACHE_SIZE: int = settings.DB_USER_CACHE_SIZE
+    USER_CACHE_TTL_SEC: int = settings.DB_USER_CACHE_TTL_SEC
+    ADMIN_CACHE_TTL_SEC: int = settings.DB_ADMIN_CACHE_TTL_SEC
+    ACCESS_CACHE_TTL_SEC: int = settings.DB_ACCESS_CACHE_TTL_SEC
+
     # ADMIN DB:
     admin_sync_engine = create_engine(
         url=settings.DB_ADMIN_URL_psycopg,
@@ -42,3 +47,12 @@ class DBSettings:
     async_session_factory = async_sessionmaker(
         async_engine, expire_on_commit=True
     )
+    # Units of work, the rows they return are used after the commit:
+    uow_session_factory = async_sessionmaker(
+        async_engine, expire_on_commit=False
+    )
+    # Units of work whose reads share one snapshot:
+    uow_snapshot_session_factory = async_sessionmaker(
+        async_engine.execution_options(isolation_level="REPEATABLE READ"),
+        expire_on_commit=False,
+    )
@@ -0,0 +1,141 @@
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .cache import TtlLruCache
+
+
+class UnitOfWork:
+    """
+    One AsyncSession shared by the DbManager calls of a block of a handler.
+
+    The reads of the unit see its own writes (and one snapshot with a
+    REPEATABLE READ session), the writes are committed once when the unit
+    ends. Every
+    write runs in a savepoint: a failed one (e.g. a unique violation the
+    user is answered about) does not abort the others. The session is not
+    opened before the first statement, blocks served from the caches take
+    no connection.
+    """
+
+    def __init__(self, session: AsyncSession):
+        """
+        Initialize the UnitOfWork.
+
+        Args:
+            session (AsyncSession): The session of the unit.
+        """
+        self.session = session
+        self.active = True
+        # DbManager calls of parallel tasks take turns on the session:
+        self.lock = asyncio.Lock()
+        self.on_end: list[Callable[[], None]] = []
+        # The cache epoch when the snapshot was taken:
+        self.snapshot_epoch = None
+
+        # Rows read again are refreshed, the identity map does not see the
+        # UPDATE statements of the unit:
+        event.listen(
+            session.sync_session, "do_orm_execute", self._populate_existing
+        )
+
+    @staticmethod
+    def _populate_existing(orm_execute_state):
+        if orm_execute_state.is_select:
+            orm_execute_state.update_execution_options(populate_existing=True)
+
+
+current_uow: ContextVar[UnitOfWork | None] = ContextVar(
+    "current_uow", default=None
+)
+
+
+def get_uow() -> UnitOfWork | None:
+    uow = current_uow.get()
+    # Tasks spawned by an update keep its context after the update ends:
+    return uow if uow is not None and uow.active else None
+
+
+@asynccontextmanager
+async def unit_of_work(session_factory: async_sessionmaker):
+    """
+    Run the DbManager calls of the block in one unit of work, committed when
+    the block ends and rolled back if it raises.
+
+    Args:
+        session_factory (async_sessionmaker): Factory of the unit session.
+    """
+    uow = UnitOfWork(session_factory())
+    token = current_uow.set(uow)
+    try:
+        yield uow
+        await uow.session.commit()
+    except BaseException:
+        await uow.session.rollback()
+        raise
+    finally:
+        uow.active = False
+        current_uow.reset(token)
+        await uow.session.close()
+        for callback in uow.on_end:
+            callback()
+
+
+@asynccontextmanager
+async def use_session(session_factory: async_sessionmaker, write=False):
+    """
+    The session of the current unit of work, a new one out of a unit.
+
+    Args:
+        session_factory (async_sessionmaker): Factory of a new session.
+        write (bool): The block writes, in a unit it runs in a savepoint
+            (default: False).
+    """
+    uow = get_uow()
+    if uow is None:
+        async with session_factory() as session:
+            yield session
+        return
+    async with uow.lock:
+        if not uow.session.in_transaction():
+            uow.snapshot_epoch = TtlLruCache.epoch
+        if write:
+            async with uow.session.begin_nested():
+                yield uow.session
+        else:
+            yield uow.session
+
+
+async def commit(session: AsyncSession):
+    """Commit a session of its own, a unit of work commits when it ends."""
+    uow = get_uow()
+    if uow is not None and session is uow.session:
+        await session.flush()
+    else:
+        await session.commit()
+
+
+def fresh_snapshot() -> bool:
+    """
+    True if the rows read may be cached: out of a unit of work or no cache
+    was invalidated since the unit took its snapshot (by its own writes or
+    by parallel updates).
+    """
+    uow = get_uow()
+    return uow is None or uow.snapshot_epoch == TtlLruCache.epoch
+
+
+def on_unit_end(callback: Callable[[], None]):
+    """
+    Run the callback now and, in a unit of work, once more when it ends:
+    cache invalidations, parallel updates may cache the rows the unit has
+    not committed yet.
+    """
+    callback()
+    uow = get_uow()
+    if uow is not None:
+        uow.on_end.append(callback)
@@ -0,0 +1 @@
+from .cache import QrCodeCache, render_qr_png, qr_cache
@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import aiofiles
+import segno
+
+from settings import settings
+from logger import MainLogger
+
+logger = MainLogger(__name__).get()
+
+
+def render_qr_png(link: str, scale: int = 8) -> bytes:
+    """
+    Render the QR code of a link, runs in a worker process.
+
+    Args:
+        link (str): The config link.
+        scale (int): Pixels per QR module (default: 8).
+
+    Returns:
+        bytes: The PNG image.
+    """
+    buffer = io.BytesIO()
+    segno.make(link, error="m").save(buffer, kind="png", scale=scale, border=2)
+    return buffer.getvalue()
+
+
+class QrCodeCache:
+    """
+    QR codes of config links, rendered once and uploaded to Telegram once.
+
+    Rendering is CPU-bound, so it runs in a process pool and never blocks
+    the event loop; concurrent requests of a link share one render. PNGs
+    are stored on disk by the SHA-256 of the link, so a link is rendered
+    once across restarts. After the first upload the Telegram `file_id` of
+    the photo is stored next to the PNG and sent instead of the image.
+    """
+
+    def __init__(self, cache_dir: str, max_workers: int = 1, scale: int = 8):
+        """
+        Initialize the QrCodeCache.
+
+        Args:
+            cache_dir (str): The directory of the PNGs and file ids.
+            max_workers (int): Render processes (default: 1).
+            scale (int): Pixels per QR module (default: 8).
+        """
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.scale = scale
+        self._executor: ProcessPoolExecutor = None
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self._file_ids: dict[str, str] = {}
+
+        self.renders = 0
+        self.disk_hits = 0
+        self.file_id_hits = 0
+
+    @staticmethod
+    def key(link: str) -> str:
+        return hashlib.sha256(link.encode()).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{suffix}")
+
+    async def _read(self, path: str, mode: str = "rb"):
+        try:
+            async with aiofiles.open(path, mode) as f:
+                return await f.read()
+        except FileNotFoundError:
+            return None
+
+    async def _write(self, path: str, data, mode: str = "wb"):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers never see a partly written file:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        async with aiofiles.open(tmp_path, mode) as f:
+            await f.write(data)
+        os.replace(tmp_path, path)
+
+    async def get_file_id(self, link: str) -> str:
+        """
+        Get the Telegram file id of the QR code of a link.
+
+        Args:
+            link (str): The config link.
+
+        Returns:
+            str: The file id, None if the QR code was never uploaded.
+        """
+        key = self.key(link)
+        file_id = self._file_ids.get(key)
+        if file_id is None:
+            file_id = await self._read(self._path(key, "file_id"), "r")
+            if file_id:
+                self._file_ids[key] = file_id
+        if file_id:
+            self.file_id_hits += 1
+        return file_id
+
+    async def set_file_id(self, link: str, file_id: str):
+        key = self.key(link)
+        self._file_ids[key] = file_id
+        await self._write(self._path(key, "file_id"), file_id, "w")
+
+    async def forget_file_id(self, link: str):
+        key = self.key(link)
+        self._file_ids.pop(key, None)
+        try:
+            os.remove(self._path(key, "file_id"))
+        except FileNotFoundError:
+            pass
+
+    async def _render(self, key: str, link: str) -> bytes:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.max_workers)
+        loop = asyncio.get_running_loop()
+        png = await loop.run_in_executor(
+            self._executor, render_qr_png, link, self.scale
+        )
+        self.renders += 1
+        await self._write(self._path(key, "png"), png)
+        return png
+
+    async def get_png(self, link: str) -> bytes:
+        """
+        Get the QR code of a link from the disk or render it.
+
+        Args:
+            link (str): The config link.
+
+        Returns:
+            bytes: The PNG image.
+        """
+        key = self.key(link)
+        png = await self._read(self._path(key, "png"))
+        if png:
+            self.disk_hits += 1
+            return png
+
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._render(key, link))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "renders": self.renders,
+            "disk_hits": self.disk_hits,
+            "file_id_hits": self.file_id_hits,
+        }
+
+
+qr_cache = QrCodeCache(
+    settings.QR_CACHE_DIR, max_workers=settings.QR_RENDER_WORKERS
+)
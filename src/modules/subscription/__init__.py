@@ -0,0 +1,7 @@
+from .tokens import make_sub_token, parse_sub_token
+from .server import (
+    SubscriptionServer,
+    SubscriptionCache,
+    Subscription,
+    subscription_server,
+)
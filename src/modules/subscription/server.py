@@ -0,0 +1,292 @@
+import asyncio
+import base64
+import hashlib
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from aiohttp import web
+
+from modules.db import DbManager
+from settings import settings
+from logger import MainLogger
+from .tokens import make_sub_token, parse_sub_token
+
+logger = MainLogger(__name__).get()
+
+
+class Subscription(NamedTuple):
+    """A rendered subscription of a user."""
+
+    body: bytes
+    etag: str
+    expire_ts: int
+    loaded_at: float
+
+
+class SubscriptionCache:
+    """A per-token LRU of rendered subscriptions with a time to live."""
+
+    def __init__(self, max_size: int = 10000, ttl_sec: float = 60):
+        """
+        Initialize the SubscriptionCache.
+
+        Args:
+            max_size (int): Max cached subscriptions (default: 10000).
+            ttl_sec (float): Subscription time to live in seconds
+                (default: 60).
+        """
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self._items: OrderedDict[str, Subscription] = OrderedDict()
+
+    def get(self, token: str, allow_stale: bool = False) -> Subscription:
+        """
+        Get a cached subscription.
+
+        Args:
+            token (str): The subscription token.
+            allow_stale (bool): Return an expired subscription too
+                (default: False).
+
+        Returns:
+            Subscription: The subscription, None if it is not cached.
+        """
+        sub = self._items.get(token)
+        if sub is None:
+            return None
+        if not allow_stale and (
+            time.monotonic() - sub.loaded_at >= self.ttl_sec
+        ):
+            return None
+        self._items.move_to_end(token)
+        return sub
+
+    def put(self, token: str, sub: Subscription):
+        self._items[token] = sub
+        self._items.move_to_end(token)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, token: str):
+        self._items.pop(token, None)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+def render_subscription(rows: list[tuple]) -> Subscription:
+    """
+    Render the subscription of the configs.
+
+    Args:
+        rows (list[tuple]): Rows (config_name, cached_data, valid_to_dttm)
+            of the configs.
+
+    Returns:
+        Subscription: Base64 of the links, one per line, as VLESS clients
+            expect it, with an ETag of the content.
+    """
+    links = [
+        cached_data["config_path"]
+        for _, cached_data, _ in rows
+        if cached_data and cached_data.get("config_path")
+    ]
+    expire_ts = max(
+        (int(valid_to_dttm.timestamp()) for _, _, valid_to_dttm in rows),
+        default=0,
+    )
+    body = base64.b64encode("\n".join(links).encode()) if links else b""
+    etag = hashlib.sha1(body + str(expire_ts).encode()).hexdigest()[:20]
+    return Subscription(
+        body=body,
+        etag=f'"{etag}"',
+        expire_ts=expire_ts,
+        loaded_at=time.monotonic(),
+    )
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header against the ETag."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class SubscriptionServer:
+    """
+    Serves the VLESS links of a user at `GET /sub/<token>`.
+
+    VLESS apps (v2rayN, v2rayTun, ...) poll the URL and pick up new and
+    renewed configs by themselves. Subscriptions are rendered from the
+    links cached in `user_service_config.cached_data`, the X-UI panel is
+    never called on the request path. A rendered subscription is kept in
+    a per-token LRU for `ttl_sec`, concurrent misses of a token share one
+    database query, and an unchanged subscription is answered with 304 by
+    its ETag.
+    """
+
+    def __init__(
+        self,
+        secret: str,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        cache_size: int = 10000,
+        cache_ttl_sec: float = 60,
+        update_interval_hours: int = 12,
+    ):
+        """
+        Initialize the SubscriptionServer.
+
+        Args:
+            secret (str): The secret tokens are signed with.
+            host (str): The listen address (default: '0.0.0.0').
+            port (int): The listen port (default: 8080).
+            cache_size (int): Max cached subscriptions (default: 10000).
+            cache_ttl_sec (float): Subscription time to live in seconds
+                (default: 60).
+            update_interval_hours (int): Poll interval suggested to the
+                apps (default: 12).
+        """
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.update_interval_hours = update_interval_hours
+        self.cache = SubscriptionCache(cache_size, cache_ttl_sec)
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self._runner: web.AppRunner = None
+
+        self.requests = 0
+        self.not_modified = 0
+        self.cache_hits = 0
+        self.db_loads = 0
+        self.db_errors = 0
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/sub/{token}", self.handle)
+        return app
+
+    async def start(self):
+        """Start listening, the server runs until stop()."""
+        if not self.secret:
+            raise Exception("SUBSCRIPTION SECRET IS NOT SET")
+        # No access log, it costs more than the request itself:
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"SUBSCRIPTION SERVER STARTED ON {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def make_url(self, base_url: str, user_tg_id: int) -> str:
+        """
+        Make the subscription URL of a user.
+
+        Args:
+            base_url (str): The public URL of the server.
+            user_tg_id (int): The Telegram id of the user.
+
+        Returns:
+            str: The subscription URL.
+        """
+        token = make_sub_token(user_tg_id, self.secret)
+        return f"{base_url.rstrip('/')}/sub/{token}"
+
+    async def _load(self, token: str, user_tg_id: int) -> Subscription:
+        self.db_loads += 1
+        rows = await DbManager.get_sub_configs(user_tg_id)
+        sub = render_subscription(rows)
+        self.cache.put(token, sub)
+        return sub
+
+    async def get_subscription(
+        self, token: str, user_tg_id: int
+    ) -> Subscription:
+        """
+        Get the subscription from the cache or the database.
+
+        Args:
+            token (str): The checked subscription token.
+            user_tg_id (int): The Telegram id of the token user.
+
+        Returns:
+            Subscription: The subscription, a stale one if the database
+                failed, raises an exception if there is none.
+        """
+        sub = self.cache.get(token)
+        if sub is not None:
+            self.cache_hits += 1
+            return sub
+
+        future = self._in_flight.get(token)
+        if future is None:
+            future = asyncio.ensure_future(self._load(token, user_tg_id))
+            self._in_flight[token] = future
+            future.add_done_callback(
+                lambda _: self._in_flight.pop(token, None)
+            )
+        try:
+            return await asyncio.shield(future)
+        except Exception as e:
+            self.db_errors += 1
+            sub = self.cache.get(token, allow_stale=True)
+            if sub is None:
+                raise e
+            logger.warning(f"STALE SUBSCRIPTION SERVED: {e}")
+            return sub
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        token = request.match_info["token"]
+        user_tg_id = parse_sub_token(token, self.secret)
+        if user_tg_id is None:
+            raise web.HTTPNotFound()
+        try:
+            sub = await self.get_subscription(token, user_tg_id)
+        except Exception as e:
+            logger.error(f"BAD TRY TO LOAD SUBSCRIPTION OF {user_tg_id}: {e}")
+            raise web.HTTPServiceUnavailable()
+        if not sub.body:
+            raise web.HTTPNotFound()
+
+        headers = {
+            "ETag": sub.etag,
+            "Cache-Control": "no-cache",
+            "Profile-Update-Interval": str(self.update_interval_hours),
+            "Subscription-Userinfo": (
+                f"upload=0; download=0; total=0; expire={sub.expire_ts}"
+            ),
+        }
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match and etag_matches(if_none_match, sub.etag):
+            self.not_modified += 1
+            return web.Response(status=304, headers=headers)
+        return web.Response(
+            body=sub.body, headers=headers, content_type="text/plain"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "not_modified": self.not_modified,
+            "cache_hits": self.cache_hits,
+            "cached": len(self.cache),
+            "db_loads": self.db_loads,
+            "db_errors": self.db_errors,
+        }
+
+
+subscription_server = SubscriptionServer(
+    secret=settings.SUB_SECRET,
+    host=settings.SUB_HOST,
+    port=settings.SUB_PORT,
+    cache_size=settings.SUB_CACHE_SIZE,
+    cache_ttl_sec=settings.SUB_CACHE_TTL_SEC,
+    update_interval_hours=settings.SUB_UPDATE_INTERVAL_HOURS,
+)
@@ -0,0 +1,50 @@
+import base64
+import hashlib
+import hmac
+
+# Bytes of the HMAC kept in a token, enough against guessing:
+SIGNATURE_BYTES = 16
+
+
+def _sign(user_tg_id: int, secret: str) -> str:
+    digest = hmac.new(
+        secret.encode(), str(user_tg_id).encode(), hashlib.sha256
+    ).digest()[:SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def make_sub_token(user_tg_id: int, secret: str) -> str:
+    """
+    Make the subscription token of a user.
+
+    The token is the user id signed with the secret, so it is checked
+    without a database lookup and never stored.
+
+    Args:
+        user_tg_id (int): The Telegram id of the user.
+        secret (str): The signing secret.
+
+    Returns:
+        str: The token, `<user_tg_id>.<signature>`.
+    """
+    return f"{user_tg_id}.{_sign(user_tg_id, secret)}"
+
+
+def parse_sub_token(token: str, secret: str) -> int:
+    """
+    Check a subscription token.
+
+    Args:
+        token (str): The token from the subscription URL.
+        secret (str): The signing secret.
+
+    Returns:
+        int: The Telegram id of the user, None if the token is not valid.
+    """
+    user_tg_id, _, signature = token.partition(".")
+    if not user_tg_id.isdigit() or not signature:
+        return None
+    expected = _sign(int(user_tg_id), secret)
+    if not hmac.compare_digest(signature.encode(), expected.encode()):
+        return None
+    return int(user_tg_id)
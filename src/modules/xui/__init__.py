@@ -1 +1,21 @@
-from .vless_api import VlessClientApi, VlessInboundApi
\ No newline at end of file
+from .session import XuiSession
+from .breaker import CircuitBreaker, BreakerState, XuiUnavailableError
+from .cache import InboundCache, InboundSnapshot, ClientRecord
+from .ports import VlessPortAllocator
+from .links import (
+    VlessLinkRenderer,
+    is_shared_inbound,
+    make_config_cached_data,
+)
+from .traffic import TrafficCollector
+from .reality import RealityKeyPool, generate_reality_key
+from .nodes import XuiNode, XuiNodePool, NodeLoad
+from .vless_api import (
+    VlessClientApi,
+    VlessInboundApi,
+    node_pool,
+    traffic_collector,
+    reality_key_pool,
+)
+from .provision import VlessProvisioner, ProvisionResult
+from .expiry import ExpiryEnforcer, expiry_enforcer
@@ -0,0 +1,111 @@
+import time
+from enum import Enum
+
+from logger import MainLogger
+
+logger = MainLogger(__name__).get()
+
+
+class XuiUnavailableError(Exception):
+    """The X-UI panel is considered unhealthy, the call was not sent."""
+
+
+class BreakerState(Enum):
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker for the X-UI panel.
+
+    After `failure_threshold` consecutive transient failures (timeouts,
+    connection errors, 5xx) the breaker opens and every call fails fast
+    with XuiUnavailableError for `cooldown_sec`. Then a single probe call
+    is let through: its success closes the breaker, its failure opens it
+    for another cool-down.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown_sec: float = 30):
+        """
+        Initialize the CircuitBreaker.
+
+        Args:
+            failure_threshold (int): Consecutive failures to open (default: 5).
+            cooldown_sec (float): Fail-fast period in seconds (default: 30).
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown_sec = cooldown_sec
+        self._failures = 0
+        self._opened_at: float = None
+        self._probing = False
+
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> BreakerState:
+        if self._opened_at is None:
+            return BreakerState.CLOSED
+        if time.monotonic() - self._opened_at < self.cooldown_sec:
+            return BreakerState.OPEN
+        return BreakerState.HALF_OPEN
+
+    @property
+    def is_open(self) -> bool:
+        """True if a call made now would fail fast."""
+        state = self.state
+        return state == BreakerState.OPEN or (
+            state == BreakerState.HALF_OPEN and self._probing
+        )
+
+    def before_call(self) -> bool:
+        """
+        Raise XuiUnavailableError if the call must not be sent.
+
+        Returns:
+            bool: True if the call is the probe of a half-open breaker, it
+                must end with record_success, record_failure or
+                cancel_call.
+        """
+        if self.is_open:
+            self.rejected += 1
+            raise XuiUnavailableError("X-UI PANEL IS UNAVAILABLE")
+        if self.state == BreakerState.HALF_OPEN:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info("X-UI PANEL IS BACK. CIRCUIT BREAKER CLOSED")
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probing or (
+            self._opened_at is None
+            and self._failures >= self.failure_threshold
+        ):
+            self._opened_at = time.monotonic()
+            self._probing = False
+            self.opens += 1
+            logger.warning(
+                f"X-UI PANEL IS UNHEALTHY ({self._failures} FAILURES). "
+                f"CIRCUIT BREAKER OPENED FOR {self.cooldown_sec}s"
+            )
+
+    def cancel_call(self) -> None:
+        """Let another call probe the panel if the probe was cancelled."""
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state.value,
+            "failures": self._failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
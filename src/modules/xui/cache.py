@@ -0,0 +1,232 @@
+import asyncio
+import time
+from typing import NamedTuple
+
+from py3xui import Inbound, Client
+
+from logger import MainLogger
+from .session import XuiSession
+
+logger = MainLogger(__name__).get()
+
+
+class ClientRecord(NamedTuple):
+    """A client of the inbound snapshot indexed by its email."""
+
+    inbound_id: int
+    uuid: str
+    flow: str
+    expiry_time: int
+    enable: bool
+
+
+def make_client_record(inbound_id: int, client: Client) -> ClientRecord:
+    return ClientRecord(
+        inbound_id=inbound_id,
+        uuid=client.id,
+        flow=client.flow,
+        expiry_time=client.expiry_time,
+        enable=client.enable,
+    )
+
+
+class InboundSnapshot:
+    """An indexed snapshot of all inbounds and clients of the X-UI panel."""
+
+    def __init__(self, inbounds: list[Inbound]):
+        """
+        Initialize the InboundSnapshot.
+
+        Args:
+            inbounds (list[Inbound]): Inbounds returned by `inbound.get_list`.
+        """
+        self.fetched_at = time.monotonic()
+        self.by_id: dict[int, Inbound] = {}
+        self.by_remark: dict[str, Inbound] = {}
+        self.by_port: dict[int, Inbound] = {}
+        self.by_email: dict[str, ClientRecord] = {}
+        for inbound in inbounds:
+            self.put(inbound)
+
+    @property
+    def inbounds(self) -> list[Inbound]:
+        return list(self.by_id.values())
+
+    def put(self, inbound: Inbound):
+        self.drop(inbound.id)
+        self.by_id[inbound.id] = inbound
+        self.by_remark[inbound.remark] = inbound
+        self.by_port[inbound.port] = inbound
+        for client in inbound.settings.clients:
+            self.by_email[client.email] = make_client_record(
+                inbound.id, client
+            )
+
+    def drop(self, inbound_id: int):
+        inbound = self.by_id.pop(inbound_id, None)
+        if inbound:
+            self.by_remark.pop(inbound.remark, None)
+            self.by_port.pop(inbound.port, None)
+            for client in inbound.settings.clients:
+                self.by_email.pop(client.email, None)
+
+    def get_client(self, email: str) -> tuple[Inbound, Client]:
+        """
+        Get the inbound and the full settings of a client by its email.
+
+        Args:
+            email (str): The email of the client.
+
+        Returns:
+            tuple[Inbound, Client]: The inbound and the client if found,
+                otherwise (None, None).
+        """
+        record = self.by_email.get(email)
+        if record:
+            inbound = self.by_id[record.inbound_id]
+            for client in inbound.settings.clients:
+                if client.email == email:
+                    return inbound, client
+        return None, None
+
+    def add_clients(self, inbound_id: int, clients: list[Client]) -> bool:
+        inbound = self.by_id.get(inbound_id)
+        if not inbound:
+            return False
+        inbound.settings.clients.extend(clients)
+        for client in clients:
+            self.by_email[client.email] = make_client_record(
+                inbound_id, client
+            )
+        return True
+
+    def update_client(self, inbound_id: int, client: Client) -> bool:
+        inbound = self.by_id.get(inbound_id)
+        if not inbound:
+            return False
+        clients = inbound.settings.clients
+        for idx, cached_client in enumerate(clients):
+            if cached_client.id == client.id:
+                clients[idx] = client
+                self.by_email.pop(cached_client.email, None)
+                self.by_email[client.email] = make_client_record(
+                    inbound_id, client
+                )
+                return True
+        return False
+
+    def delete_client(self, inbound_id: int, client_uuid: str) -> bool:
+        inbound = self.by_id.get(inbound_id)
+        if not inbound:
+            return False
+        clients = []
+        for client in inbound.settings.clients:
+            if client.id == client_uuid:
+                self.by_email.pop(client.email, None)
+            else:
+                clients.append(client)
+        inbound.settings.clients = clients
+        return True
+
+
+class InboundCache:
+    """
+    A TTL cache of the X-UI inbound list.
+
+    `inbound.get_list` downloads every inbound with every client, so the
+    snapshot is shared by all readers until it expires. Our own mutations
+    are written through to the snapshot instead of invalidating it.
+    """
+
+    def __init__(self, session: XuiSession, ttl_sec: float = 30):
+        """
+        Initialize the InboundCache.
+
+        Args:
+            session (XuiSession): The session used to fetch inbounds.
+            ttl_sec (float): Snapshot time to live in seconds (default: 30).
+        """
+        self.session = session
+        self.ttl_sec = ttl_sec
+        self._snapshot: InboundSnapshot = None
+        self._lock = asyncio.Lock()
+
+        self.hits = 0
+        self.refreshes = 0
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._snapshot is not None
+            and time.monotonic() - self._snapshot.fetched_at < self.ttl_sec
+        )
+
+    async def get(self, force_refresh: bool = False) -> InboundSnapshot:
+        """
+        Get the inbound snapshot, fetching it from the panel if expired.
+
+        Args:
+            force_refresh (bool): Fetch a new snapshot even if cached one is
+                still fresh (default: False).
+
+        Returns:
+            InboundSnapshot: The indexed inbound snapshot.
+        """
+        if not force_refresh and self._is_fresh():
+            self.hits += 1
+            return self._snapshot
+
+        seen_snapshot = self._snapshot
+        async with self._lock:
+            # Another coroutine could refresh it while we were waiting, a
+            # forced refresh follows a write and takes no earlier fetch:
+            if (
+                not force_refresh
+                and self._snapshot is not seen_snapshot
+                and self._is_fresh()
+            ):
+                self.hits += 1
+                return self._snapshot
+
+            inbounds = await self.session.call(
+                self.session.api.inbound.get_list
+            )
+            self._snapshot = InboundSnapshot(inbounds)
+            self.refreshes += 1
+            logger.debug(
+                f"INBOUND SNAPSHOT REFRESHED: {len(inbounds)} INBOUNDS"
+            )
+            return self._snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    # Write-through methods:
+    def put_inbound(self, inbound: Inbound):
+        if self._snapshot:
+            self._snapshot.put(inbound)
+
+    def drop_inbound(self, inbound_id: int):
+        if self._snapshot:
+            self._snapshot.drop(inbound_id)
+
+    def add_clients(self, inbound_id: int, clients: list[Client]):
+        if not (
+            self._snapshot and self._snapshot.add_clients(inbound_id, clients)
+        ):
+            self.invalidate()
+
+    def update_client(self, inbound_id: int, client: Client):
+        if not (
+            self._snapshot and self._snapshot.update_client(inbound_id, client)
+        ):
+            self.invalidate()
+
+    def delete_client(self, inbound_id: int, client_uuid: str):
+        if not (
+            self._snapshot
+            and self._snapshot.delete_client(inbound_id, client_uuid)
+        ):
+            self.invalidate()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "refreshes": self.refreshes}
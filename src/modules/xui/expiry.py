@@ -0,0 +1,240 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+
+from modules.db import DbManager, ReturnCode
+from modules.db.models import ConfigExpiryAction, ConfigExpiryResult
+from settings import settings
+from logger import MainLogger
+from .nodes import XuiNode
+from .vless_api import node_pool
+
+logger = MainLogger(__name__).get()
+
+
+class ExpiryEnforcer:
+    """
+    Disables the panel clients of expired configs.
+
+    The config `valid_to_dttm` is the source of truth. Every run handles
+    only the configs that expired since the watermark of the previous run:
+    they are read page by page with a range scan of the expiry index and
+    every client is disabled with its own panel call, sent in parallel
+    within the concurrency limit of the node session. What was done to
+    every config is stored in `config_expiry_action`.
+
+    The watermark moves past a page only when all its clients were
+    updated, a failed page is retried by the next run. Actions are
+    idempotent, so configs handled twice are harmless.
+
+    Configs expired more than `prune_after_days` ago are deleted together
+    with their panel clients, so they stop bloating the inbound lists.
+    A client renewed on the panel meanwhile is left as is.
+    """
+
+    DISABLE_JOB_NAME = "xui_expiry_disable"
+    PRUNE_JOB_NAME = "xui_expiry_prune"
+
+    def __init__(
+        self,
+        poll_interval_sec: float = 300,
+        batch_size: int = 500,
+        prune_after_days: int = 0,
+    ):
+        """
+        Initialize the ExpiryEnforcer.
+
+        Args:
+            poll_interval_sec (float): Seconds between runs (default: 300).
+            batch_size (int): Configs read and handled at a time
+                (default: 500).
+            prune_after_days (int): Days after expiry a config is deleted,
+                0 to keep expired configs (default: 0).
+        """
+        self.poll_interval_sec = poll_interval_sec
+        self.batch_size = batch_size
+        self.prune_after_days = prune_after_days
+
+    async def enforce(self) -> dict[ConfigExpiryAction, Counter]:
+        """
+        Handle the configs expired since the previous run.
+
+        Returns:
+            dict[ConfigExpiryAction, Counter]: Results of every action.
+        """
+        now = datetime.now()
+        done = {
+            ConfigExpiryAction.DISABLE: await self._run_job(
+                self.DISABLE_JOB_NAME, ConfigExpiryAction.DISABLE, now
+            )
+        }
+        if self.prune_after_days:
+            done[ConfigExpiryAction.PRUNE] = await self._run_job(
+                self.PRUNE_JOB_NAME,
+                ConfigExpiryAction.PRUNE,
+                now - timedelta(days=self.prune_after_days),
+            )
+        return done
+
+    async def _run_job(
+        self, job_name: str, action: ConfigExpiryAction, to_dttm: datetime
+    ) -> Counter:
+        from_dttm = await DbManager.get_job_watermark(job_name)
+        results = Counter()
+        if from_dttm is not None and from_dttm >= to_dttm:
+            return results
+
+        # Start from fresh snapshots, clients renewed on the panel are kept:
+        await asyncio.gather(
+            *[
+                node.inbound_cache.get(force_refresh=True)
+                for node in node_pool.nodes
+            ],
+            return_exceptions=True,
+        )
+        after = None
+        while True:
+            rows = await DbManager.get_expired_service_configs(
+                from_dttm, to_dttm, after, self.batch_size
+            )
+            if not rows:
+                break
+            try:
+                actions = await self._apply(action, rows, to_dttm)
+            except Exception as e:
+                # The next run starts from the first config of the page:
+                await DbManager.set_job_watermark(
+                    job_name, rows[0].valid_to_dttm - timedelta(microseconds=1)
+                )
+                raise Exception(
+                    f"BAD TRY TO {action.value} {len(rows)} EXPIRED CONFIGS: "
+                    f"{e}"
+                )
+            resp = await DbManager.add_config_expiry_actions(actions)
+            if resp != ReturnCode.SUCCESS:
+                logger.error(f"BAD TRY TO ADD CONFIG EXPIRY ACTIONS: {resp}")
+            results.update(row["result"] for row in actions)
+            after = (rows[-1].valid_to_dttm, rows[-1].service_config_id)
+
+        resp = await DbManager.set_job_watermark(job_name, to_dttm)
+        if resp != ReturnCode.SUCCESS:
+            raise Exception(f"BAD TRY TO SET {job_name} WATERMARK: {resp}")
+        if results:
+            logger.info(
+                f"EXPIRED CONFIGS {action.value}: "
+                + ", ".join(f"{k} {v}" for k, v in sorted(results.items()))
+            )
+        return results
+
+    async def _apply(
+        self, action: ConfigExpiryAction, rows: list, to_dttm: datetime
+    ) -> list[dict]:
+        """
+        Apply the action to the panel clients of a page of configs.
+
+        Returns:
+            list[dict]: Rows of `config_expiry_action`.
+        """
+        now_ms = int(datetime.now().timestamp() * 1000)
+        results: dict[str, ConfigExpiryResult] = {}
+        nodes: dict[str, XuiNode] = {}
+        clients = {}
+        for row in rows:
+            try:
+                node = node_pool.get(row.node_name)
+            except Exception as e:
+                logger.warning(e)
+                results[row.config_name] = ConfigExpiryResult.NOT_FOUND
+                continue
+            snapshot = await node.inbound_cache.get()
+            client = snapshot.by_email.get(row.config_name)
+            if client is None:
+                results[row.config_name] = ConfigExpiryResult.NOT_FOUND
+            elif client.expiry_time > now_ms:
+                # Renewed on the panel, the database is not updated yet:
+                results[row.config_name] = ConfigExpiryResult.RENEWED
+            else:
+                nodes[row.config_name] = node
+                clients[row.config_name] = client
+
+        if action == ConfigExpiryAction.PRUNE:
+            pruned_ids = set(
+                await DbManager.prune_service_configs(
+                    [
+                        row.service_config_id
+                        for row in rows
+                        if results.get(row.config_name)
+                        != ConfigExpiryResult.RENEWED
+                    ],
+                    to_dttm,
+                )
+            )
+            for row in rows:
+                if row.service_config_id in pruned_ids:
+                    node_pool.forget(row.config_name)
+                    if row.config_name not in clients:
+                        # Nothing to delete on the panel:
+                        results[row.config_name] = ConfigExpiryResult.DONE
+                elif row.config_name not in results:
+                    # Renewed in the database:
+                    del clients[row.config_name]
+                    results[row.config_name] = ConfigExpiryResult.RENEWED
+
+        async def apply_client(node: XuiNode, email: str):
+            # One client call per config: an inbound update would overwrite
+            # the clients changed since the snapshot was fetched.
+            snapshot = await node.inbound_cache.get()
+            inbound, client = snapshot.get_client(email)
+            if client is None:
+                return
+            if action == ConfigExpiryAction.PRUNE:
+                await node.session.call(
+                    node.api.client.delete, inbound.id, client.id
+                )
+                node.inbound_cache.delete_client(inbound.id, client.id)
+            elif client.expiry_time > now_ms:
+                # Renewed by the bot while the page was handled:
+                results[email] = ConfigExpiryResult.RENEWED
+            elif client.enable:
+                new_client = client.model_copy(
+                    update={"inbound_id": inbound.id, "enable": False}
+                )
+                await node.session.call(
+                    node.api.client.update, new_client.id, new_client
+                )
+                node.inbound_cache.update_client(inbound.id, new_client)
+
+        # Pruned configs are already deleted, clients left on a failure
+        # are orphans for the reconciler:
+        await asyncio.gather(
+            *[apply_client(nodes[email], email) for email in clients]
+        )
+        for email in clients:
+            results.setdefault(email, ConfigExpiryResult.DONE)
+
+        return [
+            {
+                "service_config_id": row.service_config_id,
+                "valid_to_dttm": row.valid_to_dttm,
+                "action": action.value,
+                "config_name": row.config_name,
+                "node_name": row.node_name,
+                "result": results[row.config_name].value,
+            }
+            for row in rows
+        ]
+
+    async def run(self):
+        """Enforce expiry forever, a failed run is retried next interval."""
+        while True:
+            try:
+                await self.enforce()
+            except Exception as e:
+                logger.error(f"BAD TRY TO ENFORCE CONFIG EXPIRY: {e}")
+            await asyncio.sleep(self.poll_interval_sec)
+
+
+expiry_enforcer = ExpiryEnforcer(
+    poll_interval_sec=settings.XUI_EXPIRY_POLL_SEC,
+    prune_after_days=settings.XUI_EXPIRY_PRUNE_AFTER_DAYS,
+)
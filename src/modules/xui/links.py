@@ -0,0 +1,142 @@
+import hashlib
+from datetime import datetime
+
+from py3xui import Inbound, Client
+
+# Remark prefix of the inbounds shared by clients of many users:
+SHARED_INBOUND_PREFIX = "shared_"
+
+
+def is_shared_inbound(inbound_remark: str) -> bool:
+    return inbound_remark.startswith(SHARED_INBOUND_PREFIX)
+
+
+def make_config_cached_data(
+    config_path: str, conf_expired_dttm: datetime
+) -> dict:
+    """The `cached_data` of a config read by the bot and the sub server."""
+    return {
+        "config_path": config_path,
+        "config_path_add_dttm": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "conf_expired_dttm": conf_expired_dttm.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+class VlessLinkTemplate:
+    """A VLESS link of an inbound with the client parts left blank."""
+
+    def __init__(self, inbound: Inbound, server_host: str):
+        """
+        Compile the link template of the inbound.
+
+        Args:
+            inbound (Inbound): The inbound with reality stream settings.
+            server_host (str): The host clients connect to.
+        """
+        stream_settings = inbound.stream_settings
+        reality_settings = stream_settings.reality_settings
+        ib_snif = reality_settings["serverNames"][0]
+        ib_sid = reality_settings["shortIds"][0]
+        ib_pbk = reality_settings["settings"]["publicKey"]
+        ib_fp = reality_settings["settings"]["fingerprint"]
+        ib_spx = reality_settings["settings"]["spiderX"]
+
+        self._server_part = (
+            f"@{server_host}:{inbound.port}?type={stream_settings.network}"
+            f"&security={stream_settings.security}&pbk={ib_pbk}&fp={ib_fp}"
+            f"&sni={ib_snif}&sid={ib_sid}&spx={ib_spx}&flow="
+        )
+        # A shared inbound name means nothing to the user:
+        if is_shared_inbound(inbound.remark):
+            self._remark_part = "#"
+        else:
+            self._remark_part = f"#{inbound.remark}-"
+
+    def render(self, client: Client) -> str:
+        return (
+            "vless://"
+            + client.id
+            + self._server_part
+            + client.flow
+            + self._remark_part
+            + client.email
+        )
+
+
+class VlessLinkRenderer:
+    """
+    Renders VLESS links from inbounds without panel calls.
+
+    Templates are compiled once per inbound and keyed by the hash of the
+    parts of the inbound that end up in the link, so an inbound whose
+    reality settings changed gets a new template automatically.
+    """
+
+    def __init__(self, server_host: str):
+        """
+        Initialize the VlessLinkRenderer.
+
+        Args:
+            server_host (str): The host clients connect to.
+        """
+        self.server_host = server_host
+        self._templates: dict[int, tuple[str, VlessLinkTemplate]] = {}
+
+    @staticmethod
+    def _inbound_hash(inbound: Inbound) -> str:
+        data = (
+            f"{inbound.port}:{inbound.remark}:"
+            + inbound.stream_settings.model_dump_json(by_alias=True)
+        )
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def get_template(self, inbound: Inbound) -> VlessLinkTemplate:
+        """
+        Get the compiled link template of the inbound.
+
+        Args:
+            inbound (Inbound): The inbound with reality stream settings.
+
+        Returns:
+            VlessLinkTemplate: The cached or newly compiled template.
+        """
+        inbound_hash = self._inbound_hash(inbound)
+        cached = self._templates.get(inbound.id)
+        if cached and cached[0] == inbound_hash:
+            return cached[1]
+
+        template = VlessLinkTemplate(inbound, self.server_host)
+        self._templates[inbound.id] = (inbound_hash, template)
+        return template
+
+    def render(self, inbound: Inbound, client: Client) -> str:
+        """
+        Render the link of one client of the inbound.
+
+        Args:
+            inbound (Inbound): The inbound of the client.
+            client (Client): The client from the inbound settings.
+
+        Returns:
+            str: The VLESS connection link.
+        """
+        return self.get_template(inbound).render(client)
+
+    def render_inbound(self, inbound: Inbound) -> dict[str, str]:
+        """
+        Render the links of all clients of the inbound in a single pass.
+
+        Args:
+            inbound (Inbound): The inbound with clients in its settings.
+
+        Returns:
+            dict[str, str]: VLESS connection links by client email.
+        """
+        template = self.get_template(inbound)
+        return {
+            client.email: template.render(client)
+            for client in inbound.settings.clients
+        }
+
+    def drop(self, inbound_id: int):
+        self._templates.pop(inbound_id, None)
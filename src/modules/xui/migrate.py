@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+from datetime import datetime
+
+from py3xui import Inbound, Client
+
+from modules.db import DbManager, ReturnCode
+from logger import MainLogger
+from .links import is_shared_inbound, make_config_cached_data
+from .nodes import XuiNode
+from .vless_api import VlessInboundApi, node_pool
+
+logger = MainLogger(__name__).get()
+
+
+class SharedInboundMigrator:
+    """
+    Moves the clients of per-user inbounds into shared inbounds.
+
+    3x-ui keeps client emails unique across inbounds, so a batch of user
+    inbounds is deleted before their clients are added to the shared
+    inbounds. Their ports stay reserved until the add succeeds. Clients
+    keep their uuid, expiry and flow, but their links change (port and
+    name): the cached links of the moved configs are replaced by the
+    shared inbound links, which the subscription server serves.
+
+    If a batch fails, the clients it added to shared inbounds are deleted
+    and its user inbounds are added back from the snapshot copies, with
+    the same ports, keys and clients, so the old links keep working.
+    """
+
+    def __init__(self, batch_size: int = 50):
+        """
+        Initialize the SharedInboundMigrator.
+
+        Args:
+            batch_size (int): User inbounds moved at a time (default: 50).
+        """
+        self.batch_size = batch_size
+
+    async def migrate_node(self, node: XuiNode, dry_run: bool = False) -> int:
+        """
+        Move the clients of all user inbounds of the node.
+
+        Args:
+            node (XuiNode): The node to migrate.
+            dry_run (bool): Only count the clients to move (default: False).
+
+        Returns:
+            int: The number of moved (or movable) clients.
+        """
+        snapshot = await node.inbound_cache.get(force_refresh=True)
+        # Per-user inbounds are named by the user Telegram id:
+        user_inbounds = [
+            inbound
+            for inbound in snapshot.inbounds
+            if inbound.remark.isdigit()
+        ]
+        clients_cnt = sum(
+            len(inbound.settings.clients) for inbound in user_inbounds
+        )
+        logger.info(
+            f"NODE {node.name}: {len(user_inbounds)} USER INBOUNDS, "
+            f"{clients_cnt} CLIENTS TO MOVE"
+        )
+        if dry_run:
+            return clients_cnt
+
+        inbound_api = VlessInboundApi(node)
+        moved_cnt = 0
+        for i in range(0, len(user_inbounds), self.batch_size):
+            batch = user_inbounds[i : i + self.batch_size]
+            clients = [
+                client.model_copy(update={"inbound_id": None})
+                for inbound in batch
+                for client in inbound.settings.clients
+            ]
+            deleted = await asyncio.gather(
+                *[self._delete_inbound(node, inbound) for inbound in batch],
+                return_exceptions=True,
+            )
+            deleted_inbounds = [
+                inbound
+                for inbound, res in zip(batch, deleted)
+                if not isinstance(res, Exception)
+            ]
+            try:
+                for res in deleted:
+                    if isinstance(res, Exception):
+                        raise res
+                inbound_ids = await inbound_api.add_shared_clients(clients)
+            except Exception as e:
+                logger.error(
+                    f"BAD TRY TO MOVE {len(clients)} CLIENTS "
+                    f"OF NODE {node.name}, RESTORING USER INBOUNDS: {e}"
+                )
+                await self._restore(node, deleted_inbounds, clients)
+                raise e
+
+            await asyncio.gather(
+                *[
+                    node.port_allocator.release(inbound.remark)
+                    for inbound in batch
+                ]
+            )
+            resp = await DbManager.update_service_configs_cached_data(
+                await self._cached_links(node, inbound_ids, clients)
+            )
+            if resp not in (ReturnCode.SUCCESS, ReturnCode.NOT_FOUND):
+                logger.warning(f"BAD TRY TO UPDATE CACHED LINKS: {resp}")
+            moved_cnt += len(clients)
+            logger.info(
+                f"NODE {node.name}: {moved_cnt}/{clients_cnt} CLIENTS MOVED"
+            )
+        return moved_cnt
+
+    @staticmethod
+    async def _delete_inbound(node: XuiNode, inbound: Inbound):
+        """Delete the user inbound, its port stays reserved."""
+        await node.session.call(node.api.inbound.delete, inbound.id)
+        node.inbound_cache.drop_inbound(inbound.id)
+        node.link_renderer.drop(inbound.id)
+
+    @staticmethod
+    async def _restore(
+        node: XuiNode, inbounds: list[Inbound], clients: list[Client]
+    ):
+        """
+        Undo a failed batch: delete the clients already added to shared
+        inbounds, then add the deleted user inbounds back.
+        """
+        snapshot = await node.inbound_cache.get(force_refresh=True)
+        for client in clients:
+            inbound, added = snapshot.get_client(client.email)
+            if added is None or not is_shared_inbound(inbound.remark):
+                continue
+            try:
+                await node.session.call(
+                    node.api.client.delete, inbound.id, added.id
+                )
+                node.inbound_cache.delete_client(inbound.id, added.id)
+            except Exception as e:
+                logger.error(
+                    f'BAD TRY TO DELETE MOVED CLIENT "{client.email}" '
+                    f"OF NODE {node.name}: {e}"
+                )
+
+        for inbound in inbounds:
+            try:
+                await node.session.call(
+                    node.api.inbound.add,
+                    inbound.model_copy(update={"id": 0, "client_stats": None}),
+                )
+            except Exception as e:
+                logger.error(
+                    f"BAD TRY TO RESTORE INBOUND {inbound.remark} "
+                    f"OF NODE {node.name}, RUN RECONCILE WITH REPAIR: {e}"
+                )
+        node.inbound_cache.invalidate()
+
+    @staticmethod
+    async def _cached_links(
+        node: XuiNode, inbound_ids: list[int], clients: list[Client]
+    ) -> dict[str, dict]:
+        """The cached data of the moved configs with their new links."""
+        snapshot = await node.inbound_cache.get()
+        links = {}
+        for inbound_id in inbound_ids:
+            links |= node.link_renderer.render_inbound(
+                snapshot.by_id[inbound_id]
+            )
+        return {
+            client.email: make_config_cached_data(
+                links[client.email],
+                datetime.fromtimestamp(client.expiry_time / 1000),
+            )
+            for client in clients
+            if client.email in links
+        }
+
+    async def run(
+        self, dry_run: bool = False, node_name: str = None
+    ) -> dict[str, int]:
+        """
+        Move the clients of user inbounds on every node (or one of them).
+
+        Args:
+            dry_run (bool): Only count the clients to move (default: False).
+            node_name (str): Migrate only this node (default: all nodes).
+
+        Returns:
+            dict[str, int]: Moved (or movable) clients by node name.
+        """
+        nodes = [node_pool.get(node_name)] if node_name else node_pool.nodes
+        results = {}
+        for node in nodes:
+            results[node.name] = await self.migrate_node(node, dry_run)
+        return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Move clients of per-user inbounds into shared inbounds"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only count the clients"
+    )
+    parser.add_argument("--node", help="migrate one node (default: all)")
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    await SharedInboundMigrator(batch_size=args.batch_size).run(
+        dry_run=args.dry_run, node_name=args.node
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,288 @@
+import asyncio
+from typing import NamedTuple
+
+from modules.db import DbManager
+from modules.db.cache import TtlLruCache
+from logger import MainLogger
+from .session import XuiSession
+from .breaker import XuiUnavailableError
+from .cache import InboundCache
+from .ports import VlessPortAllocator
+from .links import VlessLinkRenderer
+
+logger = MainLogger(__name__).get()
+
+
+class NodeLoad(NamedTuple):
+    """The load of a node at the moment of a placement."""
+
+    node: "XuiNode"
+    clients: int
+    free_ports: int
+    latency_sec: float
+
+
+class XuiNode:
+    """
+    One 3x-ui panel (node) with its own session, inbound cache, port range
+    and link templates.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        session: XuiSession,
+        first_port: int,
+        last_port: int,
+        inbound_cache_ttl_sec: float = 30,
+    ):
+        """
+        Initialize the XuiNode.
+
+        Args:
+            name (str): The name of the node, stored with its configs.
+            session (XuiSession): The session of the node panel.
+            first_port (int): The first inbound port of the node.
+            last_port (int): The last inbound port of the node (inclusive).
+            inbound_cache_ttl_sec (float): Inbound snapshot time to live in
+                seconds (default: 30).
+        """
+        self.name = name
+        self.session = session
+        self.api = session.api
+        self.inbound_cache = InboundCache(session, inbound_cache_ttl_sec)
+        self.port_allocator = VlessPortAllocator(
+            self.inbound_cache, first_port, last_port
+        )
+        self.link_renderer = VlessLinkRenderer(
+            self.api.server.host.split("//")[1].split(":")[0]
+        )
+        # Serializes shared inbound choice and client adds:
+        self.shared_inbound_lock = asyncio.Lock()
+
+    @property
+    def is_available(self) -> bool:
+        return not self.session.breaker.is_open
+
+    async def load(self) -> NodeLoad:
+        """
+        Get the current load of the node.
+
+        Returns:
+            NodeLoad: Clients on the panel, free ports and panel latency.
+        """
+        snapshot, free_ports = await asyncio.gather(
+            self.inbound_cache.get(), self.port_allocator.count_free()
+        )
+        return NodeLoad(
+            node=self,
+            clients=len(snapshot.by_email),
+            free_ports=free_ports,
+            latency_sec=self.session.latency_ewma_sec or 0,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "session": self.session.stats(),
+            "inbound_cache": self.inbound_cache.stats(),
+        }
+
+
+class XuiNodePool:
+    """
+    The 3x-ui panels (nodes) configs are spread across.
+
+    All configs of a user live in the user inbound, so they share a node:
+    a new user is placed on the least loaded node, the next configs follow
+    the inbound. The inbound node is found by its reserved port, every node
+    has its own port range. The node of a config is stored with the config
+    and client operations are routed by it.
+    """
+
+    def __init__(
+        self,
+        nodes: list[XuiNode],
+        latency_ref_sec: float = 0.5,
+        config_cache_size: int = 100000,
+        config_cache_ttl_sec: float = 3600,
+    ):
+        """
+        Initialize the XuiNodePool.
+
+        Args:
+            nodes (list[XuiNode]): The nodes, the first one is the default
+                node of configs without a stored node.
+            latency_ref_sec (float): Panel latency that doubles the load
+                score of a node (default: 0.5).
+            config_cache_size (int): Max configs whose node is kept
+                (default: 100000).
+            config_cache_ttl_sec (float): Seconds the node of a config is
+                kept, configs moved by other replicas are seen after it
+                (default: 3600).
+        """
+        names = [node.name for node in nodes]
+        if not nodes or len(set(names)) != len(names):
+            raise ValueError(f"X-UI NODE NAMES MUST BE UNIQUE: {names}")
+        ranges = sorted(
+            (node.port_allocator.first_port, node.port_allocator.last_port)
+            for node in nodes
+        )
+        for (_, prev_last), (first, _) in zip(ranges, ranges[1:]):
+            if first <= prev_last:
+                raise ValueError(f"X-UI NODE PORT RANGES OVERLAP: {ranges}")
+
+        self.nodes = nodes
+        self.default = nodes[0]
+        self.latency_ref_sec = latency_ref_sec
+        self._by_name = {node.name: node for node in nodes}
+        # config_name => XuiNode, only of configs stored in the database:
+        self._config_nodes = TtlLruCache(
+            config_cache_size, config_cache_ttl_sec
+        )
+
+    @property
+    def is_available(self) -> bool:
+        return any(node.is_available for node in self.nodes)
+
+    def get(self, node_name: str = None) -> XuiNode:
+        """
+        Get a node by its name.
+
+        Args:
+            node_name (str): The node name, None for the default node.
+
+        Returns:
+            XuiNode: The node, raises an exception if it is not configured.
+        """
+        if node_name is None:
+            return self.default
+        node = self._by_name.get(node_name)
+        if node is None:
+            raise Exception(f"X-UI NODE {node_name} IS NOT CONFIGURED")
+        return node
+
+    def get_by_port(self, port: int) -> XuiNode:
+        for node in self.nodes:
+            if node.port_allocator.owns(port):
+                return node
+        return None
+
+    def _score(self, load: NodeLoad) -> float:
+        # A slow panel counts as a more loaded one:
+        return (load.clients + 1) * (
+            1 + load.latency_sec / self.latency_ref_sec
+        )
+
+    async def place(self) -> XuiNode:
+        """
+        Choose the node for a new user inbound.
+
+        The node with the fewest clients weighted by its recent latency
+        wins, nodes with an open circuit breaker or without free ports are
+        skipped.
+
+        Returns:
+            XuiNode: The chosen node, raises XuiUnavailableError if none.
+        """
+        candidates = [node for node in self.nodes if node.is_available]
+        loads = await asyncio.gather(
+            *[node.load() for node in candidates], return_exceptions=True
+        )
+        usable = []
+        for node, load in zip(candidates, loads):
+            if isinstance(load, Exception):
+                logger.warning(f"X-UI NODE {node.name} SKIPPED: {load!r}")
+            elif load.free_ports > 0:
+                usable.append(load)
+        if not usable:
+            raise XuiUnavailableError("NO X-UI NODE AVAILABLE FOR NEW CONFIGS")
+
+        best = min(
+            usable, key=lambda load: (self._score(load), -load.free_ports)
+        )
+        logger.info(
+            f"X-UI NODE {best.node.name} PLACED: {best.clients} CLIENTS, "
+            f"{best.free_ports} FREE PORTS, "
+            f"{best.latency_sec * 1000:.0f}ms LATENCY"
+        )
+        return best.node
+
+    async def get_inbound_node(self, inbound_name: str) -> XuiNode:
+        """
+        Get the node of the inbound, placing a new inbound on the least
+        loaded node.
+
+        Args:
+            inbound_name (str): The name (remark) of the inbound.
+
+        Returns:
+            XuiNode: The node of the inbound.
+        """
+        port = await DbManager.get_reserved_vless_port(inbound_name)
+        node = self.get_by_port(port) if port else None
+        if node is not None:
+            return node
+        return await self.place()
+
+    async def locate(self, config_name: str) -> XuiNode:
+        """
+        Get the node of the config.
+
+        Args:
+            config_name (str): The name (client email) of the config.
+
+        Returns:
+            XuiNode: The node stored with the config, the default node for
+                configs without one.
+        """
+        return (await self.locate_many([config_name]))[config_name]
+
+    async def locate_many(self, config_names: list[str]) -> dict:
+        """
+        Get the nodes of the configs with one query for the ones not
+        located yet.
+
+        Args:
+            config_names (list[str]): The names (client emails) of configs.
+
+        Returns:
+            dict[str, XuiNode]: The node of every config, the default node
+                for configs without one.
+        """
+        nodes = {}
+        missing = []
+        for config_name in config_names:
+            node = self._config_nodes.get(config_name)
+            if node is None:
+                missing.append(config_name)
+            else:
+                nodes[config_name] = node
+        if missing:
+            node_names = await DbManager.get_service_config_node_names(missing)
+            for config_name in missing:
+                nodes[config_name] = self.get(node_names.get(config_name))
+                # A config not stored yet may be created on another node:
+                if config_name in node_names:
+                    self._config_nodes.put(config_name, nodes[config_name])
+        return nodes
+
+    def remember(self, config_name: str, node: XuiNode):
+        self._config_nodes.put(config_name, node)
+
+    def forget(self, config_name: str):
+        self._config_nodes.invalidate(config_name)
+
+    async def reconcile_ports(self) -> bool:
+        """
+        Reconcile the port ranges of all nodes with their panels.
+
+        Returns:
+            bool: True if the ports of every node were reconciled.
+        """
+        results = await asyncio.gather(
+            *[node.port_allocator.reconcile() for node in self.nodes]
+        )
+        return all(results)
+
+    def stats(self) -> dict:
+        return {node.name: node.stats() for node in self.nodes}
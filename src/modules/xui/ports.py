@@ -0,0 +1,114 @@
+from modules.db import DbManager, ReturnCode
+from logger import MainLogger
+from .cache import InboundCache
+
+logger = MainLogger(__name__).get()
+
+
+class VlessPortAllocator:
+    """
+    Allocates VLESS inbound ports from a range persisted in the database.
+
+    Every port of the range is a row of `vless_port`, free rows form the
+    free list. A reservation takes the lowest free row with
+    `FOR UPDATE SKIP LOCKED`, so parallel reservations never get the same
+    port, even from different bot replicas.
+    """
+
+    def __init__(
+        self, inbound_cache: InboundCache, first_port: int, last_port: int
+    ):
+        """
+        Initialize the VlessPortAllocator.
+
+        Args:
+            inbound_cache (InboundCache): The cache used to read panel ports.
+            first_port (int): The first port of the range.
+            last_port (int): The last port of the range (inclusive).
+        """
+        self.inbound_cache = inbound_cache
+        self.first_port = first_port
+        self.last_port = last_port
+
+    async def reconcile(self) -> bool:
+        """
+        Fill the port range and sync reservations with the panel inbounds.
+
+        Returns:
+            bool: True if the ports were reconciled.
+        """
+        try:
+            await DbManager.init_vless_ports(self.first_port, self.last_port)
+            snapshot = await self.inbound_cache.get(force_refresh=True)
+            used_ports = {
+                inbound.port: inbound.remark for inbound in snapshot.inbounds
+            }
+            resp = await DbManager.sync_vless_ports(
+                used_ports, self.first_port, self.last_port
+            )
+            logger.info(
+                f"VLESS PORTS RECONCILED WITH PANEL: {len(used_ports)} USED"
+            )
+            return resp == ReturnCode.SUCCESS
+        except Exception as e:
+            logger.error(f"BAD TRY TO RECONCILE VLESS PORTS: {e}")
+            return False
+
+    async def reserve(self, inbound_remark: str) -> int:
+        """
+        Reserve a port for the inbound.
+
+        Args:
+            inbound_remark (str): The remark (name) of the inbound.
+
+        Returns:
+            int: The reserved port, the same one on repeated calls.
+        """
+        port = await DbManager.reserve_vless_port(
+            inbound_remark, self.first_port, self.last_port
+        )
+        if port is None:
+            logger.error("NO FREE PORTS FOR VLESS CONF")
+            raise Exception("NO FREE PORTS FOR VLESS CONF")
+        if not self.owns(port):
+            # The remark already has a port in the range of another node:
+            raise Exception(
+                f"INBOUND {inbound_remark} HAS PORT {port} "
+                f"OUT OF RANGE {self.first_port}-{self.last_port}"
+            )
+        return port
+
+    def owns(self, port: int) -> bool:
+        """
+        Check whether the port belongs to the range of the allocator.
+
+        Args:
+            port (int): The port to check.
+
+        Returns:
+            bool: True if the port is in the range.
+        """
+        return self.first_port <= port <= self.last_port
+
+    async def count_free(self) -> int:
+        """
+        Count the free ports of the range.
+
+        Returns:
+            int: The number of ports without an inbound.
+        """
+        return await DbManager.count_free_vless_ports(
+            self.first_port, self.last_port
+        )
+
+    async def release(self, inbound_remark: str) -> ReturnCode:
+        """
+        Return the port of the inbound to the free list.
+
+        Args:
+            inbound_remark (str): The remark (name) of the inbound.
+
+        Returns:
+            ReturnCode: SUCCESS if the port was released.
+        """
+        return await DbManager.release_vless_port(inbound_remark)
@@ -0,0 +1,143 @@
+import asyncio
+import time
+from typing import NamedTuple
+from datetime import datetime, timedelta
+
+from settings import settings
+from logger import MainLogger
+from .vless_api import VlessClientApi, VlessInboundApi, node_pool
+
+logger = MainLogger(__name__).get()
+
+
+class ProvisionResult(NamedTuple):
+    """A provisioned VLESS config."""
+
+    node_name: str
+    inbound_id: int
+    client_email: str
+    client_uuid: str
+    expired_dttm: datetime
+    link: str
+
+
+class VlessProvisioner:
+    """
+    Provisions a VLESS config (inbound, client and link) in one pass.
+
+    The client is created with its final expiry, the uuid is derived
+    locally and the link is rendered from the inbound snapshot, so a new
+    config costs at most 3 panel round-trips: the inbound list, the inbound
+    or client creation and, for a new inbound, the refresh of its id.
+    A new inbound is placed on the least loaded node of the pool, the
+    configs of an existing one stay on its node.
+
+    In the shared mode configs do not get a per-user inbound: every config
+    is placed on the least loaded node and packed into its shared inbounds.
+    """
+
+    def __init__(
+        self, flow: str = "xtls-rprx-vision", shared_inbounds: bool = None
+    ):
+        """
+        Initialize the VlessProvisioner.
+
+        Args:
+            flow (str): The flow type for the client (default: 'xtls-rprx-vision').
+            shared_inbounds (bool): Pack clients into shared inbounds
+                (default: XUI_INBOUND_MODE is "shared").
+        """
+        self.flow = flow
+        if shared_inbounds is None:
+            shared_inbounds = settings.XUI_INBOUND_MODE == "shared"
+        self.shared_inbounds = shared_inbounds
+
+    async def provision(
+        self, inbound_name: str, client_email: str, expired_delta_days: int
+    ) -> ProvisionResult:
+        """
+        Create the client (and its inbound if needed) with the final expiry.
+
+        Args:
+            inbound_name (str): The name (remark) of the user inbound,
+                not used in the shared mode.
+            client_email (str): The email address of the client.
+            expired_delta_days (int): The number of days until the client expires.
+
+        Returns:
+            ProvisionResult: The node, inbound, client uuid, expiry and link.
+        """
+        timings = {}
+        started = step_started = time.perf_counter()
+
+        def step_done(step: str):
+            nonlocal step_started
+            now = time.perf_counter()
+            timings[step] = now - step_started
+            step_started = now
+
+        if self.shared_inbounds:
+            node = await node_pool.place()
+        else:
+            node = await node_pool.get_inbound_node(inbound_name)
+        step_done("node")
+
+        client_api = VlessClientApi(flow=self.flow, node=node)
+        new_client = client_api.build_vless_client(
+            client_email, datetime.now() + timedelta(expired_delta_days)
+        )
+
+        if self.shared_inbounds:
+            snapshot, inbound_port = await node.inbound_cache.get(), None
+            step_done("snapshot")
+        else:
+            # Independent: the panel inbound list and the port reservation
+            snapshot, inbound_port = await asyncio.gather(
+                node.inbound_cache.get(),
+                node.port_allocator.reserve(inbound_name),
+            )
+            step_done("snapshot_and_port")
+
+        inbound = snapshot.by_remark.get(inbound_name)
+        if client_email in snapshot.by_email:
+            logger.debug(f'Client: "{client_email}" already exists! Skipped!')
+        elif self.shared_inbounds:
+            await VlessInboundApi(node).add_shared_clients([new_client])
+            step_done("shared_client_add")
+        elif inbound:
+            await node.session.call(
+                node.api.client.add,
+                inbound_id=inbound.id,
+                clients=[new_client],
+            )
+            node.inbound_cache.add_clients(inbound.id, [new_client])
+            step_done("client_add")
+        else:
+            await VlessInboundApi(node).make_vless_inbound(
+                inbound_name, inbound_port, clients=[new_client]
+            )
+            step_done("inbound_add")
+        node_pool.remember(client_email, node)
+
+        snapshot = await node.inbound_cache.get()
+        client = snapshot.by_email[client_email]
+        link = await client_api.get_vless_client_link_by_email(client_email)
+        step_done("link")
+
+        total = time.perf_counter() - started
+        logger.info(
+            f"PROVISIONED {client_email} ON {node.name} "
+            f"IN {total * 1000:.0f}ms ("
+            + ", ".join(
+                f"{step}: {sec * 1000:.0f}ms" for step, sec in timings.items()
+            )
+            + ")"
+        )
+        return ProvisionResult(
+            node_name=node.name,
+            inbound_id=client.inbound_id,
+            client_email=client_email,
+            client_uuid=client.uuid,
+            expired_dttm=datetime.fromtimestamp(client.expiry_time / 1000),
+            link=link,
+        )
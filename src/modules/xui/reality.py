@@ -0,0 +1,183 @@
+import asyncio
+import base64
+import random
+import secrets
+
+from modules.db import DbManager, ReturnCode
+from logger import MainLogger
+
+logger = MainLogger(__name__).get()
+
+# Curve25519 field prime and the (A - 2) / 4 constant (RFC 7748):
+X25519_P = 2**255 - 19
+X25519_A24 = 121665
+X25519_BASE_POINT = (9).to_bytes(32, "little")
+
+# Hex lengths of the shortIds of a key, one shortId per length:
+SHORT_ID_BYTES = range(1, 9)
+
+
+def x25519(scalar: bytes, u_point: bytes) -> bytes:
+    """
+    The X25519 function of RFC 7748 (Montgomery ladder).
+
+    Not constant-time: it is only used to generate keys of our own
+    inbounds, no secret is ever processed on request of a peer.
+
+    Args:
+        scalar (bytes): The 32-byte scalar (private key), clamped here.
+        u_point (bytes): The 32-byte u-coordinate.
+
+    Returns:
+        bytes: The 32-byte u-coordinate of scalar * u_point.
+    """
+    k = bytearray(scalar)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    k = int.from_bytes(k, "little")
+    x1 = int.from_bytes(u_point, "little") & ((1 << 255) - 1)
+    p = X25519_P
+
+    x2, z2, x3, z3, swap = 1, 0, x1, 1, 0
+    for t in reversed(range(255)):
+        k_t = (k >> t) & 1
+        swap ^= k_t
+        if swap:
+            x2, x3, z2, z3 = x3, x2, z3, z2
+        swap = k_t
+
+        a = x2 + z2
+        aa = a * a % p
+        b = x2 - z2
+        bb = b * b % p
+        e = aa - bb
+        c = x3 + z3
+        d = x3 - z3
+        da = d * a % p
+        cb = c * b % p
+        x3 = (da + cb) ** 2 % p
+        z3 = x1 * (da - cb) ** 2 % p
+        x2 = aa * bb % p
+        z2 = e * (aa + X25519_A24 * e) % p
+    if swap:
+        x2, x3, z2, z3 = x3, x2, z3, z2
+    return (x2 * pow(z2, p - 2, p) % p).to_bytes(32, "little")
+
+
+def _xray_b64(key: bytes) -> str:
+    # Xray prints keys as unpadded url-safe base64:
+    return base64.urlsafe_b64encode(key).rstrip(b"=").decode()
+
+
+def generate_reality_key() -> dict:
+    """
+    Generate a Reality keypair with a set of shortIds, like `xray x25519`.
+
+    Returns:
+        dict: {private_key, public_key, short_ids}.
+    """
+    private_key = bytearray(secrets.token_bytes(32))
+    private_key[0] &= 248
+    private_key[31] &= 127
+    private_key[31] |= 64
+    public_key = x25519(bytes(private_key), X25519_BASE_POINT)
+    short_id_bytes = list(SHORT_ID_BYTES)
+    random.SystemRandom().shuffle(short_id_bytes)
+    return {
+        "private_key": _xray_b64(bytes(private_key)),
+        "public_key": _xray_b64(public_key),
+        "short_ids": [secrets.token_hex(n) for n in short_id_bytes],
+    }
+
+
+class RealityKeyPool:
+    """
+    A pool of pre-generated Reality keys in the `reality_key` table.
+
+    Every new inbound gets its own keypair and shortIds: it takes a key
+    out of the table in one statement (`FOR UPDATE SKIP
+    LOCKED`, so parallel inbounds and bot replicas never share a key).
+    A background worker generates keys in a thread, off the `new_conf`
+    path, and tops the pool up to `size` after every pop. An empty pool
+    falls back to generating the key inline.
+    """
+
+    def __init__(self, size: int = 20, refill_interval_sec: float = 3600):
+        """
+        Initialize the RealityKeyPool.
+
+        Args:
+            size (int): Keys kept in the pool (default: 20).
+            refill_interval_sec (float): Seconds between pool checks
+                without pops, e.g. after a failed refill (default: 3600).
+        """
+        self.size = size
+        self.refill_interval_sec = refill_interval_sec
+        self._refill_needed = asyncio.Event()
+
+        self.pops = 0
+        self.misses = 0
+        self.generated = 0
+
+    async def pop(self) -> dict:
+        """
+        Take a key for a new inbound.
+
+        Returns:
+            dict: {private_key, public_key, short_ids}.
+        """
+        self.pops += 1
+        key = None
+        try:
+            key = await DbManager.pop_reality_key()
+        except Exception as e:
+            logger.error(f"BAD TRY TO POP REALITY KEY: {e}")
+        if key is None:
+            self.misses += 1
+            logger.warning("REALITY KEY POOL IS EMPTY. GENERATE INLINE...")
+            key = await asyncio.to_thread(generate_reality_key)
+        self._refill_needed.set()
+        return key
+
+    async def refill(self) -> int:
+        """
+        Top the pool up to its size.
+
+        Returns:
+            int: The number of generated keys.
+        """
+        missing = self.size - await DbManager.count_reality_keys()
+        if missing <= 0:
+            return 0
+        keys = await asyncio.to_thread(
+            lambda: [generate_reality_key() for _ in range(missing)]
+        )
+        resp = await DbManager.add_reality_keys(keys)
+        if resp != ReturnCode.SUCCESS:
+            raise Exception(f"BAD TRY TO ADD REALITY KEYS: {resp}")
+        self.generated += len(keys)
+        logger.info(f"REALITY KEY POOL REFILLED WITH {len(keys)} KEYS")
+        return len(keys)
+
+    async def run(self):
+        """Keep the pool full forever, refill after pops."""
+        while True:
+            self._refill_needed.clear()
+            try:
+                await self.refill()
+            except Exception as e:
+                logger.error(f"BAD TRY TO REFILL REALITY KEY POOL: {e}")
+            try:
+                await asyncio.wait_for(
+                    self._refill_needed.wait(), self.refill_interval_sec
+                )
+            except TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "pops": self.pops,
+            "misses": self.misses,
+            "generated": self.generated,
+        }
@@ -0,0 +1,343 @@
+import argparse
+import asyncio
+from collections import Counter
+from datetime import datetime
+from enum import Enum
+
+from modules.db import DbManager
+from settings import settings
+from logger import MainLogger
+from .nodes import XuiNode
+from .vless_api import VlessClientApi, VlessInboundApi, node_pool
+
+logger = MainLogger(__name__).get()
+
+# Panel clients that are not configs of the bot users:
+SERVICE_CLIENT_EMAILS = {"admin_user"}
+
+
+class DriftKind(Enum):
+    ORPHAN = "ORPHAN"  # on the panel, not in the database
+    MISSING = "MISSING"  # in the database, not on the panel
+    EXPIRY = "EXPIRY"  # expiry on the panel differs from valid_to_dttm
+
+
+class ReconcileReport:
+    """Drift counters with a few samples of every kind."""
+
+    def __init__(self, repair: bool, sample_size: int = 10):
+        self.repair = repair
+        self.sample_size = sample_size
+        self.db_configs = 0
+        self.panel_clients = 0
+        self.found = Counter()
+        self.repaired = Counter()
+        self.failed = Counter()
+        self.samples: dict[DriftKind, list[str]] = {
+            kind: [] for kind in DriftKind
+        }
+
+    def add(self, kind: DriftKind, sample: str):
+        self.found[kind] += 1
+        if len(self.samples[kind]) < self.sample_size:
+            self.samples[kind].append(sample)
+
+    def __str__(self) -> str:
+        lines = [
+            f"RECONCILE {'REPAIR' if self.repair else 'DRY-RUN'}: "
+            f"{self.db_configs} DB CONFIGS, "
+            f"{self.panel_clients} PANEL CLIENTS"
+        ]
+        for kind in DriftKind:
+            line = f"{kind.value}: {self.found[kind]}"
+            if self.repair:
+                line += (
+                    f" (REPAIRED: {self.repaired[kind]}, "
+                    f"FAILED: {self.failed[kind]})"
+                )
+            lines.append(line)
+            lines.extend(f"  - {sample}" for sample in self.samples[kind])
+        return "\n".join(lines)
+
+
+class ConfigReconciler:
+    """
+    Finds and repairs drift between the database configs and panel clients.
+
+    The panel clients come from one inbound list fetch per node, the
+    configs are streamed from a server-side cursor; both sides are walked
+    in email order (a sorted merge), so only one batch of configs and the
+    pending repairs are held besides the panel snapshots.
+
+    The database is the source of truth: missing clients are created on
+    the node of the config, expiry is set to `valid_to_dttm` and orphan
+    clients (including copies on a wrong node) are deleted.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 500,
+        expiry_tolerance_sec: float = 3600,
+        flow: str = "xtls-rprx-vision",
+        shared_inbounds: bool = None,
+    ):
+        """
+        Initialize the ConfigReconciler.
+
+        Args:
+            batch_size (int): Configs fetched and repairs applied at a time
+                (default: 500).
+            expiry_tolerance_sec (float): Allowed expiry difference
+                (default: 3600).
+            flow (str): The flow type for the client (default: 'xtls-rprx-vision').
+            shared_inbounds (bool): Create missing clients in shared
+                inbounds (default: XUI_INBOUND_MODE is "shared").
+        """
+        self.batch_size = batch_size
+        self.expiry_tolerance_sec = expiry_tolerance_sec
+        self.flow = flow
+        if shared_inbounds is None:
+            shared_inbounds = settings.XUI_INBOUND_MODE == "shared"
+        self.shared_inbounds = shared_inbounds
+
+    async def run(self, repair: bool = False) -> ReconcileReport:
+        """
+        Compare the configs with the panel clients.
+
+        Args:
+            repair (bool): Fix the drift, otherwise only report it
+                (default: False).
+
+        Returns:
+            ReconcileReport: Found (and repaired) drift.
+        """
+        report = ReconcileReport(repair)
+        snapshots = await asyncio.gather(
+            *[
+                node.inbound_cache.get(force_refresh=True)
+                for node in node_pool.nodes
+            ]
+        )
+        panel_clients = sorted(
+            (
+                (email, node.name, record)
+                for node, snapshot in zip(node_pool.nodes, snapshots)
+                for email, record in snapshot.by_email.items()
+                if email not in SERVICE_CLIENT_EMAILS
+            ),
+            key=lambda client: client[:2],
+        )
+        report.panel_clients = len(panel_clients)
+
+        orphans: list[tuple[str, XuiNode]] = []
+        missing: list[tuple] = []
+        expiry: dict[XuiNode, dict[str, datetime]] = {}
+
+        async def flush(force: bool = False):
+            if not repair:
+                return
+            if orphans and (force or len(orphans) >= self.batch_size):
+                await self._repair_orphans(orphans, report)
+                orphans.clear()
+            if missing and (force or len(missing) >= self.batch_size):
+                await self._repair_missing(missing, report)
+                missing.clear()
+            expiry_cnt = sum(len(clients) for clients in expiry.values())
+            if expiry and (force or expiry_cnt >= self.batch_size):
+                await self._repair_expiry(expiry, report)
+                expiry.clear()
+
+        def orphan(email: str, node: XuiNode):
+            report.add(DriftKind.ORPHAN, f"{email} ({node.name})")
+            if repair:
+                orphans.append((email, node))
+
+        idx = 0
+        async for row in DbManager.stream_service_configs(self.batch_size):
+            report.db_configs += 1
+            config_name = row.config_name
+            node = node_pool.get(row.node_name)
+            while idx < len(panel_clients) and (
+                panel_clients[idx][0] < config_name
+            ):
+                orphan(*self._panel_client_node(panel_clients[idx]))
+                idx += 1
+
+            record = None
+            while idx < len(panel_clients) and (
+                panel_clients[idx][0] == config_name
+            ):
+                if panel_clients[idx][1] == node.name:
+                    record = panel_clients[idx][2]
+                else:
+                    # A copy on another node:
+                    orphan(*self._panel_client_node(panel_clients[idx]))
+                idx += 1
+
+            if record:
+                panel_expiry = datetime.fromtimestamp(
+                    record.expiry_time / 1000
+                )
+                drift = abs((panel_expiry - row.valid_to_dttm).total_seconds())
+                if drift > self.expiry_tolerance_sec:
+                    report.add(
+                        DriftKind.EXPIRY,
+                        f"{config_name} ({node.name}): "
+                        f"PANEL {panel_expiry:%Y-%m-%d %H:%M}, "
+                        f"DB {row.valid_to_dttm:%Y-%m-%d %H:%M}",
+                    )
+                    if repair:
+                        expiry.setdefault(node, {})[
+                            config_name
+                        ] = row.valid_to_dttm
+            elif config_name not in SERVICE_CLIENT_EMAILS:
+                report.add(DriftKind.MISSING, f"{config_name} ({node.name})")
+                if repair:
+                    missing.append((node, row))
+            await flush()
+
+        for panel_client in panel_clients[idx:]:
+            orphan(*self._panel_client_node(panel_client))
+        await flush(force=True)
+
+        logger.info(str(report))
+        return report
+
+    @staticmethod
+    def _panel_client_node(panel_client: tuple) -> tuple[str, XuiNode]:
+        email, node_name, _ = panel_client
+        return email, node_pool.get(node_name)
+
+    async def _repair_orphans(
+        self, orphans: list[tuple[str, XuiNode]], report
+    ):
+        # A config could be added while we were streaming:
+        config_nodes = await DbManager.get_service_config_node_names(
+            [email for email, _ in orphans]
+        )
+        nodes = {node for _, node in orphans}
+        snapshots = dict(
+            zip(
+                nodes,
+                await asyncio.gather(
+                    *[
+                        node.inbound_cache.get(force_refresh=True)
+                        for node in nodes
+                    ]
+                ),
+            )
+        )
+        orphan_clients = []
+        for email, node in orphans:
+            if email in config_nodes and (
+                node_pool.get(config_nodes[email]) is node
+            ):
+                continue
+            client = snapshots[node].by_email.get(email)
+            if client:
+                orphan_clients.append((node, email, client))
+
+        async def delete_client(node: XuiNode, email: str, client):
+            # One client call per orphan: an inbound update would drop the
+            # clients added since the fetch and reset the inbound traffic.
+            try:
+                await node.session.call(
+                    node.api.client.delete, client.inbound_id, client.uuid
+                )
+                node.inbound_cache.delete_client(
+                    client.inbound_id, client.uuid
+                )
+                report.repaired[DriftKind.ORPHAN] += 1
+            except Exception as e:
+                report.failed[DriftKind.ORPHAN] += 1
+                logger.error(
+                    f'BAD TRY TO DELETE ORPHAN CLIENT "{email}" '
+                    f"OF NODE {node.name}: {e}"
+                )
+
+        await asyncio.gather(
+            *[
+                delete_client(node, email, client)
+                for node, email, client in orphan_clients
+            ]
+        )
+
+    async def _repair_missing(self, missing: list[tuple], report):
+        inbound_clients: dict[tuple, list] = {}
+        for node, row in missing:
+            client = VlessClientApi(flow=self.flow).build_vless_client(
+                row.config_name, row.valid_to_dttm
+            )
+            if row.user_service_id:
+                client.id = str(row.user_service_id)
+            inbound_name = (
+                None if self.shared_inbounds else str(row.user_tg_id)
+            )
+            inbound_clients.setdefault((node, inbound_name), []).append(client)
+
+        async def add_clients(node: XuiNode, inbound_name: str, clients):
+            try:
+                snapshot = await node.inbound_cache.get()
+                inbound = snapshot.by_remark.get(inbound_name)
+                if inbound_name is None:
+                    await VlessInboundApi(node).add_shared_clients(clients)
+                elif inbound:
+                    await node.session.call(
+                        node.api.client.add,
+                        inbound_id=inbound.id,
+                        clients=clients,
+                    )
+                    node.inbound_cache.add_clients(inbound.id, clients)
+                else:
+                    inbound_port = await node.port_allocator.reserve(
+                        inbound_name
+                    )
+                    await VlessInboundApi(node).make_vless_inbound(
+                        inbound_name, inbound_port, clients=clients
+                    )
+                report.repaired[DriftKind.MISSING] += len(clients)
+            except Exception as e:
+                report.failed[DriftKind.MISSING] += len(clients)
+                logger.error(
+                    f"BAD TRY TO ADD MISSING CLIENTS OF NODE {node.name}: {e}"
+                )
+
+        await asyncio.gather(
+            *[
+                add_clients(node, inbound_name, clients)
+                for (node, inbound_name), clients in inbound_clients.items()
+            ]
+        )
+
+    async def _repair_expiry(self, expiry: dict, report):
+        results = await asyncio.gather(
+            *[
+                VlessClientApi(
+                    flow=self.flow, node=node
+                ).update_clients_expired_time(dict(clients_new_time))
+                for node, clients_new_time in expiry.items()
+            ]
+        )
+        for node_results in results:
+            for updated in node_results.values():
+                if updated:
+                    report.repaired[DriftKind.EXPIRY] += 1
+                else:
+                    report.failed[DriftKind.EXPIRY] += 1
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Reconcile database configs with X-UI panel clients"
+    )
+    parser.add_argument(
+        "--repair", action="store_true", help="fix the drift (default: report)"
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    await ConfigReconciler(batch_size=args.batch_size).run(repair=args.repair)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
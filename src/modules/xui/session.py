@@ -0,0 +1,318 @@
+import asyncio
+import json
+import random
+import time
+
+import httpx
+from py3xui import AsyncApi
+
+from logger import MainLogger
+from .breaker import CircuitBreaker
+
+logger = MainLogger(__name__).get()
+
+# 3x-ui answers unauthenticated API calls with a redirect to the login page
+# (older builds) or with 401/404 (newer builds):
+AUTH_FAILURE_STATUS_CODES = (301, 302, 303, 307, 308, 401, 403, 404)
+
+# Weight of the newest request in the panel latency moving average:
+LATENCY_EWMA_ALPHA = 0.2
+
+
+def is_auth_failure(e: Exception) -> bool:
+    """
+    Check whether an exception raised by py3xui means the session is not valid.
+
+    Args:
+        e (Exception): The exception raised by a py3xui call.
+
+    Returns:
+        bool: True if the panel rejected the session cookie.
+    """
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code in AUTH_FAILURE_STATUS_CODES
+    if isinstance(e, json.JSONDecodeError):
+        # Login page HTML instead of the API JSON
+        return True
+    return isinstance(e, ValueError) and "login()" in str(e)
+
+
+def is_transient_failure(e: Exception) -> bool:
+    """
+    Check whether an exception raised by py3xui means the panel is unhealthy.
+
+    Args:
+        e (Exception): The exception raised by a py3xui call.
+
+    Returns:
+        bool: True on timeouts, connection errors and 5xx responses.
+    """
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500
+    return isinstance(e, (TimeoutError, httpx.TransportError))
+
+
+class XuiSession:
+    """
+    A shared authenticated session around the X-UI AsyncApi.
+
+    Logs in once, shares the cookie across coroutines and re-authenticates
+    only when the panel rejects the cookie. Concurrent re-logins are
+    serialized, so a burst of expired calls costs a single login.
+
+    The panel is a small SQLite-backed process, so at most
+    `max_concurrency` requests are sent to it at once and the rest wait in
+    a queue. Identical concurrent reads (`get_*` methods with the same
+    arguments) share one in-flight request and get the same result object.
+    A read only joins requests started after the last write ended, so the
+    read that follows a write always sees it.
+
+    Every request has a deadline, reads are retried with a jittered backoff
+    on transient failures, and the circuit breaker fails calls fast while
+    the panel is unhealthy.
+    """
+
+    def __init__(
+        self,
+        api: AsyncApi,
+        max_concurrency: int = 4,
+        request_timeout_sec: float = 10,
+        read_retries: int = 2,
+        retry_backoff_sec: float = 0.5,
+        breaker: CircuitBreaker = None,
+    ):
+        """
+        Initialize the XuiSession.
+
+        Args:
+            api (AsyncApi): The py3xui api whose cookie is managed.
+            max_concurrency (int): Max in-flight panel requests (default: 4).
+            request_timeout_sec (float): Deadline of a request (default: 10).
+            read_retries (int): Retries of a failed read (default: 2).
+            retry_backoff_sec (float): Base of the exponential jittered
+                backoff between retries (default: 0.5).
+            breaker (CircuitBreaker): The panel circuit breaker
+                (default: a new CircuitBreaker).
+        """
+        self.api = api
+        self.request_timeout_sec = request_timeout_sec
+        self.read_retries = read_retries
+        self.retry_backoff_sec = retry_backoff_sec
+        self.breaker = breaker or CircuitBreaker()
+        self._login_lock = asyncio.Lock()
+        self._generation = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight: dict[tuple, asyncio.Future] = {}
+        # Bumped when a write starts and when it ends, reads are coalesced
+        # within one value:
+        self._write_epoch = 0
+
+        self.logins = 0
+        self.relogins = 0
+        self.reuses = 0
+        self.requests = 0
+        self.coalesced = 0
+        self.queue_wait_total_sec = 0.0
+        self.queue_wait_max_sec = 0.0
+        self.retries = 0
+        self.timeouts = 0
+        self.latency_ewma_sec: float = None
+
+    @property
+    def is_logged_in(self) -> bool:
+        return self.api.session is not None
+
+    async def _request(self, method, *args, **kwargs):
+        """Send a panel request once a concurrency slot is free."""
+        is_probe = self.breaker.before_call()
+        queued = time.perf_counter()
+        try:
+            return await self._send(method, queued, *args, **kwargs)
+        except asyncio.CancelledError:
+            # Cancelled in the queue or in flight, a probe must not keep
+            # the breaker half-open forever:
+            if is_probe:
+                self.breaker.cancel_call()
+            raise
+
+    async def _send(self, method, queued: float, *args, **kwargs):
+        async with self._semaphore:
+            wait_sec = time.perf_counter() - queued
+            self.requests += 1
+            self.queue_wait_total_sec += wait_sec
+            self.queue_wait_max_sec = max(self.queue_wait_max_sec, wait_sec)
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(
+                    method(*args, **kwargs), self.request_timeout_sec
+                )
+            except Exception as e:
+                self._observe_latency(time.perf_counter() - started)
+                if isinstance(e, TimeoutError):
+                    self.timeouts += 1
+                    logger.warning(
+                        f"X-UI {method.__name__} TIMED OUT "
+                        f"AFTER {self.request_timeout_sec}s"
+                    )
+                if is_transient_failure(e):
+                    self.breaker.record_failure()
+                else:
+                    # The panel answered, so it is alive:
+                    self.breaker.record_success()
+                raise e
+            self._observe_latency(time.perf_counter() - started)
+            self.breaker.record_success()
+            return result
+
+    def _observe_latency(self, latency_sec: float):
+        if self.latency_ewma_sec is None:
+            self.latency_ewma_sec = latency_sec
+        else:
+            self.latency_ewma_sec += LATENCY_EWMA_ALPHA * (
+                latency_sec - self.latency_ewma_sec
+            )
+
+    async def login(self, seen_generation: int = None) -> None:
+        """
+        Log in to the panel unless another coroutine already did it.
+
+        Args:
+            seen_generation (int): The session generation the caller failed
+                with. If the session was renewed since, the login is skipped.
+        """
+        async with self._login_lock:
+            if seen_generation is None:
+                if self.is_logged_in:
+                    return
+            elif seen_generation != self._generation:
+                return
+
+            if seen_generation is not None:
+                logger.warning("X-UI SESSION EXPIRED. LOGIN AGAIN...")
+                self.relogins += 1
+
+            await self._request(self.api.login)
+            self._generation += 1
+            self.logins += 1
+            logger.debug(
+                f"X-UI LOGIN #{self.logins} (SESSION REUSED {self.reuses} TIMES)"
+            )
+
+    async def _call(self, method, *args, **kwargs):
+        if self.is_logged_in:
+            self.reuses += 1
+        else:
+            await self.login()
+
+        generation = self._generation
+        try:
+            return await self._request(method, *args, **kwargs)
+        except Exception as e:
+            if not is_auth_failure(e):
+                raise e
+            logger.debug(f"X-UI REJECTED SESSION: {e}")
+            await self.login(seen_generation=generation)
+            return await self._request(method, *args, **kwargs)
+
+    async def _call_with_retries(self, method, *args, **kwargs):
+        for attempt in range(self.read_retries + 1):
+            try:
+                return await self._call(method, *args, **kwargs)
+            except Exception as e:
+                if attempt == self.read_retries or not is_transient_failure(e):
+                    raise e
+                self.retries += 1
+                delay = random.uniform(0, self.retry_backoff_sec * 2**attempt)
+                logger.warning(
+                    f"X-UI {method.__name__} FAILED: {e!r}. "
+                    f"RETRY #{attempt + 1} IN {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _is_read(method) -> bool:
+        return method.__name__.startswith("get")
+
+    @classmethod
+    def _read_key(cls, method, args: tuple, kwargs: dict) -> tuple:
+        """
+        Get the coalescing key of a read call.
+
+        Returns:
+            tuple: The key, or None if the call is not a coalescable read.
+        """
+        if not cls._is_read(method):
+            return None
+        key = (
+            id(getattr(method, "__self__", None)),
+            method.__name__,
+            args,
+            tuple(sorted(kwargs.items())),
+        )
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    async def call(self, method, *args, **kwargs):
+        """
+        Call a py3xui api method with a valid session.
+
+        Args:
+            method: The bound py3xui method, e.g. `api.inbound.get_list`.
+            *args: Positional arguments for the method.
+            **kwargs: Keyword arguments for the method.
+
+        Returns:
+            Any: The result of the method.
+        """
+        key = self._read_key(method, args, kwargs)
+        if key is None:
+            if self._is_read(method):
+                return await self._call_with_retries(method, *args, **kwargs)
+            self._write_epoch += 1
+            try:
+                return await self._call(method, *args, **kwargs)
+            finally:
+                self._write_epoch += 1
+
+        # A read in flight since before the write may miss it:
+        key = (self._write_epoch, key)
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(
+                self._call_with_retries(method, *args, **kwargs)
+            )
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # A cancelled caller must not cancel the request of the others:
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        """
+        Get login/reuse, load and health counters.
+
+        Returns:
+            dict: Counters of logins, re-logins after expiry, calls that
+                reused the session, requests sent to the panel, reads
+                coalesced into an in-flight request, the queue wait time,
+                the moving average latency, retries, timeouts and the
+                circuit breaker state.
+        """
+        return {
+            "logins": self.logins,
+            "relogins": self.relogins,
+            "reuses": self.reuses,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "queue_wait_total_sec": round(self.queue_wait_total_sec, 3),
+            "queue_wait_max_sec": round(self.queue_wait_max_sec, 3),
+            "latency_ewma_sec": round(self.latency_ewma_sec or 0, 3),
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "breaker": self.breaker.stats(),
+        }
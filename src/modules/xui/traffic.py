@@ -0,0 +1,95 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from modules.db import DbManager, ReturnCode
+from logger import MainLogger
+from .cache import InboundCache
+
+logger = MainLogger(__name__).get()
+
+
+class TrafficCollector:
+    """
+    Collects traffic counters of all configs from the X-UI panel.
+
+    One poll is one inbound list fetch per node: the list carries the
+    cumulative counters of every client, the deltas since the previous poll
+    are stored in the database with hourly and daily rollups. A node that
+    fails a poll is skipped, its deltas are caught up by the next one.
+    """
+
+    def __init__(
+        self,
+        inbound_caches: list[InboundCache],
+        poll_interval_sec: float = 300,
+        raw_retention_days: int = 90,
+    ):
+        """
+        Initialize the TrafficCollector.
+
+        Args:
+            inbound_caches (list[InboundCache]): The inbound caches of the
+                nodes.
+            poll_interval_sec (float): Seconds between polls (default: 300).
+            raw_retention_days (int): Days raw deltas and hourly rollups are
+                kept, daily rollups are kept forever (default: 90).
+        """
+        self.inbound_caches = inbound_caches
+        self.poll_interval_sec = poll_interval_sec
+        self.raw_retention_days = raw_retention_days
+        self._partitions_month: str = None
+
+    async def _maintain_partitions(self, now: datetime):
+        month = now.strftime("%Y_%m")
+        if month == self._partitions_month:
+            return
+        next_month = (now.replace(day=1) + timedelta(days=32)).replace(day=1)
+        resp = await DbManager.create_config_traffic_partitions(
+            [now, next_month]
+        )
+        if resp != ReturnCode.SUCCESS:
+            raise Exception(f"BAD TRY TO CREATE TRAFFIC PARTITIONS: {resp}")
+        await DbManager.drop_config_traffic_partitions(
+            now - timedelta(days=self.raw_retention_days)
+        )
+        self._partitions_month = month
+
+    async def collect(self) -> int:
+        """
+        Poll the panel once and store the traffic deltas.
+
+        Returns:
+            int: The number of clients polled.
+        """
+        now = datetime.now()
+        await self._maintain_partitions(now)
+
+        snapshots = await asyncio.gather(
+            *[
+                inbound_cache.get(force_refresh=True)
+                for inbound_cache in self.inbound_caches
+            ],
+            return_exceptions=True,
+        )
+        counters = {}
+        for snapshot in snapshots:
+            if isinstance(snapshot, Exception):
+                logger.error(f"BAD TRY TO GET NODE TRAFFIC: {snapshot}")
+                continue
+            for inbound in snapshot.inbounds:
+                for stat in inbound.client_stats or []:
+                    counters[stat.email] = (stat.up, stat.down)
+        resp = await DbManager.add_config_traffic(counters, now)
+        if resp != ReturnCode.SUCCESS:
+            raise Exception(f"BAD TRY TO ADD CONFIG TRAFFIC: {resp}")
+        logger.info(f"TRAFFIC COLLECTED FOR {len(counters)} CLIENTS")
+        return len(counters)
+
+    async def run(self):
+        """Poll the panel forever, a failed poll is retried next interval."""
+        while True:
+            try:
+                await self.collect()
+            except Exception as e:
+                logger.error(f"BAD TRY TO COLLECT TRAFFIC: {e}")
+            await asyncio.sleep(self.poll_interval_sec)
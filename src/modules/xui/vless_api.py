@@ -1,69 +1,128 @@
 import uuid
+import asyncio
 from datetime import datetime, timezone, timedelta
 
 from py3xui import AsyncApi, Inbound, Client
 from py3xui.inbound import Settings, Sniffing, StreamSettings
 from settings import settings
 from logger import MainLogger
-
-vless_api = AsyncApi(
-    host=settings.XUI_HOST,
-    username=settings.XUI_USER,
-    password=settings.XUI_PASS,
+from .session import XuiSession
+from .breaker import CircuitBreaker
+from .cache import InboundSnapshot
+from .links import SHARED_INBOUND_PREFIX, is_shared_inbound
+from .nodes import XuiNode, XuiNodePool
+from .traffic import TrafficCollector
+from .reality import RealityKeyPool
+
+
+def make_node(
+    name: str,
+    host: str,
+    username: str,
+    password: str,
+    first_port: int,
+    max_used_ports: int,
+) -> XuiNode:
+    api = AsyncApi(host=host, username=username, password=password)
+    session = XuiSession(
+        api,
+        max_concurrency=settings.XUI_MAX_CONCURRENT_REQUESTS,
+        request_timeout_sec=settings.XUI_REQUEST_TIMEOUT_SEC,
+        read_retries=settings.XUI_READ_RETRIES,
+        breaker=CircuitBreaker(
+            settings.XUI_BREAKER_FAILURE_THRESHOLD,
+            settings.XUI_BREAKER_COOLDOWN_SEC,
+        ),
+    )
+    return XuiNode(
+        name,
+        session,
+        first_port,
+        first_port + max_used_ports,
+        settings.XUI_INBOUND_CACHE_TTL_SEC,
+    )
+
+
+node_pool = XuiNodePool(
+    [
+        make_node(
+            settings.XUI_NODE_NAME,
+            settings.XUI_HOST,
+            settings.XUI_USER,
+            settings.XUI_PASS,
+            settings.XUI_VLESS_PORT,
+            settings.XUI_MAX_USED_PORTS,
+        )
+    ]
+    + [
+        make_node(
+            node.name,
+            node.host,
+            node.user,
+            node.password,
+            node.vless_port,
+            node.max_used_ports,
+        )
+        for node in settings.XUI_NODES
+    ]
+)
+traffic_collector = TrafficCollector(
+    [node.inbound_cache for node in node_pool.nodes],
+    settings.XUI_TRAFFIC_POLL_SEC,
+    settings.XUI_TRAFFIC_RAW_RETENTION_DAYS,
 )
+reality_key_pool = RealityKeyPool(settings.XUI_REALITY_KEY_POOL_SIZE)
 logger = MainLogger(__name__).get()
 
+# Fetches of the inbound list looking for a just added inbound:
+INBOUND_ADD_FETCH_ATTEMPTS = 3
+INBOUND_ADD_FETCH_DELAY_SEC = 0.5
+
 
 class VlessInboundApi:
     """A class to manage VLESS inbound configurations on the X-UI panel."""
 
-    async def get_inbounds_data(self) -> list[dict]:
+    def __init__(self, node: XuiNode = None):
+        """
+        Initialize the VlessInboundApi.
+
+        Args:
+            node (XuiNode): The panel of the inbounds (default: the default
+                node).
+        """
+        self.node = node or node_pool.default
+
+    async def get_inbounds_data(
+        self, force_refresh: bool = False
+    ) -> list[dict]:
         """
         Retrieve a list of all inbounds with their details.
 
+        Args:
+            force_refresh (bool): Bypass the inbound cache (default: False).
+
         Returns:
             list[dict]: A list of dictionaries containing inbound details (remark, id, port).
         """
-        await vless_api.login()
-
-        inbounds = await vless_api.inbound.get_list()
+        snapshot = await self.node.inbound_cache.get(
+            force_refresh=force_refresh
+        )
         return [
             {"remark": inbound.remark, "id": inbound.id, "port": inbound.port}
-            for inbound in inbounds
+            for inbound in snapshot.inbounds
         ]
 
-    async def get_inbounds_free_port(self) -> list[dict]:
-        await vless_api.login()
+    async def reserve_inbound_port(self, inbound_name: str) -> int:
+        """
+        Reserve a free port for the inbound.
 
-        inbounds = await vless_api.inbound.get_list()
+        Args:
+            inbound_name (str): The name (remark) of the inbound.
 
-        all_existed_ports = []
-        max_port = settings.XUI_VLESS_PORT + settings.XUI_MAX_USED_PORTS
-        for inbound in inbounds:
-            if (
-                inbound.port >= settings.XUI_VLESS_PORT
-                and inbound.port <= max_port
-            ):
-                all_existed_ports.append(inbound.port)
-
-        range_vless_ports = range(settings.XUI_VLESS_PORT, max_port + 1)
-        free_ports = []
-        for port in range_vless_ports:
-            if port not in all_existed_ports:
-                free_ports.append(port)
-
-        if free_ports:
-            free_port = min(free_ports)
-            if (free_port >= settings.XUI_VLESS_PORT) and (
-                free_port <= max_port
-            ):
-                return free_port
-            else:
-                logger.error("NO FREE PORTS FOR VLESS CONF")
-                raise Exception("NO FREE PORTS FOR VLESS CONF")
-        else:
-            logger.error("NO FREE PORTS FOR VLESS CONF")
-            raise Exception("NO FREE PORTS FOR VLESS CONF")
+        Returns:
+            int: The reserved port, raises an exception if there is none.
+        """
+        return await self.node.port_allocator.reserve(inbound_name)
 
     async def get_inbounds_id_by_remark(self, remark: str) -> int:
         """
@@ -75,16 +134,14 @@ class VlessInboundApi:
         Returns:
             int: The ID of the inbound if found, otherwise None.
         """
-        await vless_api.login()
-
-        inbounds_data = await self.get_inbounds_data()
-        for inbound in inbounds_data:
-            if inbound.get("remark") == remark:
-                return inbound.get("id")
+        snapshot = await self.node.inbound_cache.get()
+        inbound = snapshot.by_remark.get(remark)
+        if inbound:
+            return inbound.id
         return None
 
     async def make_vless_inbound(
-        self, inbound_name: str, inbound_port: int
+        self, inbound_name: str, inbound_port: int, clients: list = None
     ) -> int:
         """
         Create a new VLESS inbound with the specified name and port.
@@ -92,20 +149,33 @@ class VlessInboundApi:
         Args:
             inbound_name (str): The name (remark) of the new inbound.
             inbound_port (int): The port number for the new inbound.
+            clients (list[Client]): Clients created together with the new
+                inbound, ignored if the inbound already exists (default: None).
 
         Returns:
             int: The ID of the newly created inbound
         """
-        await vless_api.login()
-
-        inbound_id = await self.get_inbounds_id_by_remark(remark=inbound_name)
+        snapshot = await self.node.inbound_cache.get()
+        inbound = snapshot.by_remark.get(inbound_name)
 
-        if inbound_id:
+        if inbound:
             logger.debug(f'Inbound: "{inbound_name}" already exists! Skipped!')
-            return inbound_id
+            return inbound.id
 
         else:
-            settings = Settings(clients=[], decryption="none", fallbacks=[])
+            inbound_clients = list(clients or [])
+            if "admin_user" not in snapshot.by_email and all(
+                client.email != "admin_user" for client in inbound_clients
+            ):
+                inbound_clients.append(
+                    VlessClientApi(
+                        expired_deltatime_days=9999
+                    ).build_vless_client("admin_user")
+                )
+            settings = Settings(
+                clients=inbound_clients, decryption="none", fallbacks=[]
+            )
+            reality_key = await reality_key_pool.pop()
             stream_settings = StreamSettings(
                 security="reality",
                 network="tcp",
@@ -120,22 +190,13 @@ class VlessInboundApi:
                     "xver": 0,
                     "dest": "google.com:443",
                     "serverNames": ["www.google.com"],
-                    "privateKey": "GAiJD7L8ADep2NVcQPiuZc9l_ZxXTSCXmpVzPM6CdH8",
+                    "privateKey": reality_key["private_key"],
                     "minClient": "",
                     "maxClient": "",
                     "maxTimediff": 0,
-                    "shortIds": [
-                        "33cf5dbed8e1",
-                        "60571c",
-                        "6395f4e62e",
-                        "b688d136",
-                        "4b02",
-                        "1d1ec1a2dc04de9e",
-                        "11",
-                        "db0a75113d6ea9",
-                    ],
+                    "shortIds": reality_key["short_ids"],
                     "settings": {
-                        "publicKey": "9WIrle9cM-dmkxvaYJEeytOnkHJCYoHojVQi-zg3_DI",
+                        "publicKey": reality_key["public_key"],
                         "fingerprint": "firefox",
                         "serverName": "",
                         "spiderX": "/",
@@ -166,25 +227,138 @@ class VlessInboundApi:
                 tag=("default-tag-" + inbound_name),
             )
             try:
-                await vless_api.inbound.add(inbound)
-                inbound_id = await self.get_inbounds_id_by_remark(
-                    remark=inbound_name
+                await self.node.session.call(
+                    self.node.api.inbound.add, inbound
+                )
+
+                # The panel does not return the new id, fetch the list until
+                # the new remark shows up:
+                for attempt in range(INBOUND_ADD_FETCH_ATTEMPTS):
+                    if attempt:
+                        await asyncio.sleep(INBOUND_ADD_FETCH_DELAY_SEC)
+                    snapshot = await self.node.inbound_cache.get(
+                        force_refresh=True
+                    )
+                    inbound = snapshot.by_remark.get(inbound_name)
+                    if inbound:
+                        return inbound.id
+
+                raise Exception(
+                    f'INBOUND "{inbound_name}" IS NOT LISTED AFTER ADDING'
                 )
-                await VlessClientApi(
-                    expired_deltatime_days=9999
-                ).make_vless_client(inbound_id, "admin_user")
-                return inbound_id
 
             except Exception as e:
                 logger.error(e)
                 raise e
 
+    def get_shared_inbounds(self, snapshot: InboundSnapshot) -> list[Inbound]:
+        """
+        Get the shared inbounds of the node ordered by their number.
+
+        Args:
+            snapshot (InboundSnapshot): The inbound snapshot of the node.
+
+        Returns:
+            list[Inbound]: The shared inbounds.
+        """
+        return sorted(
+            (
+                inbound
+                for inbound in snapshot.inbounds
+                if is_shared_inbound(inbound.remark)
+            ),
+            key=lambda inbound: int(inbound.remark.rsplit("_", 1)[1]),
+        )
+
+    async def add_shared_clients(self, clients: list[Client]) -> list[int]:
+        """
+        Add clients to the shared inbounds of the node.
+
+        The clients fill the first shared inbounds with free places, new
+        shared inbounds are created when all are full, so the number of
+        inbounds stays bounded by clients / max_clients.
+
+        Args:
+            clients (list[Client]): New clients with unique emails.
+
+        Returns:
+            list[int]: The IDs of the inbounds the clients were added to.
+        """
+        max_clients = settings.XUI_SHARED_INBOUND_MAX_CLIENTS
+        pending = list(clients)
+        inbound_ids = []
+        async with self.node.shared_inbound_lock:
+            snapshot = await self.node.inbound_cache.get()
+            shared_inbounds = self.get_shared_inbounds(snapshot)
+
+            for inbound in shared_inbounds:
+                free_places = max_clients - sum(
+                    1
+                    for client in inbound.settings.clients
+                    if client.email != "admin_user"
+                )
+                if free_places <= 0:
+                    continue
+                batch, pending = pending[:free_places], pending[free_places:]
+                await self.node.session.call(
+                    self.node.api.client.add,
+                    inbound_id=inbound.id,
+                    clients=batch,
+                )
+                self.node.inbound_cache.add_clients(inbound.id, batch)
+                inbound_ids.append(inbound.id)
+                if not pending:
+                    return inbound_ids
+
+            next_number = (
+                int(shared_inbounds[-1].remark.rsplit("_", 1)[1]) + 1
+                if shared_inbounds
+                else 1
+            )
+            while pending:
+                # Port reservations are cluster-wide, keep remarks unique:
+                inbound_name = (
+                    f"{SHARED_INBOUND_PREFIX}{self.node.name}_{next_number}"
+                )
+                batch, pending = pending[:max_clients], pending[max_clients:]
+                inbound_port = await self.reserve_inbound_port(inbound_name)
+                inbound_ids.append(
+                    await self.make_vless_inbound(
+                        inbound_name, inbound_port, clients=batch
+                    )
+                )
+                logger.info(
+                    f"SHARED INBOUND {inbound_name} CREATED "
+                    f"ON NODE {self.node.name}"
+                )
+                next_number += 1
+        return inbound_ids
+
+    async def delete_vless_inbound(self, inbound_name: str) -> None:
+        """
+        Delete the inbound with all its clients and release its port.
+
+        Args:
+            inbound_name (str): The name (remark) of the inbound.
+        """
+        inbound_id = await self.get_inbounds_id_by_remark(remark=inbound_name)
+        if inbound_id:
+            await self.node.session.call(
+                self.node.api.inbound.delete, inbound_id
+            )
+            self.node.inbound_cache.drop_inbound(inbound_id)
+            self.node.link_renderer.drop(inbound_id)
+        await self.node.port_allocator.release(inbound_name)
+
 
 class VlessClientApi:
     """A class to manage VLESS client configurations on the X-UI panel."""
 
     def __init__(
-        self, flow: str = "xtls-rprx-vision", expired_deltatime_days: int = 30
+        self,
+        flow: str = "xtls-rprx-vision",
+        expired_deltatime_days: int = 30,
+        node: XuiNode = None,
     ):
         """
         Initialize the VlessClientApi.
@@ -192,9 +366,44 @@ class VlessClientApi:
         Args:
             flow (str): The flow type for the client (default: 'xtls-rprx-vision').
             expired_deltatime_days (int): The number of days until the client expires (default: 30).
+            node (XuiNode): The panel of the clients (default: the node
+                stored with every client config).
         """
         self.expired_deltatime_days = expired_deltatime_days
         self.flow = flow
+        self.node = node
+
+    async def _get_node(self, client_email: str) -> XuiNode:
+        if self.node:
+            return self.node
+        return await node_pool.locate(client_email)
+
+    def build_vless_client(
+        self, client_email: str, expired_dttm: datetime = None
+    ) -> Client:
+        """
+        Build a new VLESS client without sending it to the panel.
+
+        Args:
+            client_email (str): The email address of the client.
+            expired_dttm (datetime): The expiration time of the client
+                (default: now + expired_deltatime_days).
+
+        Returns:
+            Client: The client with an uuid derived from its email.
+        """
+        client_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, client_email))
+        if expired_dttm is None:
+            expired_dttm = datetime.now(timezone.utc) + timedelta(
+                self.expired_deltatime_days
+            )
+        return Client(
+            id=client_id,
+            email=client_email,
+            enable=True,
+            flow=self.flow,
+            expiryTime=int(expired_dttm.timestamp() * 1000),
+        )
 
     async def make_vless_client(
         self, inbound_id: int, client_email: str
@@ -209,27 +418,30 @@ class VlessClientApi:
         Returns:
             str: The email of the newly created client, or None if it already exists.
         """
-        await vless_api.login()
-
-        client = await vless_api.client.get_by_email(client_email)
-        if client:
+        node = self.node or node_pool.default
+        snapshot = await node.inbound_cache.get()
+        if client_email in snapshot.by_email:
             logger.debug(f'Client: "{client_email}" already exists! Skipped!')
             return client_email
         else:
-            client_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, client_email))
-            exp_time = datetime.now(timezone.utc) + timedelta(
-                self.expired_deltatime_days
-            )
-            new_client = Client(
-                id=client_id,
-                email=client_email,
-                enable=True,
-                flow=self.flow,
-                expiryTime=int(exp_time.timestamp() * 1000),
-            )
-            await vless_api.client.add(
-                inbound_id=inbound_id, clients=[new_client]
-            )
+            new_client = self.build_vless_client(client_email)
+            try:
+                await node.session.call(
+                    node.api.client.add,
+                    inbound_id=inbound_id,
+                    clients=[new_client],
+                )
+            except Exception as e:
+                # The snapshot could miss a client added by someone else:
+                snapshot = await node.inbound_cache.get(force_refresh=True)
+                if client_email in snapshot.by_email:
+                    logger.debug(
+                        f'Client: "{client_email}" already exists! Skipped!'
+                    )
+                    return client_email
+                raise e
+            node.inbound_cache.add_clients(inbound_id, [new_client])
+            node_pool.remember(client_email, node)
             return client_email
 
     async def get_client_uuid_by_email(self, client_email):
@@ -242,35 +454,27 @@ class VlessClientApi:
         Returns:
             str: The UUID of the client if found, otherwise None.
         """
-        await vless_api.login()
-        client = await vless_api.client.get_by_email(client_email)
+        node = await self._get_node(client_email)
+        snapshot = await node.inbound_cache.get()
+        client = snapshot.by_email.get(client_email)
         if client:
-            inbound = await vless_api.inbound.get_by_id(client.inbound_id)
-            if inbound.settings.clients:
-                for client in inbound.settings.clients:
-                    if client.email == client_email:
-                        return client.id
+            return client.uuid
 
     async def get_client_expired_datetime_by_email(self, client_email):
         """
-        Retrieve the UUID of a client by their email.
+        Retrieve the expiration time of a client by their email.
 
         Args:
             client_email (str): The email address of the client.
 
         Returns:
-            str: The UUID of the client if found, otherwise None.
+            datetime: The expiration time of the client if found, otherwise None.
         """
-        await vless_api.login()
-        client = await vless_api.client.get_by_email(client_email)
+        node = await self._get_node(client_email)
+        snapshot = await node.inbound_cache.get()
+        client = snapshot.by_email.get(client_email)
         if client:
-            inbound = await vless_api.inbound.get_by_id(client.inbound_id)
-            if inbound.settings.clients:
-                for client in inbound.settings.clients:
-                    if client.email == client_email:
-                        return datetime.fromtimestamp(
-                            client.expiry_time / 1000
-                        )
+            return datetime.fromtimestamp(client.expiry_time / 1000)
 
     async def update_client_expired_time(
         self, client_email: str, new_time: datetime
@@ -286,23 +490,103 @@ class VlessClientApi:
             str: True if the update was successful, otherwise raises an exception.
         """
         try:
-            await vless_api.login()
-            client = await vless_api.client.get_by_email(client_email)
+            node = await self._get_node(client_email)
+            snapshot = await node.inbound_cache.get()
+            inbound, client = snapshot.get_client(client_email)
             if client:
-                client_id = await self.get_client_uuid_by_email(client_email)
-
-                new_client = client
-                new_client.id = client_id
-                new_client.flow = self.flow
-                new_client.enable = True
-                new_client.expiry_time = int(new_time.timestamp() * 1000)
-
-                if client_id:
-                    await vless_api.client.update(client_id, new_client)
-                    return True
+                new_client = client.model_copy(
+                    update={
+                        "inbound_id": inbound.id,
+                        "flow": self.flow,
+                        "enable": True,
+                        "expiry_time": int(new_time.timestamp() * 1000),
+                    }
+                )
+                await node.session.call(
+                    node.api.client.update, new_client.id, new_client
+                )
+                node.inbound_cache.update_client(inbound.id, new_client)
+                return True
         except Exception as e:
             raise e
 
+    async def update_clients_expired_time(
+        self, clients_new_time: dict[str, datetime]
+    ) -> dict[str, bool]:
+        """
+        Update the expiration time of many clients at once.
+
+        The batch costs one inbound list fetch per node plus one client
+        update per client, sent in parallel within the concurrency limit of
+        the node session. Clients are updated one by one: an inbound update
+        would overwrite clients added since the fetch, reset the inbound
+        traffic and keep the old expiry of the client traffic the panel
+        disables clients by.
+
+        Args:
+            clients_new_time (dict[str, datetime]): New expiration times by
+                client email.
+
+        Returns:
+            dict[str, bool]: True for every updated client, False if the
+                client was not found or its update failed.
+        """
+        results = {email: False for email in clients_new_time}
+
+        # The clients are written back whole, start from fresh snapshots:
+        nodes = [self.node] if self.node else node_pool.nodes
+        snapshots = await asyncio.gather(
+            *[node.inbound_cache.get(force_refresh=True) for node in nodes],
+            return_exceptions=True,
+        )
+        for node, snapshot in zip(nodes, snapshots):
+            if isinstance(snapshot, Exception):
+                logger.error(
+                    f"BAD TRY TO GET INBOUNDS OF NODE {node.name}: {snapshot}"
+                )
+
+        now_ms = int(datetime.now().timestamp() * 1000)
+
+        async def update_client(node: XuiNode, inbound: Inbound, client):
+            expiry_time = int(
+                clients_new_time[client.email].timestamp() * 1000
+            )
+            new_client = client.model_copy(
+                update={
+                    "inbound_id": inbound.id,
+                    "flow": self.flow,
+                    # Expired clients stay disabled by the expiry job:
+                    "enable": expiry_time > now_ms,
+                    "expiry_time": expiry_time,
+                }
+            )
+            try:
+                await node.session.call(
+                    node.api.client.update, new_client.id, new_client
+                )
+                node.inbound_cache.update_client(inbound.id, new_client)
+                results[client.email] = True
+            except Exception as e:
+                logger.error(
+                    f'BAD TRY TO UPDATE CLIENT "{client.email}" '
+                    f"OF NODE {node.name}: {e}"
+                )
+
+        updates = []
+        for email in clients_new_time:
+            for node, snapshot in zip(nodes, snapshots):
+                if isinstance(snapshot, Exception):
+                    continue
+                inbound, client = snapshot.get_client(email)
+                if client:
+                    updates.append(update_client(node, inbound, client))
+                    break
+            else:
+                logger.warning(f'Client: "{email}" not found! Skipped!')
+
+        await asyncio.gather(*updates)
+        return results
+
     async def delete_client(self, client_email: str) -> str:
         """
         Delete a client by their email.
@@ -314,16 +598,19 @@ class VlessClientApi:
             str: None if successful, otherwise raises an exception.
         """
         try:
-            await vless_api.login()
-            client = await vless_api.client.get_by_email(client_email)
+            node = await self._get_node(client_email)
+            snapshot = await node.inbound_cache.get()
+            client = snapshot.by_email.get(client_email)
             if client:
-                client_inbound = await vless_api.client.get_by_email(
-                    client_email
+                await node.session.call(
+                    node.api.client.delete,
+                    client.inbound_id,
+                    client.uuid,
                 )
-                client_id = await self.get_client_uuid_by_email(client_email)
-                await vless_api.client.delete(
-                    client_inbound.inbound_id, client_id
+                node.inbound_cache.delete_client(
+                    client.inbound_id, client.uuid
                 )
+            node_pool.forget(client_email)
         except Exception as e:
             raise e
 
@@ -337,43 +624,73 @@ class VlessClientApi:
         Returns:
             str: The VLESS connection link.
         """
-        await vless_api.login()
-
-        vless_link = ""
-        client = await vless_api.client.get_by_email(email)
+        node = await self._get_node(email)
+        snapshot = await node.inbound_cache.get()
+        inbound, client = snapshot.get_client(email)
         if client:
-            inbound = await vless_api.inbound.get_by_id(client.inbound_id)
-            if inbound:
-                for client in inbound.settings.clients:
-                    if client.email == email:
-                        cl_id = client.id
-                        cl_email = client.email
-                        cl_flow = client.flow
-                        ib_port = inbound.port
-                        ib_remark = inbound.remark
-                        ib_network = inbound.stream_settings.network
-                        ib_sec = inbound.stream_settings.security
-                        ib_snif = inbound.stream_settings.reality_settings[
-                            "serverNames"
-                        ][0]
-                        ib_sid = inbound.stream_settings.reality_settings[
-                            "shortIds"
-                        ][0]
-                        ib_pbk = inbound.stream_settings.reality_settings[
-                            "settings"
-                        ]["publicKey"]
-                        ib_fp = inbound.stream_settings.reality_settings[
-                            "settings"
-                        ]["fingerprint"]
-                        ib_spx = inbound.stream_settings.reality_settings[
-                            "settings"
-                        ]["spiderX"]
-                        serv_host = vless_api.server.host.split("//")[1].split(
-                            ":"
-                        )[0]
-
-                        vless_link = (
-                            f"vless://{cl_id}@{serv_host}:{ib_port}?type={ib_network}&security={ib_sec}&pbk={ib_pbk}&"
-                            f"fp={ib_fp}&sni={ib_snif}&sid={ib_sid}&spx={ib_spx}&flow={cl_flow}#{ib_remark}-{cl_email}"
-                        )
-            return vless_link
+            return node.link_renderer.render(inbound, client)
+        return ""
+
+    async def get_vless_client_links(
+        self, force_refresh: bool = False
+    ) -> dict[str, str]:
+        """
+        Generate VLESS connection links for all clients of the panels.
+
+        Args:
+            force_refresh (bool): Bypass the inbound cache (default: False).
+
+        Returns:
+            dict[str, str]: VLESS connection links by client email.
+        """
+        nodes = [self.node] if self.node else node_pool.nodes
+        snapshots = await asyncio.gather(
+            *[
+                node.inbound_cache.get(force_refresh=force_refresh)
+                for node in nodes
+            ]
+        )
+        links = {}
+        for node, snapshot in zip(nodes, snapshots):
+            for inbound in snapshot.inbounds:
+                links.update(node.link_renderer.render_inbound(inbound))
+        return links
+
+    async def get_vless_client_links_and_expiry(
+        self, force_refresh: bool = False
+    ) -> dict[str, tuple[str, datetime]]:
+        """
+        Get the VLESS links and expiration times of all clients of the
+        panels: one inbound list fetch per node and one database query for
+        the configs not located yet.
+
+        Args:
+            force_refresh (bool): Bypass the inbound cache (default: False).
+
+        Returns:
+            dict[str, tuple[str, datetime]]: (link, expiration time) by
+                client email, a config is taken from its own node only.
+        """
+        nodes = node_pool.nodes
+        snapshots = await asyncio.gather(
+            *[
+                node.inbound_cache.get(force_refresh=force_refresh)
+                for node in nodes
+            ]
+        )
+        config_nodes = await node_pool.locate_many(
+            [email for snapshot in snapshots for email in snapshot.by_email]
+        )
+        result = {}
+        for node, snapshot in zip(nodes, snapshots):
+            for inbound in snapshot.inbounds:
+                links = node.link_renderer.render_inbound(inbound)
+                for email, link in links.items():
+                    if config_nodes[email] is not node:
+                        continue
+                    client = snapshot.by_email[email]
+                    result[email] = (
+                        link,
+                        datetime.fromtimestamp(client.expiry_time / 1000),
+                    )
+        return result
@@ -1,7 +1,20 @@
-from pydantic import Field
+from typing import Literal
+
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class XuiNodeSettings(BaseModel):
+    """An additional 3x-ui panel (node) of the XUI_NODES list."""
+
+    name: str
+    host: str
+    user: str
+    password: str
+    vless_port: int
+    max_used_ports: int = 1000
+
+
 class Settings(BaseSettings):
 
     DEBUG_MODE: bool
@@ -21,6 +34,11 @@ class Settings(BaseSettings):
     DB_WG_PASS: str = "wiregram"
 
     DB_DEFAULT_SCHEMA_NAME: str = "wiregram"
+    DB_USER_CACHE_SIZE: int = 10000
+    DB_USER_CACHE_TTL_SEC: int = 300
+    DB_ADMIN_CACHE_TTL_SEC: int = 60
+    DB_ACCESS_CACHE_TTL_SEC: int = 300
+    DB_ADMIN_LISTEN: bool = False
 
     XUI_HOST: str
     XUI_USER: str
@@ -31,6 +49,33 @@ class Settings(BaseSettings):
     XUI_VLESS_REMARK: str = "vless_main"
     XUI_VLESS_PORT: int = 4000
     XUI_MAX_USED_PORTS: int = 1000
+    XUI_INBOUND_CACHE_TTL_SEC: int = 30
+    XUI_MAX_CONCURRENT_REQUESTS: int = 4
+    XUI_REQUEST_TIMEOUT_SEC: float = 10
+    XUI_READ_RETRIES: int = 2
+    XUI_BREAKER_FAILURE_THRESHOLD: int = 5
+    XUI_BREAKER_COOLDOWN_SEC: float = 30
+    XUI_TRAFFIC_POLL_SEC: int = 300
+    XUI_TRAFFIC_RAW_RETENTION_DAYS: int = 90
+    XUI_EXPIRY_POLL_SEC: int = 300
+    XUI_EXPIRY_PRUNE_AFTER_DAYS: int = 0
+    XUI_REALITY_KEY_POOL_SIZE: int = 20
+    XUI_NODE_NAME: str = "main"
+    XUI_NODES: list[XuiNodeSettings] = []
+    XUI_INBOUND_MODE: Literal["per_user", "shared"] = "per_user"
+    XUI_SHARED_INBOUND_MAX_CLIENTS: int = 500
+
+    SUB_ENABLED: bool = False
+    SUB_URL: str = ""
+    SUB_SECRET: str = ""
+    SUB_HOST: str = "0.0.0.0"
+    SUB_PORT: int = 8080
+    SUB_CACHE_SIZE: int = 10000
+    SUB_CACHE_TTL_SEC: int = 60
+    SUB_UPDATE_INTERVAL_HOURS: int = 12
+
+    QR_CACHE_DIR: str = "./qr_cache"
+    QR_RENDER_WORKERS: int = 1
 
     BOT_ACCESS_EXPIRED_DELTA_DAYS: int = 365
     CONF_PAY_EXPIRED_DELTA_DAYS: int = 30
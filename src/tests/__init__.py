@@ -0,0 +1,7 @@
+import os
+
+# The database tests run in a scratch schema of the bot database, it must
+# be set before modules.db is imported:
+os.environ["DB_DEFAULT_SCHEMA_NAME"] = os.environ.get(
+    "TEST_DB_SCHEMA", "wiregram_test"
+)
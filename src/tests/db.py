@@ -0,0 +1,90 @@
+import logging
+import unittest
+
+from sqlalchemy import event, text
+
+from modules.db import DbManager
+from modules.db.manager import dbs
+from modules.db.models import Base
+
+for name in ("modules.db.manager", "sqlalchemy.engine"):
+    logging.getLogger(name).setLevel(logging.WARNING)
+for engine in (
+    dbs.admin_sync_engine,
+    dbs.admin_async_engine,
+    dbs.async_engine,
+):
+    engine.echo = False
+
+
+def create_schema():
+    """
+    Create the scratch schema with the bot tables and migrations, skip the
+    tests of the module if the database is not available.
+    """
+    if not DbManager.check_db_available():
+        raise unittest.SkipTest("the database is not available")
+    schema = dbs.DEFAULT_SCHEMA_NAME
+    drop_schema()
+    with dbs.admin_session_factory() as session:
+        session.execute(text(f"CREATE SCHEMA {schema}"))
+        session.commit()
+    Base.metadata.create_all(dbs.admin_sync_engine)
+    DbManager._db_migrate()
+    with dbs.admin_session_factory() as session:
+        session.execute(text(f"""
+                GRANT ALL PRIVILEGES ON SCHEMA {schema} TO {dbs.WG_USER};
+                GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA {schema}
+                    TO {dbs.WG_USER};
+                """))
+        session.commit()
+
+
+def drop_schema():
+    with dbs.admin_session_factory() as session:
+        session.execute(
+            text(f"DROP SCHEMA IF EXISTS {dbs.DEFAULT_SCHEMA_NAME} CASCADE")
+        )
+        session.commit()
+
+
+class StatementCounter:
+    """Counts the statements sent by the bot engine inside the block."""
+
+    def __init__(self):
+        self.statements: list[str] = []
+        self.parameters: list = []
+
+    def _count(self, conn, cursor, statement, parameters, *args):
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+    def __enter__(self):
+        event.listen(
+            dbs.async_engine.sync_engine, "before_cursor_execute", self._count
+        )
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(
+            dbs.async_engine.sync_engine, "before_cursor_execute", self._count
+        )
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+
+class DbTestCase(unittest.IsolatedAsyncioTestCase):
+    """A test of the scratch schema, caches start empty."""
+
+    def setUp(self):
+        for cache in (
+            DbManager.user_cache,
+            DbManager.access_cache,
+            DbManager.admin_roster,
+        ):
+            cache.clear()
+
+    async def asyncTearDown(self):
+        # Pooled connections belong to the event loop of the test:
+        await dbs.async_engine.dispose()
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+from bench.orders import TG_ID_BASE, seed
+from modules.db import DbManager
+from modules.db.manager import dbs
+from tests.db import DbTestCase, StatementCounter, create_schema, drop_schema
+
+N_USERS = 2000
+N_CONFIGS = 4000
+ORDERS_PER_CONFIG = 10
+N_PAYED = 20
+
+USER_TG_ID = TG_ID_BASE + 1
+# Config 1 of user 1 has a payed order, config N_USERS + 1 has not (the
+# calls that write do it on a config without one):
+CONFIG_NAME = f"vless_{USER_TG_ID}_1"
+CLOSED_CONFIG_NAME = f"vless_{USER_TG_ID}_{N_USERS + 1}"
+
+
+def setUpModule():
+    create_schema()
+    seed(dbs, N_USERS, N_CONFIGS, ORDERS_PER_CONFIG, N_PAYED)
+
+
+def tearDownModule():
+    drop_schema()
+
+
+class HotLookupIndexTest(DbTestCase):
+    """The hot DbManager lookups are served by the migration indexes."""
+
+    async def assertIndexes(self, indexes: set[str], coro):
+        """Explain every statement of the call, no execution is repeated."""
+        with StatementCounter() as counter:
+            await coro
+        used = set()
+        async with dbs.async_engine.connect() as conn:
+            for statement, parameters in zip(
+                counter.statements, counter.parameters
+            ):
+                res = await conn.exec_driver_sql(
+                    "EXPLAIN (FORMAT JSON) " + statement, parameters
+                )
+                used |= set(self.plan_indexes(res.scalar()[0]["Plan"]))
+            await conn.rollback()
+        self.assertLessEqual(indexes, used, counter.statements)
+
+    @classmethod
+    def plan_indexes(cls, plan: dict):
+        if "Index Name" in plan:
+            yield plan["Index Name"]
+        for subplan in plan.get("Plans", []):
+            yield from cls.plan_indexes(subplan)
+
+    async def test_get_order(self):
+        await self.assertIndexes(
+            {"ix_user_order_config_status", "ix_user_service_config_name"},
+            DbManager.get_order(USER_TG_ID, CONFIG_NAME),
+        )
+
+    async def test_get_payed_orders(self):
+        await self.assertIndexes(
+            {"ix_user_order_payed"}, DbManager.get_payed_orders()
+        )
+
+    async def test_get_oders_hist(self):
+        await self.assertIndexes(
+            {"ix_user_order_user_updated"},
+            DbManager.get_oders_hist(USER_TG_ID),
+        )
+
+    async def test_get_service_config(self):
+        await self.assertIndexes(
+            {"ix_user_service_config_name"},
+            DbManager.get_service_config(USER_TG_ID, CONFIG_NAME),
+        )
+
+    async def test_update_order_status(self):
+        await self.assertIndexes(
+            {"ix_user_order_config_status"},
+            DbManager.update_order_status(
+                USER_TG_ID, CLOSED_CONFIG_NAME, "NEW", "PAYED"
+            ),
+        )
+
+    async def test_close_payed_order(self):
+        await self.assertIndexes(
+            {"ix_user_order_payed"},
+            DbManager.close_payed_order(USER_TG_ID, CLOSED_CONFIG_NAME),
+        )
+
+    async def test_get_expired_service_configs(self):
+        now = datetime.now()
+        await self.assertIndexes(
+            {"ix_user_service_config_valid_to"},
+            DbManager.get_expired_service_configs(now - timedelta(1), now),
+        )
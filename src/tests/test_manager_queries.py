@@ -0,0 +1,152 @@
+import uuid
+
+from modules.db import DbManager, ReturnCode
+from modules.db.models import UserStruct
+from tests.db import DbTestCase, StatementCounter, create_schema, drop_schema
+
+USER_TG_ID = 190000001
+ACCESS_NAME = "BOT"
+CONFIG_NAME = "vless_190000001_1"
+
+
+def setUpModule():
+    create_schema()
+
+
+def tearDownModule():
+    drop_schema()
+
+
+class DbManagerQueryCountTest(DbTestCase):
+    """Every DbManager call is a single round-trip to the database."""
+
+    async def asyncSetUp(self):
+        if await DbManager.get_user(USER_TG_ID) is None:
+            await DbManager.add_user(
+                UserStruct(
+                    user_tg_id=USER_TG_ID, user_name="test", user_tag="test"
+                )
+            )
+
+    async def asyncTearDown(self):
+        await DbManager.delete_service_config(USER_TG_ID, CONFIG_NAME)
+        await DbManager.delete_access(USER_TG_ID, ACCESS_NAME)
+        await super().asyncTearDown()
+
+    async def assertStatements(self, expected: int, coro):
+        with StatementCounter() as counter:
+            result = await coro
+        self.assertEqual(len(counter), expected, counter.statements)
+        return result
+
+    async def add_config(self):
+        return await DbManager.add_service_config(
+            USER_TG_ID, uuid.uuid4(), CONFIG_NAME, 150
+        )
+
+    async def test_access(self):
+        self.assertEqual(
+            await self.assertStatements(
+                1, DbManager.add_access_request(USER_TG_ID, ACCESS_NAME)
+            ),
+            ReturnCode.SUCCESS,
+        )
+        self.assertEqual(
+            await self.assertStatements(
+                1, DbManager.add_access(USER_TG_ID, ACCESS_NAME, 10)
+            ),
+            ReturnCode.SUCCESS,
+        )
+        # An access is renewed on a new request:
+        await DbManager.add_access_request(USER_TG_ID, ACCESS_NAME)
+        self.assertEqual(
+            await self.assertStatements(
+                1, DbManager.update_access(USER_TG_ID, ACCESS_NAME, 20)
+            ),
+            ReturnCode.SUCCESS,
+        )
+        self.assertEqual(
+            await self.assertStatements(
+                1, DbManager.block_access(USER_TG_ID, ACCESS_NAME)
+            ),
+            ReturnCode.SUCCESS,
+        )
+        self.assertEqual(
+            await self.assertStatements(
+                1, DbManager.delete_access(USER_TG_ID, ACCESS_NAME)
+            ),
+            ReturnCode.SUCCESS,
+        )
+
+    async def test_access_of_unknown_user(self):
+        self.assertNotEqual(
+            await self.assertStatements(
+                1, DbManager.add_access_request(1, ACCESS_NAME)
+            ),
+            ReturnCode.SUCCESS,
+        )
+
+    async def test_service_config(self):
+        self.assertEqual(
+            await self.assertStatements(1, self.add_config()),
+            ReturnCode.SUCCESS,
+        )
+        config = await self.assertStatements(
+            1, DbManager.get_service_config(USER_TG_ID, CONFIG_NAME)
+        )
+        self.assertEqual(config.config_name, CONFIG_NAME)
+        self.assertEqual(
+            await self.assertStatements(
+                1,
+                DbManager.update_service_config(
+                    USER_TG_ID, CONFIG_NAME, config_price=200
+                ),
+            ),
+            ReturnCode.SUCCESS,
+        )
+        self.assertEqual(
+            await self.assertStatements(
+                1, DbManager.delete_service_config(USER_TG_ID, CONFIG_NAME)
+            ),
+            ReturnCode.SUCCESS,
+        )
+
+    async def test_orders(self):
+        await self.add_config()
+        self.assertEqual(
+            await self.assertStatements(
+                1, DbManager.add_order(USER_TG_ID, CONFIG_NAME)
+            ),
+            ReturnCode.SUCCESS,
+        )
+        order = await self.assertStatements(
+            1, DbManager.get_order(USER_TG_ID, CONFIG_NAME)
+        )
+        self.assertEqual(order.order_data["config_name"], CONFIG_NAME)
+        self.assertEqual(
+            await self.assertStatements(
+                1,
+                DbManager.update_order_status(
+                    USER_TG_ID, CONFIG_NAME, "NEW", "PAYED"
+                ),
+            ),
+            ReturnCode.SUCCESS,
+        )
+        orders = await self.assertStatements(
+            1, DbManager.get_orders(USER_TG_ID)
+        )
+        self.assertEqual(len(orders), 1)
+        await self.assertStatements(1, DbManager.get_oders_hist(USER_TG_ID))
+        self.assertEqual(
+            await self.assertStatements(
+                1, DbManager.close_payed_order(USER_TG_ID, CONFIG_NAME)
+            ),
+            ReturnCode.SUCCESS,
+        )
+        await DbManager.add_order(USER_TG_ID, CONFIG_NAME)
+        self.assertEqual(
+            await self.assertStatements(
+                1, DbManager.delete_order(USER_TG_ID, CONFIG_NAME, "NEW")
+            ),
+            ReturnCode.SUCCESS,
+        )
@@ -0,0 +1,63 @@
+import asyncio
+
+from modules.db import DbManager
+from modules.xui.ports import VlessPortAllocator
+from tests.db import DbTestCase, create_schema, drop_schema
+
+FIRST_PORT = 40000
+LAST_PORT = 40149
+PARALLEL = 100
+
+
+def setUpModule():
+    create_schema()
+
+
+def tearDownModule():
+    drop_schema()
+
+
+class VlessPortAllocatorTest(DbTestCase):
+    async def asyncSetUp(self):
+        self.allocator = VlessPortAllocator(None, FIRST_PORT, LAST_PORT)
+        await DbManager.init_vless_ports(FIRST_PORT, LAST_PORT)
+
+    async def asyncTearDown(self):
+        await asyncio.gather(
+            *[
+                self.allocator.release(f"vless_stress_{i}")
+                for i in range(PARALLEL)
+            ]
+        )
+        await super().asyncTearDown()
+
+    async def test_parallel_reservations_get_distinct_ports(self):
+        ports = await asyncio.gather(
+            *[
+                self.allocator.reserve(f"vless_stress_{i}")
+                for i in range(PARALLEL)
+            ]
+        )
+        self.assertEqual(len(set(ports)), PARALLEL)
+        self.assertTrue(all(self.allocator.owns(port) for port in ports))
+        self.assertEqual(
+            await self.allocator.count_free(),
+            LAST_PORT - FIRST_PORT + 1 - PARALLEL,
+        )
+
+    async def test_parallel_reservations_of_one_inbound_share_a_port(self):
+        ports = await asyncio.gather(
+            *[
+                self.allocator.reserve("vless_stress_0")
+                for _ in range(PARALLEL)
+            ]
+        )
+        self.assertEqual(len(set(ports)), 1)
+        self.assertEqual(
+            await self.allocator.count_free(), LAST_PORT - FIRST_PORT
+        )
+
+    async def test_released_port_is_free_again(self):
+        port = await self.allocator.reserve("vless_stress_0")
+        await self.allocator.release("vless_stress_0")
+        self.assertEqual(await self.allocator.reserve("vless_stress_1"), port)